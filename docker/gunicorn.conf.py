@@ -0,0 +1,24 @@
+"""
+Configuration gunicorn du service Lending Management
+
+Les options de ligne de commande de docker/supervisord.conf restent
+prioritaires ; ce fichier ne porte que les hooks des métriques Prometheus
+multi-processus (voir lending/metrics.py).
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    """Vide le répertoire des métriques : les fichiers d'une exécution précédente fausseraient les compteurs"""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Retire les jauges d'un worker arrêté (max-requests, timeout…)"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
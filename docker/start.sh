@@ -26,6 +26,10 @@ python manage.py collectstatic --noinput --clear
 echo "🔄 Application des migrations Django..."
 python manage.py migrate --noinput
 
+# Statistiques des prêts : calculées au premier démarrage, tenues à jour ensuite
+echo "📊 Initialisation des statistiques des prêts..."
+python manage.py rebuild_lending_stats --if-empty
+
 # Démarrer supervisor
 echo "▶️  Démarrage de Supervisor (Nginx + Gunicorn)..."
 exec /usr/bin/supervisord -c /etc/supervisor/conf.d/supervisord.conf
\ No newline at end of file
@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 class LendingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lending'
+
+    def ready(self):
+        from .metrics import install_query_observer
+        # Durée et nombre des requêtes SQL, sur toutes les connexions du processus
+        connection_created.connect(install_query_observer, dispatch_uid='lending_query_metrics')
@@ -0,0 +1,203 @@
+"""
+Clients asynchrones des microservices, pour les vues servies en ASGI
+
+Ils partagent la configuration des pools et les caches des clients
+synchrones de services.py : un livre ou un utilisateur mis en cache par
+l'un des deux chemins profite à l'autre.
+"""
+import asyncio
+import contextlib
+import logging
+import time
+import weakref
+from typing import Any, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+from .metrics import observe_dependency_call, record_circuit_open
+from .resilience import get_resilience
+from .services import (
+    DEFAULT_HTTP_POOL_CONFIG, CircuitOpenError, ServiceUnavailableError, book_service, user_service,
+)
+
+logger = logging.getLogger(__name__)
+
+# Boucles d'événements des serveurs ASGI, qui vivent aussi longtemps que le worker
+_persistent_loops = weakref.WeakSet()
+
+
+def register_persistent_loop():
+    """Déclare la boucle courante comme boucle durable d'un serveur ASGI (projet/asgi.py)"""
+    _persistent_loops.add(asyncio.get_running_loop())
+
+
+class AsyncMicroserviceClient:
+    """Client asynchrone de base pour communiquer avec les microservices"""
+
+    service_name = 'default'
+
+    def __init__(self, base_url: str, timeout: Optional[float] = None):
+        self.base_url = base_url.rstrip('/')
+        # Même disjoncteur et même budget de tentatives que le client synchrone du service
+        self.resilience = get_resilience(self.service_name)
+        self.timeout = timeout if timeout is not None else self.resilience.timeout
+        self.connect_timeout = min(self.resilience.connect_timeout, self.timeout)
+        self._client = None
+        self._client_loop = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        """Client HTTP configuré avec le pool du service (MICROSERVICE_HTTP_POOLS)"""
+        pools = getattr(settings, 'MICROSERVICE_HTTP_POOLS', {})
+        config = {**DEFAULT_HTTP_POOL_CONFIG, **pools.get(self.service_name, {})}
+        limits = httpx.Limits(
+            max_connections=config['POOL_MAXSIZE'],
+            max_keepalive_connections=config['POOL_MAXSIZE'] if config['KEEP_ALIVE'] else 0,
+        )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=limits,
+            headers={'Content-Type': 'application/json'},
+        )
+
+    @contextlib.asynccontextmanager
+    async def _client_session(self):
+        """
+        Client HTTP pour un appel
+
+        Sur la boucle d'un serveur ASGI (register_persistent_loop), le client
+        keep-alive est créé une fois et réutilisé par toutes les requêtes du
+        worker. Ailleurs (vue asynchrone servie en WSGI via async_to_sync), la
+        boucle disparaît après la requête : le client est ouvert pour l'appel
+        et fermé à sa fin, sur la boucle qui possède ses connexions.
+        """
+        loop = asyncio.get_running_loop()
+        if loop not in _persistent_loops:
+            async with self._build_client() as client:
+                yield client
+            return
+        if self._client is None or self._client_loop is not loop:
+            self._client = self._build_client()
+            self._client_loop = loop
+        yield self._client
+
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None,
+                            params: Optional[Dict] = None, raise_unavailable: bool = False) -> Optional[Dict[str, Any]]:
+        """Effectue une requête HTTP vers le microservice (mêmes règles que MicroserviceClient)"""
+        url = f"{self.base_url}{endpoint}"
+        self.resilience.retry_budget.record_request()
+        async with self._client_session() as client:
+            return await self._send(client, url, method, endpoint, data, params, raise_unavailable)
+
+    async def _send(self, client: httpx.AsyncClient, url: str, method: str, endpoint: str, data: Optional[Dict],
+                    params: Optional[Dict], raise_unavailable: bool) -> Optional[Dict[str, Any]]:
+        """Tentatives successives d'une requête, avec le disjoncteur et le budget de tentatives du service"""
+        breaker = self.resilience.breaker
+        attempt = 0
+
+        while True:
+            attempt += 1
+            if not breaker.allow_request():
+                logger.warning(f"Disjoncteur ouvert, requête vers {url} non tentée")
+                record_circuit_open(self.service_name, method, endpoint)
+                if raise_unavailable:
+                    raise CircuitOpenError(url)
+                return None
+
+            started = time.monotonic()
+            try:
+                response = await client.request(method, endpoint, json=data, params=params)
+                response.raise_for_status()
+                result = response.json() if response.content else None
+            except asyncio.CancelledError:
+                # Délai global des vérifications dépassé : l'appel compte comme un échec
+                self._record_attempt(method, endpoint, started, 'cancelled')
+                raise
+            except httpx.TimeoutException:
+                logger.error(f"Timeout lors de la requête vers {url}")
+                outcome = 'timeout'
+            except httpx.TransportError:
+                logger.error(f"Erreur de connexion vers {url}")
+                outcome = 'connection_error'
+            except httpx.HTTPStatusError as e:
+                logger.error(f"Erreur HTTP {e.response.status_code} vers {url}: {e.response.text}")
+                if e.response.status_code < 500:
+                    self._record_attempt(method, endpoint, started, 'client_error')
+                    return None
+                outcome = 'server_error'
+            except Exception as e:
+                logger.error(f"Erreur inattendue lors de la requête vers {url}: {str(e)}")
+                self._record_attempt(method, endpoint, started, 'error')
+                return None
+            else:
+                self._record_attempt(method, endpoint, started, 'success')
+                return result
+
+            self._record_attempt(method, endpoint, started, outcome)
+            delay = self.resilience.retry_delay(method, attempt)
+            if delay is None:
+                if raise_unavailable:
+                    raise ServiceUnavailableError(url)
+                return None
+            await asyncio.sleep(delay)
+
+    def _record_attempt(self, method: str, endpoint: str, started: float, outcome: str):
+        """Résultat d'une tentative : disjoncteur du service et métriques Prometheus"""
+        latency = time.monotonic() - started
+        if outcome in ('success', 'client_error'):
+            self.resilience.breaker.record_success(latency)
+        else:
+            self.resilience.breaker.record_failure(latency)
+        observe_dependency_call(self.service_name, method, endpoint, latency, outcome)
+
+
+class AsyncBookManagementService(AsyncMicroserviceClient):
+    """Service asynchrone pour communiquer avec le microservice Book Management"""
+
+    service_name = 'book'
+
+    def __init__(self, sync_service=book_service):
+        super().__init__(sync_service.base_url, sync_service.timeout)
+        self.details_cache = sync_service.details_cache
+
+    async def get_book_details(self, book_id: int, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        """Récupère les détails d'un livre (mêmes règles que BookManagementService.get_book_details)"""
+        details = self.details_cache.get(book_id, request_only=fresh)
+        if details is None:
+            details = await self._make_request('GET', f'/getBooks/{book_id}')
+            self.details_cache.set(book_id, details)
+        return details
+
+    async def check_book_availability(self, book_id: int) -> bool:
+        """Vérifie si un livre est disponible pour emprunt (jamais depuis le cache du processus)"""
+        book_details = await self.get_book_details(book_id, fresh=True)
+        if book_details:
+            return book_details.get('available', False)
+        return False
+
+
+class AsyncUserManagementService(AsyncMicroserviceClient):
+    """Service asynchrone pour communiquer avec le microservice User Management"""
+
+    service_name = 'user'
+
+    def __init__(self, sync_service=user_service):
+        super().__init__(sync_service.base_url, sync_service.timeout)
+        self.sync_service = sync_service
+
+    async def verify_user(self, user_email: str) -> bool:
+        """Vérifie si l'utilisateur existe et est actif (même cache que le client synchrone)"""
+        decision, entry = self.sync_service.cached_verification(user_email)
+        if decision is not None:
+            return decision
+        try:
+            user_details = await self._make_request('GET', f'/users/{user_email}', raise_unavailable=True)
+        except ServiceUnavailableError:
+            return self.sync_service.unavailable_decision(user_email, entry)
+        return self.sync_service.store_verification(user_email, user_details)['active']
+
+
+# Instances globales des services asynchrones
+async_book_service = AsyncBookManagementService()
+async_user_service = AsyncUserManagementService()
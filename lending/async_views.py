@@ -0,0 +1,162 @@
+"""
+Vues asynchrones du service Lending Management
+
+Mêmes contrats que les vues de views.py, servies sous /api/async/. En ASGI
+(projet.asgi), un worker traite des centaines de requêtes en attente des
+microservices au lieu d'une seule ; les vues synchrones restent disponibles
+pour comparaison.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+
+from .checks import arun_lend_checks, lend_conflicts, LEND_CHECK_ERRORS
+from .export import export_queryset, export_response, iter_export
+from .idempotency import idempotent
+from .models import Lending
+from .operations import create_lending, return_lending
+from .pagination import KeysetPagination, InvalidCursor
+from .serializers import (
+    LendingSerializer, LendingRowSerializer, LendBookSerializer, ReturnBookSerializer, LendingExportQuerySerializer,
+)
+from .streaming import aiter_in_thread, astream_queryset, STREAM_FORMATS
+from .timing import phase
+from .utils import conditional_on_lendings, handle_api_errors, json_response
+from .views import EXPIRED_BOOKS_ORDERING
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_json(request):
+    """Décode le corps JSON ; retourne (données, réponse d'erreur)"""
+    try:
+        return json.loads(request.body or b'{}'), None
+    except ValueError as e:
+        return None, json_response({'detail': f'JSON parse error - {str(e)}'}, status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_POST
+@idempotent
+@handle_api_errors("la création du prêt")
+async def lend_book_async(request):
+    """Endpoint asynchrone pour emprunter un livre - /async/lendBook"""
+    data, error = _parse_json(request)
+    if error:
+        return error
+    serializer = LendBookSerializer(data=data)
+
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    user_email = serializer.validated_data['user_email']
+    book_id = serializer.validated_data['book_id']
+
+    # Vérifications concurrentes sur la boucle d'événements
+    checks = await arun_lend_checks(user_email, book_id)
+
+    if checks['failed']:
+        message, status_code = LEND_CHECK_ERRORS[checks['failed']]
+        return json_response({'error': message}, status_code)
+
+    # La transaction reste synchrone, exécutée hors de la boucle
+    lending = await sync_to_async(create_lending)(user_email, book_id)
+    if lending is None:
+        failures = await sync_to_async(lend_conflicts)(user_email, [book_id])
+        message, status_code = LEND_CHECK_ERRORS[failures[book_id]]
+        return json_response({'error': message}, status_code)
+
+    with phase('serialize'):
+        data = LendingSerializer(lending).data
+    return json_response(data, status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_POST
+@idempotent
+@handle_api_errors("le retour du livre")
+async def return_book_async(request):
+    """Endpoint asynchrone pour retourner un livre - /async/returnBook"""
+    data, error = _parse_json(request)
+    if error:
+        return error
+    serializer = ReturnBookSerializer(data=data)
+
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    user_email = serializer.validated_data['user_email']
+    book_id = serializer.validated_data['book_id']
+
+    # Un seul UPDATE conditionnel, exécuté hors de la boucle
+    lending = await sync_to_async(return_lending)(user_email, book_id)
+
+    if not lending:
+        return json_response(
+            {'error': 'Aucun prêt actif trouvé pour ce livre et cet utilisateur'},
+            status.HTTP_404_NOT_FOUND
+        )
+
+    with phase('serialize'):
+        data = LendingSerializer(lending).data
+    return json_response(data, status.HTTP_200_OK)
+
+
+@require_GET
+@handle_api_errors("la récupération des livres expirés")
+@conditional_on_lendings
+async def get_expired_books_async(request):
+    """Endpoint asynchrone pour récupérer les livres expirés - /async/getExpiredBooks (même réponse que get_expired_books)"""
+    # Lecture seule : le passage en OVERDUE est fait par la commande sweep_overdue_lendings
+    expired_lendings = Lending.objects.filter(
+        date_due__lt=timezone.now(), status='OVERDUE'
+    ).values_list(*LendingRowSerializer.fields)
+    serializer = LendingRowSerializer()
+
+    stream_format = request.GET.get('stream')
+    if stream_format:
+        if stream_format not in STREAM_FORMATS:
+            return json_response({'error': 'Format de streaming invalide'}, status.HTTP_400_BAD_REQUEST)
+        return astream_queryset(
+            expired_lendings.order_by(*EXPIRED_BOOKS_ORDERING),
+            serializer.to_representation,
+            stream_format
+        )
+
+    try:
+        paginator = KeysetPagination(EXPIRED_BOOKS_ORDERING, request.GET)
+        lendings = [row async for row in paginator.paginate_queryset(expired_lendings)]
+    except InvalidCursor as e:
+        return json_response({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    with phase('serialize'):
+        rows = serializer.serialize(lendings)
+    page, next_cursor = paginator.get_page(rows)
+    if paginator.page_size_requested:
+        return json_response(paginator.get_paginated_data(request, page, next_cursor), status.HTTP_200_OK)
+    response = json_response(page, status.HTTP_200_OK)
+    link = paginator.get_link_header(request, next_cursor)
+    if link:
+        response['Link'] = link
+    return response
+
+
+@require_GET
+@handle_api_errors("l'export des prêts")
+async def export_lendings_async(request):
+    """Endpoint asynchrone d'export de l'historique des prêts - /async/lendings/export"""
+    query = LendingExportQuerySerializer(data=request.GET)
+
+    if not query.is_valid():
+        return json_response(query.errors, status.HTTP_400_BAD_REQUEST)
+
+    params = query.validated_data
+    lendings = export_queryset(params.get('since'), params.get('until'), params.get('status'))
+    # Chaque paquet est lu et sérialisé dans le thread de la base, hors de la boucle
+    content = iter_export(lendings, params['stream'], params.get('fields'), params['after_id'], params.get('limit'))
+    return export_response(aiter_in_thread(content), params['stream'])
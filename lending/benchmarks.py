@@ -0,0 +1,231 @@
+"""
+Mesures de performance du service Lending Management
+
+Exécutées par la commande benchmark_lending. La sérialisation est mesurée
+sur des lignes construites en mémoire ; les requêtes ORM le sont sur la base
+configurée, peuplée par exemple avec la commande generate_lendings.
+"""
+import random
+import statistics
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from django.db import connection, router, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .checks import lend_conflicts
+from .models import Lending, LendingStatusCount
+from .operations import close_lendings
+from .pagination import KeysetPagination
+from .renderers import ORJSONRenderer
+from .serializers import LendingSerializer, LendingRowSerializer
+from .views import EXPIRED_BOOKS_ORDERING, USER_LENDINGS_ORDERING
+
+
+def make_lending_rows(count: int) -> Tuple[List[Lending], List[Tuple[Any, ...]]]:
+    """
+    Construit les mêmes prêts sous deux formes
+
+    Returns:
+        tuple: (instances Lending, tuples tels que renvoyés par .values_list())
+    """
+    now = timezone.now()
+    instances = []
+    for i in range(count):
+        borrowed = now - timedelta(days=90, seconds=i)
+        instances.append(Lending(
+            id=i + 1,
+            user_email=f'user{i % 5000}@example.com',
+            book_id=i % 20000 + 1,
+            date_borrowed=borrowed,
+            date_due=borrowed + timedelta(days=60),
+            date_returned=None if i % 3 else borrowed + timedelta(days=30, microseconds=i),
+            status='OVERDUE' if i % 3 else 'RETURNED',
+        ))
+    rows = [tuple(getattr(lending, name) for name in LendingRowSerializer.fields) for lending in instances]
+    return instances, rows
+
+
+def _measure(render: Callable[[], bytes], repeat: int) -> Tuple[float, bytes]:
+    """Meilleur temps sur `repeat` exécutions"""
+    best = float('inf')
+    body = b''
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = render()
+        best = min(best, time.perf_counter() - started)
+    return best, body
+
+
+def benchmark_serialization(count: int = 10000, repeat: int = 5) -> Dict[str, Any]:
+    """
+    Compare le débit (lignes/s) des chemins de sérialisation d'une liste de prêts
+
+    - drf : LendingSerializer(many=True) + JSONRenderer (chemin historique)
+    - rows : LendingRowSerializer + JSONRenderer
+    - rows_orjson : LendingRowSerializer + ORJSONRenderer (chemin des vues)
+
+    Returns:
+        dict: lignes/s par chemin, accélération et identité des octets produits
+    """
+    instances, rows = make_lending_rows(count)
+    paths = {
+        'drf': lambda: JSONRenderer().render(LendingSerializer(instances, many=True).data),
+        'rows': lambda: JSONRenderer().render(LendingRowSerializer().serialize(rows)),
+        'rows_orjson': lambda: ORJSONRenderer().render(LendingRowSerializer().serialize(rows)),
+    }
+    results = {}
+    bodies = {}
+    for name, render in paths.items():
+        elapsed, bodies[name] = _measure(render, repeat)
+        results[name] = {'seconds': round(elapsed, 4), 'rows_per_second': round(count / elapsed)}
+
+    return {
+        'rows': count,
+        'paths': results,
+        'speedup': round(results['drf']['seconds'] / results['rows_orjson']['seconds'], 1),
+        'identical_output': len(set(bodies.values())) == 1,
+    }
+
+
+def _time_calls(call: Callable[[Any], Any], params: Sequence[Any], repeat: int) -> Dict[str, Any]:
+    """Durée moyenne d'un appel (ms) pour chaque passage sur `params` : médiane et meilleur passage"""
+    passes = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for param in params:
+            call(param)
+        passes.append((time.perf_counter() - started) / len(params))
+    return {
+        'calls': len(params),
+        'median_ms': round(statistics.median(passes) * 1000, 4),
+        'best_ms': round(min(passes) * 1000, 4),
+    }
+
+
+def _sample_open_loans(samples: int, rng: random.Random) -> List[Tuple[str, int]]:
+    """(email, livre) de prêts ACTIVE tirés au hasard, via des bornes d'id indexées"""
+    active = Lending.objects.filter(status='ACTIVE')
+    bounds = active.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    pairs = []
+    for _ in range(samples):
+        pair = active.filter(id__gte=rng.randint(bounds['low'], bounds['high'])).order_by('id').values_list(
+            'user_email', 'book_id'
+        ).first()
+        pairs.append(pair or active.values_list('user_email', 'book_id').first())
+    return pairs
+
+
+def _expired_queryset(now):
+    """Requête de GET /getExpiredBooks"""
+    return Lending.objects.filter(date_due__lt=now, status='OVERDUE').values_list(*LendingRowSerializer.fields)
+
+
+def _rolled_back_close(using, filters, now):
+    """UPDATE de clôture de returnBook(s), annulé pour laisser la table intacte entre deux appels"""
+    with transaction.atomic(using=using):
+        close_lendings(using, filters, {'status': 'RETURNED', 'date_returned': now})
+        transaction.set_rollback(True, using=using)
+
+
+def benchmark_queries(repeat: int = 5, samples: int = 200, page_size: int = 100,
+                      seed: Optional[int] = 0) -> Dict[str, Any]:
+    """
+    Mesure les requêtes ORM des endpoints sur la table Lending actuelle
+
+    - expired_first_page / expired_deep_page : page keyset de getExpiredBooks,
+      au début puis au milieu des prêts en retard
+    - active_loan_hit / active_loan_miss : motif d'un emprunt refusé (lend_conflicts)
+    - return_update : UPDATE de clôture de returnBook, dans une transaction annulée
+    - user_books_lookup : prêts actifs d'un utilisateur parmi 10 livres (lendBooks)
+    - user_lendings_page : première page des prêts d'un utilisateur (lendings)
+    - bulk_return_update : UPDATE de clôture de 100 livres sans email (returnBooks),
+      dans une transaction annulée
+    - sweeper_batch : lot de 1000 prêts échus du sweeper
+    - status_counts : jauges ACTIVE/OVERDUE de /metrics (somme de LendingStatusCount)
+    - serialize_page : une page de getExpiredBooks sérialisée et rendue
+
+    Returns:
+        dict: taille de la table, répartition par statut et durée par requête
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    by_status = dict(Lending.objects.values_list('status').annotate(count=Count('id')).order_by())
+    pairs = _sample_open_loans(samples, rng)
+    using = router.db_for_write(Lending)
+    results = {}
+
+    expired = _expired_queryset(now)
+    first_page = KeysetPagination(EXPIRED_BOOKS_ORDERING, {'page_size': page_size})
+    results['expired_first_page'] = _time_calls(
+        lambda _: list(first_page.paginate_queryset(expired)), range(samples), repeat
+    )
+    overdue = by_status.get('OVERDUE', 0)
+    middle = expired.order_by(*EXPIRED_BOOKS_ORDERING).values_list(*EXPIRED_BOOKS_ORDERING)[overdue // 2:overdue // 2 + 1]
+    if middle:
+        cursor = KeysetPagination.encode_cursor(middle[0])
+        deep_page = KeysetPagination(EXPIRED_BOOKS_ORDERING, {'page_size': page_size, 'cursor': cursor})
+        results['expired_deep_page'] = _time_calls(
+            lambda _: list(deep_page.paginate_queryset(expired)), range(samples), repeat
+        )
+
+    if pairs:
+        misses = [(email, -book_id) for email, book_id in pairs]
+
+        def conflicts(pair):
+            return lend_conflicts(pair[0], [pair[1]])
+
+        results['active_loan_hit'] = _time_calls(conflicts, pairs, repeat)
+        results['active_loan_miss'] = _time_calls(conflicts, misses, repeat)
+        results['return_update'] = _time_calls(
+            lambda pair: _rolled_back_close(using, {'user_email': pair[0], 'book_id': pair[1], 'status': 'ACTIVE'}, now),
+            pairs, repeat,
+        )
+        book_ids = [book_id for _, book_id in pairs]
+        results['user_books_lookup'] = _time_calls(
+            lambda pair: list(Lending.objects.filter(
+                user_email=pair[0], book_id__in=[pair[1], *rng.sample(book_ids, min(9, len(book_ids)))],
+                status='ACTIVE',
+            ).values_list('book_id', flat=True)),
+            pairs, repeat,
+        )
+        results['user_lendings_page'] = _time_calls(
+            lambda pair: list(Lending.objects.filter(user_email=pair[0]).order_by(
+                *USER_LENDINGS_ORDERING).values_list(*LendingRowSerializer.fields)[:page_size + 1]),
+            pairs, repeat,
+        )
+        results['bulk_return_update'] = _time_calls(
+            lambda _: _rolled_back_close(
+                using, {'book_id': rng.sample(book_ids, min(100, len(book_ids))), 'status': 'ACTIVE'}, now
+            ),
+            range(max(samples // 10, 1)), repeat,
+        )
+
+    results['sweeper_batch'] = _time_calls(
+        lambda _: list(Lending.objects.filter(status='ACTIVE', date_due__lt=now).order_by(
+            'date_due', 'id').values_list('id', 'date_due')[:1000]),
+        range(max(samples // 10, 1)), repeat,
+    )
+    results['status_counts'] = _time_calls(
+        lambda _: dict(LendingStatusCount.objects.filter(status__in=('ACTIVE', 'OVERDUE')).values_list(
+            'status').annotate(total=Sum('count')).order_by()),
+        range(max(samples // 10, 1)), repeat,
+    )
+    serializer = LendingRowSerializer()
+    rows = list(first_page.paginate_queryset(expired))
+    results['serialize_page'] = _time_calls(
+        lambda _: ORJSONRenderer().render(serializer.serialize(rows)), range(samples), repeat
+    )
+
+    return {
+        'database': connection.vendor,
+        'lendings': sum(by_status.values()),
+        'by_status': by_status,
+        'page_size': page_size,
+        'queries': results,
+    }
@@ -0,0 +1,158 @@
+"""
+Caches en mémoire pour les réponses des microservices
+
+Deux niveaux :
+- un cache par processus (TTL + éviction LRU), partagé entre les requêtes d'un worker
+- un cache de requête, ouvert par RequestCacheMiddleware, pour qu'une même
+  requête HTTP ne récupère jamais deux fois la même ressource
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional
+
+_request_cache = contextvars.ContextVar('lending_request_cache', default=None)
+
+
+@contextmanager
+def request_cache_scope():
+    """Ouvre un cache de requête pour la durée du bloc"""
+    token = _request_cache.set({})
+    try:
+        yield
+    finally:
+        _request_cache.reset(token)
+
+
+def get_request_cache() -> Optional[Dict]:
+    """Retourne le cache de la requête courante, ou None hors requête"""
+    return _request_cache.get()
+
+
+class TTLCache:
+    """
+    Cache borné avec expiration (TTL) et éviction LRU, sûr entre threads
+
+    Les valeurs None ne sont jamais mises en cache : elles signalent un échec
+    de récupération qui doit être retenté.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 30):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.request_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def _request_key(self, key: Hashable):
+        return (self.name, key)
+
+    def get(self, key: Hashable, request_only: bool = False) -> Optional[Any]:
+        """
+        Lit une valeur dans le cache de requête puis dans le cache du processus
+
+        Args:
+            key: Clé de la valeur
+            request_only: Ne lit que le cache de la requête courante, pour une
+                valeur qui ne doit pas être servie périmée par le cache du processus
+        """
+        request_cache = get_request_cache()
+        if request_cache is not None and self._request_key(key) in request_cache:
+            with self._lock:
+                self.request_hits += 1
+            return request_cache[self._request_key(key)]
+
+        value = None
+        with self._lock:
+            entry = self._data.get(key) if self.enabled and not request_only else None
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+
+        if value is not None and request_cache is not None:
+            request_cache[self._request_key(key)] = value
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Enregistre une valeur dans les deux niveaux de cache"""
+        if value is None:
+            return
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            request_cache[self._request_key(key)] = value
+        if not self.enabled:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[Any]],
+                    request_only: bool = False) -> Optional[Any]:
+        """Retourne la valeur en cache ou la charge via loader() et la met en cache (voir get)"""
+        value = self.get(key, request_only)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def update(self, key: Hashable, func: Callable[[Any], Any]):
+        """Écriture traversante : applique func aux valeurs en cache, sans compter d'accès"""
+        request_cache = get_request_cache()
+        if request_cache is not None and self._request_key(key) in request_cache:
+            request_cache[self._request_key(key)] = func(request_cache[self._request_key(key)])
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data[key] = (entry[0], func(entry[1]))
+
+    def delete(self, key: Hashable):
+        """Invalide une entrée dans les deux niveaux de cache"""
+        request_cache = get_request_cache()
+        if request_cache is not None:
+            request_cache.pop(self._request_key(key), None)
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Vide le cache du processus"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Taille et ratio de succès du cache"""
+        with self._lock:
+            hits = self.hits + self.request_hits
+            lookups = hits + self.misses
+            return {
+                'name': self.name,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'request_hits': self.request_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,227 @@
+"""
+Vérifications préalables à un emprunt
+
+En mode séquentiel, les vérifications s'enchaînent comme historiquement.
+En mode concurrent, les appels aux microservices utilisateurs et livres
+partent en parallèle dans un pool de threads ; la latence devient celle de
+la vérification la plus lente, bornée par un délai commun. Les vues
+asynchrones utilisent arun_lend_checks, qui fait de même avec asyncio.
+
+L'absence de prêt en cours n'est pas vérifiée ici : create_lending s'appuie
+sur les contraintes lending_unique_active_loan et lending_unique_open_book_loan,
+et lend_conflicts indique laquelle a refusé l'emprunt (EXISTING_CHECK si
+l'utilisateur a déjà le livre, BOOK_CHECK s'il est prêté à quelqu'un d'autre).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Tuple
+
+from django.conf import settings
+from rest_framework import status
+
+from .async_services import async_book_service, async_user_service
+from .models import Lending
+from .services import book_service, user_service
+
+logger = logging.getLogger(__name__)
+
+SEQUENTIAL = 'sequential'
+CONCURRENT = 'concurrent'
+ASYNC = 'async'
+
+# Échecs possibles, dans l'ordre des vérifications séquentielles
+USER_CHECK = 'user'
+BOOK_CHECK = 'book'
+EXISTING_CHECK = 'existing'
+TIMEOUT = 'timeout'
+
+# Réponse d'erreur associée à chaque échec
+LEND_CHECK_ERRORS = {
+    USER_CHECK: ('Utilisateur non trouvé ou inactif', status.HTTP_404_NOT_FOUND),
+    BOOK_CHECK: ('Livre non disponible pour l\'emprunt', status.HTTP_400_BAD_REQUEST),
+    EXISTING_CHECK: ('Ce livre est déjà emprunté par cet utilisateur', status.HTTP_400_BAD_REQUEST),
+    TIMEOUT: ('Vérifications non terminées dans le délai imparti', status.HTTP_503_SERVICE_UNAVAILABLE),
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def lend_conflicts(user_email: str, book_ids) -> Dict[int, str]:
+    """
+    Motif du refus d'emprunts rejetés par une contrainte d'unicité
+
+    Returns:
+        dict: book_id -> EXISTING_CHECK (prêt en cours de cet utilisateur) ou
+            BOOK_CHECK (livre prêté à un autre utilisateur, pas encore relayé)
+    """
+    own = set(Lending.objects.filter(
+        user_email=user_email, book_id__in=list(book_ids), status__in=Lending.OPEN_STATUSES
+    ).values_list('book_id', flat=True))
+    return {book_id: EXISTING_CHECK if book_id in own else BOOK_CHECK for book_id in book_ids}
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Pool de threads du processus courant, créé après le fork gunicorn"""
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='lend-checks')
+                _executor_pid = pid
+    return _executor
+
+
+def _timed(check: Callable[[], bool]) -> Tuple[bool, float]:
+    started = time.perf_counter()
+    result = check()
+    return result, time.perf_counter() - started
+
+
+def _record(mode: str, total: float):
+    with _stats_lock:
+        stats = _stats.setdefault(mode, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        stats['count'] += 1
+        stats['total_seconds'] += total
+        stats['max_seconds'] = max(stats['max_seconds'], total)
+
+
+def get_check_stats() -> Dict[str, Dict[str, Any]]:
+    """Latence moyenne et maximale des vérifications par mode"""
+    with _stats_lock:
+        return {
+            mode: {
+                'count': stats['count'],
+                'avg_ms': round(stats['total_seconds'] / stats['count'] * 1000, 2),
+                'max_ms': round(stats['max_seconds'] * 1000, 2),
+            }
+            for mode, stats in _stats.items()
+        }
+
+
+def run_lend_checks(user_email: str, book_id: int) -> Dict[str, Any]:
+    """
+    Vérifie l'utilisateur et la disponibilité du livre
+
+    Returns:
+        dict: mode utilisé, vérification en échec (None si tout est valide),
+        durée de chaque vérification et durée totale en secondes
+    """
+    config = getattr(settings, 'LEND_CHECKS', {})
+    mode = config.get('MODE', SEQUENTIAL)
+    checks = {
+        USER_CHECK: lambda: user_service.verify_user(user_email),
+        BOOK_CHECK: lambda: book_service.check_book_availability(book_id),
+    }
+    timings = {}
+    failed = None
+    started = time.perf_counter()
+
+    if mode == CONCURRENT:
+        executor = _get_executor(config.get('MAX_WORKERS', 8))
+        deadline = started + config.get('DEADLINE', 5.0)
+        # Le cache de requête suit les appels dans les threads du pool
+        futures = {
+            executor.submit(contextvars.copy_context().run, _timed, checks[name]): name
+            for name in (USER_CHECK, BOOK_CHECK)
+        }
+        pending = set(futures)
+        while pending and failed is None:
+            done, pending = wait(pending, timeout=max(deadline - time.perf_counter(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                failed = TIMEOUT
+                break
+            for future in sorted(done, key=lambda f: (USER_CHECK, BOOK_CHECK).index(futures[f])):
+                passed, timings[futures[future]] = future.result()
+                if not passed and failed is None:
+                    failed = futures[future]
+        # Abandonner ce qui reste : inutile d'attendre après un premier échec
+        for future in pending:
+            future.cancel()
+    else:
+        for name in (USER_CHECK, BOOK_CHECK):
+            passed, timings[name] = _timed(checks[name])
+            if not passed:
+                failed = name
+                break
+
+    return _finish(mode, failed, timings, started)
+
+
+def check_books_availability(book_ids) -> Dict[int, Any]:
+    """
+    Vérifie la disponibilité de plusieurs livres, en parallèle en mode concurrent
+
+    Returns:
+        dict: book_id -> True/False, ou None si la vérification n'a pas abouti
+        dans le délai imparti
+    """
+    config = getattr(settings, 'LEND_CHECKS', {})
+    if config.get('MODE', SEQUENTIAL) != CONCURRENT:
+        return {book_id: book_service.check_book_availability(book_id) for book_id in book_ids}
+
+    executor = _get_executor(config.get('MAX_WORKERS', 8))
+    futures = {
+        executor.submit(contextvars.copy_context().run, book_service.check_book_availability, book_id): book_id
+        for book_id in book_ids
+    }
+    done, not_done = wait(futures, timeout=config.get('DEADLINE', 5.0))
+    for future in not_done:
+        future.cancel()
+    return {book_id: future.result() if future in done else None for future, book_id in futures.items()}
+
+
+async def _atimed(check) -> Tuple[bool, float]:
+    started = time.perf_counter()
+    result = await check
+    return result, time.perf_counter() - started
+
+
+async def arun_lend_checks(user_email: str, book_id: int) -> Dict[str, Any]:
+    """Version asynchrone de run_lend_checks : les deux vérifications partent ensemble"""
+    config = getattr(settings, 'LEND_CHECKS', {})
+    order = (USER_CHECK, BOOK_CHECK)
+    timings = {}
+    failed = None
+    started = time.perf_counter()
+    deadline = started + config.get('DEADLINE', 5.0)
+    tasks = {
+        asyncio.ensure_future(_atimed(async_user_service.verify_user(user_email))): USER_CHECK,
+        asyncio.ensure_future(_atimed(async_book_service.check_book_availability(book_id))): BOOK_CHECK,
+    }
+    pending = set(tasks)
+    try:
+        while pending and failed is None:
+            done, pending = await asyncio.wait(pending, timeout=max(deadline - time.perf_counter(), 0),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                failed = TIMEOUT
+                break
+            for task in sorted(done, key=lambda t: order.index(tasks[t])):
+                passed, timings[tasks[task]] = task.result()
+                if not passed and failed is None:
+                    failed = tasks[task]
+    finally:
+        for task in pending:
+            task.cancel()
+    return _finish(ASYNC, failed, timings, started)
+
+
+def _finish(mode: str, failed, timings: Dict[str, float], started: float) -> Dict[str, Any]:
+    total = time.perf_counter() - started
+    _record(mode, total)
+    logger.debug(
+        f"Vérifications d'emprunt ({mode}) en {total * 1000:.1f} ms : "
+        + ', '.join(f"{name} {elapsed * 1000:.1f} ms" for name, elapsed in timings.items())
+    )
+    return {'mode': mode, 'failed': failed, 'timings': timings, 'total': total}
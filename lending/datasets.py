@@ -0,0 +1,163 @@
+"""
+Jeu de données synthétique de la table Lending
+
+Exécuté par la commande generate_lendings, pour mesurer les requêtes et la
+sérialisation à 10k, 1M ou 10M prêts. Les données restent cohérentes avec
+le modèle et le sweeper :
+- ACTIVE : échéance à venir ; OVERDUE : échéance passée, non retourné ;
+  RETURNED : date de retour entre l'emprunt et maintenant ;
+- un livre n'a jamais plus d'un prêt en cours (ACTIVE ou OVERDUE), ce qui
+  respecte aussi la contrainte lending_unique_active_loan.
+"""
+import math
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+from typing import Any, Callable, Dict, Optional
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Lending
+
+DEFAULT_STATUS_MIX = {'RETURNED': 0.75, 'ACTIVE': 0.2, 'OVERDUE': 0.05}
+
+# Répartition de l'ancienneté des prêts : uniforme sur la période, ou concentrée sur les plus récents
+DUE_DISTRIBUTIONS = ('uniform', 'recent')
+
+OPEN_STATUSES = ('ACTIVE', 'OVERDUE')
+
+
+def parse_status_mix(value: str) -> Dict[str, float]:
+    """'RETURNED=0.75,ACTIVE=0.2,OVERDUE=0.05' -> proportions normalisées"""
+    statuses = {choice for choice, _ in Lending.STATUS_CHOICES}
+    mix = {}
+    for item in value.split(','):
+        status, _, weight = item.partition('=')
+        status = status.strip().upper()
+        if status not in statuses:
+            raise ValueError(f"Statut inconnu : {status}")
+        mix[status] = float(weight)
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError('La répartition des statuts doit avoir un poids positif')
+    return {status: weight / total for status, weight in mix.items()}
+
+
+def _user_cum_weights(users: int, skew: float):
+    """Poids cumulés d'une loi de Zipf d'exposant `skew` (0 : utilisateurs équiprobables)"""
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, users + 1)))
+
+
+def _coprime_step(books: int) -> int:
+    """Pas premier avec `books` : i -> (pas * i) % books parcourt tous les livres sans répétition"""
+    step = 2654435761 % books or 1
+    while math.gcd(step, books) != 1:
+        step += 1
+    return step
+
+
+def generate_lendings(count: int, status_mix: Optional[Dict[str, float]] = None, users: int = 10000,
+                      user_skew: float = 1.0, books: Optional[int] = None, span_days: int = 365,
+                      loan_days: int = 60, due_distribution: str = 'uniform', batch_size: int = 5000,
+                      seed: Optional[int] = None, now=None,
+                      progress: Optional[Callable[[int], None]] = None) -> Dict[str, Any]:
+    """
+    Insère `count` prêts synthétiques par lots (bulk_create, une transaction par lot)
+
+    Args:
+        count: Nombre de prêts à créer
+        status_mix: Proportion de chaque statut (par défaut DEFAULT_STATUS_MIX)
+        users: Nombre d'utilisateurs distincts
+        user_skew: Exposant de Zipf de la répartition des prêts entre utilisateurs
+        books: Nombre de livres distincts (par défaut, la moitié du nombre de prêts)
+        span_days: Ancienneté maximale des emprunts (jours)
+        loan_days: Durée d'un prêt (jours), comme two_months_from_now
+        due_distribution: 'uniform' ou 'recent' (ancienneté de moyenne span_days / 4)
+        batch_size: Nombre de prêts par INSERT
+        seed: Graine du générateur, pour reproduire un jeu de données
+        progress: Appelé avec le nombre de prêts créés après chaque lot
+
+    Returns:
+        dict: prêts créés, répartition par statut, durée et débit
+    """
+    if due_distribution not in DUE_DISTRIBUTIONS:
+        raise ValueError(f"Distribution inconnue : {due_distribution}")
+    if span_days <= loan_days:
+        raise ValueError("span_days doit dépasser loan_days pour produire des prêts en retard")
+    status_mix = status_mix or DEFAULT_STATUS_MIX
+    books = books or max(count // 2, 1000)
+    open_share = sum(status_mix.get(status, 0) for status in OPEN_STATUSES)
+    if count * open_share > books * 0.95:
+        raise ValueError(f"{books} livres ne suffisent pas pour {round(count * open_share)} prêts en cours")
+
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    statuses = list(status_mix)
+    status_weights = [status_mix[status] for status in statuses]
+    emails = [f'user{i}@example.com' for i in range(users)]
+    user_weights = _user_cum_weights(users, user_skew)
+    book_step = _coprime_step(books)
+    book_offset = rng.randrange(books)
+    # Ajout à une table non vide : nouveaux livres, pour ne jamais doubler un prêt en cours
+    book_base = Lending.objects.aggregate(max_id=Max('book_id'))['max_id'] or 0
+    loan = timedelta(days=loan_days)
+
+    def age_days(maximum: float) -> float:
+        if due_distribution == 'recent':
+            return min(rng.expovariate(4 / maximum), maximum)
+        return rng.uniform(0, maximum)
+
+    started = time.monotonic()
+    created = 0
+    open_loans = 0
+    by_status = dict.fromkeys(statuses, 0)
+    while created < count:
+        size = min(batch_size, count - created)
+        batch = []
+        for status, email in zip(rng.choices(statuses, status_weights, k=size),
+                                 rng.choices(emails, cum_weights=user_weights, k=size)):
+            date_returned = None
+            if status == 'ACTIVE':
+                borrowed = now - timedelta(days=rng.uniform(0, loan_days))
+            elif status == 'OVERDUE':
+                borrowed = now - loan - timedelta(days=age_days(span_days - loan_days))
+            else:
+                borrowed = now - timedelta(days=age_days(span_days))
+                date_returned = min(borrowed + timedelta(days=rng.uniform(0.1, loan_days * 1.2)), now)
+            if status in OPEN_STATUSES:
+                if open_loans >= books:
+                    raise ValueError(f"{books} livres ne suffisent pas pour les prêts en cours")
+                book_id = book_base + (book_step * open_loans + book_offset) % books + 1
+                open_loans += 1
+            else:
+                book_id = book_base + rng.randint(1, books)
+            by_status[status] += 1
+            batch.append(Lending(
+                user_email=email,
+                book_id=book_id,
+                date_borrowed=borrowed,
+                date_due=borrowed + loan,
+                date_returned=date_returned,
+                status=status,
+            ))
+        with transaction.atomic():
+            Lending.objects.bulk_create(batch, batch_size=size)
+        created += size
+        if progress:
+            progress(created)
+
+    # Statistiques du planificateur à jour (autovacuum le fait en production) : sans elles,
+    # SQLite préfère l'index (status, date_due) à lending_unique_active_loan
+    with connection.cursor() as cursor:
+        cursor.execute(f'ANALYZE {Lending._meta.db_table}')
+
+    duration = time.monotonic() - started
+    return {
+        'created': created,
+        'by_status': by_status,
+        'duration': round(duration, 2),
+        'rows_per_second': round(created / duration) if duration else created,
+    }
@@ -0,0 +1,55 @@
+"""
+Pool de connexions PostgreSQL
+
+Avec DATABASE_CONNECTIONS=pool (projet/settings.py), chaque processus
+(worker gunicorn ou uvicorn, relais de l'outbox, sweeper) ouvre un pool
+psycopg borné : les requêtes empruntent une connexion déjà authentifiée au
+lieu d'en ouvrir une (TCP, TLS, authentification) à chaque requête. Une
+connexion est vérifiée à sa sortie du pool (CONN_HEALTH_CHECKS).
+
+Les statistiques du pool sont publiées dans les métriques Prometheus
+lending_db_pool_* (voir lending/metrics.py), sommées sur tous les workers et
+tous les pods : le nombre maximal de connexions ouvertes vers PostgreSQL (ou
+pgbouncer) est réplicas × processus par pod × DATABASE_POOL_MAX_SIZE.
+"""
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import connections
+
+
+def pooled_aliases() -> List[str]:
+    """Bases configurées avec un pool de connexions"""
+    return [alias for alias, database in settings.DATABASES.items() if database.get('OPTIONS', {}).get('pool')]
+
+
+def get_db_pool_stats() -> List[Dict[str, Any]]:
+    """
+    Statistiques des pools de connexions du processus courant
+
+    Les compteurs (emprunts, attente, délais dépassés, connexions perdues)
+    sont cumulés depuis le démarrage du processus ; les autres valeurs sont
+    instantanées.
+    """
+    pools = []
+    for alias in pooled_aliases():
+        pool = connections[alias].pool
+        stats = pool.get_stats()
+        size = stats.get('pool_size', 0)
+        in_use = size - stats.get('pool_available', 0)
+        pools.append({
+            'alias': alias,
+            'min_size': pool.min_size,
+            'max_size': pool.max_size,
+            'size': size,
+            'in_use': in_use,
+            'idle': size - in_use,
+            'waiting': stats.get('requests_waiting', 0),
+            'saturation': round(in_use / pool.max_size, 3) if pool.max_size else 0.0,
+            'checkouts': stats.get('requests_num', 0),
+            'queued': stats.get('requests_queued', 0),
+            'wait_seconds': stats.get('requests_wait_ms', 0) / 1000,
+            'timeouts': stats.get('requests_errors', 0),
+            'connections_lost': stats.get('connections_lost', 0) + stats.get('returns_bad', 0),
+        })
+    return pools
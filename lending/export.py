@@ -0,0 +1,141 @@
+"""
+Export de l'historique des prêts en CSV ou NDJSON
+
+Servi par /api/lendings/export/ (et sa variante asynchrone) et par la
+commande export_lendings. Les prêts sont lus par lots dans l'ordre des id
+(streaming.iter_keyset) et chaque paquet est sérialisé d'un bloc : la
+mémoire reste constante quel que soit le nombre de prêts exportés. Chaque
+ligne contient l'id du prêt : un export interrompu reprend avec
+after_id = dernier id reçu.
+"""
+import csv
+import io
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .models import Lending
+from .renderers import ORJSONRenderer
+from .serializers import LendingRowSerializer
+from .streaming import CSV, NDJSON, iter_keyset
+
+# Configuration par défaut, surchargée par settings.LENDING_EXPORT
+DEFAULT_EXPORT_CONFIG = {
+    'BATCH_SIZE': 50000,  # lignes par requête
+}
+
+CONTENT_TYPES = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson',
+}
+
+
+def get_export_config() -> Dict[str, Any]:
+    return {**DEFAULT_EXPORT_CONFIG, **getattr(settings, 'LENDING_EXPORT', {})}
+
+
+def export_queryset(since=None, until=None, statuses: Optional[Sequence[str]] = None):
+    """
+    Prêts à exporter
+
+    Args:
+        since: Emprunts à partir de cette date (incluse)
+        until: Emprunts avant cette date (exclue)
+        statuses: Statuts retenus (par défaut, tous)
+    """
+    lendings = Lending.objects.all()
+    if since is not None:
+        lendings = lendings.filter(date_borrowed__gte=since)
+    if until is not None:
+        lendings = lendings.filter(date_borrowed__lt=until)
+    if statuses and len(statuses) == 1:
+        lendings = lendings.filter(status=statuses[0])
+    elif statuses:
+        lendings = lendings.filter(status__in=statuses)
+    return lendings
+
+
+def _csv_lines(rows: Iterable[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue().encode()
+
+
+def iter_export(queryset, export_format: str, fields: Optional[Sequence[str]] = None, after_id: int = 0,
+                limit: Optional[int] = None, header: bool = True,
+                progress: Optional[Callable[[int, int], None]] = None) -> Iterator[bytes]:
+    """
+    Contenu de l'export, un bloc d'octets par paquet de lignes
+
+    Args:
+        queryset: Prêts à exporter (export_queryset)
+        export_format: 'csv' (avec ligne d'en-tête) ou 'ndjson'
+        fields: Champs exportés (par défaut, tous ceux de LendingRowSerializer) ;
+            l'id est toujours exporté, en tête, pour la reprise
+        after_id: Reprise après cet id (exclu)
+        limit: Nombre maximal de prêts
+        header: Ligne d'en-tête du CSV (absente en reprise d'un fichier)
+        progress: Appelé après chaque paquet avec le nombre de lignes et le dernier id
+    """
+    config = get_export_config()
+    if fields and 'id' not in fields:
+        fields = ('id', *fields)
+    serializer = LendingRowSerializer(fields)
+    fields = serializer.fields
+    key_index = fields.index('id')
+    renderer = ORJSONRenderer()
+
+    if export_format == CSV and header:
+        yield _csv_lines([fields])
+    for chunk in iter_keyset(queryset.values_list(*fields), config['BATCH_SIZE'],
+                             after_id=after_id, limit=limit, key_index=key_index):
+        rows = serializer.serialize(chunk)
+        if export_format == CSV:
+            yield _csv_lines([row[name] for name in fields] for row in rows)
+        else:
+            yield b''.join([renderer.render(row) + b'\n' for row in rows])
+        if progress:
+            progress(len(chunk), chunk[-1][key_index])
+
+
+def export_response(content, export_format: str) -> StreamingHttpResponse:
+    """Réponse en streaming d'un export (iter_export, ou son équivalent asynchrone)"""
+    response = StreamingHttpResponse(content, content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="lendings.{export_format}"'
+    # Transmis au fil de l'eau par nginx, sans mise en tampon de la réponse complète
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def last_exported_id(path: str, export_format: str) -> int:
+    """
+    Dernier id d'un fichier d'export, pour reprendre un export interrompu
+
+    Une dernière ligne incomplète (écriture interrompue) est retirée du
+    fichier. Retourne 0 si le fichier ne contient encore aucun prêt.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb+') as file:
+        size = file.seek(0, os.SEEK_END)
+        tail_start = max(size - 65536, 0)
+        file.seek(tail_start)
+        tail = file.read()
+        if tail and not tail.endswith(b'\n'):
+            cut = tail.rfind(b'\n') + 1
+            file.truncate(tail_start + cut)
+            tail = tail[:cut]
+        lines = tail.splitlines()
+    if not lines:
+        return 0
+    last = lines[-1].decode()
+    if export_format == CSV:
+        with open(path, encoding='utf-8', newline='') as file:
+            header = next(csv.reader(file), [])
+        if 'id' not in header or last == ','.join(header):
+            return 0
+        return int(next(csv.reader([last]))[header.index('id')])
+    return int(json.loads(last)['id'])
@@ -0,0 +1,251 @@
+"""
+Requêtes POST idempotentes (en-tête Idempotency-Key)
+
+La première requête d'une clé réserve la clé en base, s'exécute, puis sa
+réponse est mémorisée pour IDEMPOTENCY['TTL'] secondes : une nouvelle
+tentative avec la même clé rejoue cette réponse sans rappeler les
+microservices ni recréer le prêt. Un doublon concurrent attend la fin de la
+première requête au lieu de s'exécuter en parallèle. La réservation est en
+base pour être partagée par tous les workers et toutes les instances.
+
+Les réponses 5xx ne sont pas mémorisées : la clé est libérée et la tentative
+suivante s'exécute à nouveau. Si la requête qui détient la clé disparaît
+(worker arrêté), la clé est reprise après LOCK_TIMEOUT. Les clés expirées
+sont purgées par lots, au fil des nouvelles réservations.
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import time
+import uuid
+from datetime import timedelta
+from functools import wraps
+from typing import Any, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+
+from .metrics import record_idempotent_request
+from .models import IdempotencyKey
+from .utils import json_response
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Configuration par défaut, surchargée par settings.IDEMPOTENCY
+DEFAULT_IDEMPOTENCY_CONFIG = {
+    'TTL': 24 * 3600,
+    'LOCK_TIMEOUT': 30.0,
+    'WAIT_TIMEOUT': 10.0,
+    'PURGE_BATCH_SIZE': 500,
+    'PURGE_PROBABILITY': 0.01,  # fraction des nouvelles clés qui déclenchent une purge
+}
+
+# Résultats de la réservation d'une clé (label de lending_idempotent_requests_total)
+OWNER = 'executed'
+REPLAY = 'replayed'
+PENDING = 'in_progress'
+MISMATCH = 'mismatch'
+
+
+def get_idempotency_config() -> Dict[str, Any]:
+    return {**DEFAULT_IDEMPOTENCY_CONFIG, **getattr(settings, 'IDEMPOTENCY', {})}
+
+
+def request_fingerprint(request) -> str:
+    """Empreinte de la méthode, du chemin et du corps : une clé ne vaut que pour une requête"""
+    digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def claim_key(endpoint: str, key: str, fingerprint: str) -> Tuple[str, Any]:
+    """
+    Réserve une clé, ou indique pourquoi elle ne peut pas l'être
+
+    Returns:
+        tuple: (OWNER, jeton) si la requête doit s'exécuter, (REPLAY, clé) si
+            une réponse est mémorisée, (MISMATCH, clé) si la clé a servi pour
+            une autre requête, (PENDING, None) si une autre requête la traite
+    """
+    config = get_idempotency_config()
+    token = uuid.uuid4().hex
+    # Deux tentatives : la ligne lue peut disparaître (libérée) entre l'INSERT et la lecture
+    for _ in range(2):
+        now = timezone.now()
+        lease = {'owner': token, 'locked_until': now + timedelta(seconds=config['LOCK_TIMEOUT'])}
+        try:
+            with transaction.atomic():
+                IdempotencyKey.objects.create(
+                    endpoint=endpoint, key=key, fingerprint=fingerprint,
+                    created_at=now, expires_at=now + timedelta(seconds=config['TTL']), **lease
+                )
+            if random.random() < config['PURGE_PROBABILITY']:
+                purge_expired_keys(now)
+            return OWNER, token
+        except IntegrityError:
+            pass
+
+        record = IdempotencyKey.objects.filter(endpoint=endpoint, key=key).first()
+        if record is None:
+            continue
+        if record.expires_at <= now:
+            # Clé expirée, pas encore purgée : réutilisée comme une nouvelle clé
+            if IdempotencyKey.objects.filter(pk=record.pk, expires_at__lte=now).update(
+                fingerprint=fingerprint, status_code=None, response_body=None, content_type='',
+                created_at=now, expires_at=now + timedelta(seconds=config['TTL']), **lease
+            ):
+                return OWNER, token
+            continue
+        if record.fingerprint != fingerprint:
+            return MISMATCH, record
+        if record.status_code is not None:
+            return REPLAY, record
+        if record.locked_until is not None and record.locked_until <= now:
+            # Requête initiale disparue sans réponse : la clé est reprise
+            if IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, locked_until__lte=now
+            ).update(**lease):
+                logger.warning(f"Idempotency-Key {key} reprise après expiration du verrou ({endpoint})")
+                return OWNER, token
+        return PENDING, None
+    return PENDING, None
+
+
+def store_response(endpoint: str, key: str, token: str, response):
+    """Mémorise une réponse définitive (< 500), ou libère la clé"""
+    owned = IdempotencyKey.objects.filter(endpoint=endpoint, key=key, owner=token, status_code__isnull=True)
+    if response is None or response.status_code >= 500:
+        owned.delete()
+        return
+    owned.update(
+        status_code=response.status_code,
+        response_body=bytes(response.content),
+        content_type=response.get('Content-Type', ''),
+        locked_until=None,
+    )
+
+
+def purge_expired_keys(now=None) -> int:
+    """Supprime un lot de clés expirées (index sur expires_at)"""
+    config = get_idempotency_config()
+    expired = list(IdempotencyKey.objects.filter(
+        expires_at__lte=now or timezone.now()
+    ).values_list('id', flat=True)[:config['PURGE_BATCH_SIZE']])
+    if not expired:
+        return 0
+    return IdempotencyKey.objects.filter(id__in=expired).delete()[0]
+
+
+def _replay(record) -> HttpResponse:
+    response = HttpResponse(bytes(record.response_body or b''), status=record.status_code,
+                            content_type=record.content_type or None)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _refusal(outcome: str, record) -> HttpResponse:
+    """Réponse d'une clé qui ne peut pas être traitée par cette requête"""
+    if outcome == REPLAY:
+        return _replay(record)
+    if outcome == MISMATCH:
+        return json_response(
+            {'error': f"{HEADER} déjà utilisée pour une autre requête"}, status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = json_response(
+        {'error': f"Requête en cours de traitement pour cette {HEADER}"}, status.HTTP_409_CONFLICT
+    )
+    response['Retry-After'] = '1'
+    return response
+
+
+def _parse_key(request) -> Tuple[Optional[str], Optional[HttpResponse]]:
+    """Clé de la requête ; (None, None) si la requête n'est pas concernée"""
+    key = request.headers.get(HEADER)
+    if key is None or request.method != 'POST':
+        return None, None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None, json_response(
+            {'error': f"{HEADER} invalide (1 à {MAX_KEY_LENGTH} caractères)"}, status.HTTP_400_BAD_REQUEST
+        )
+    return key, None
+
+
+def idempotent(func):
+    """
+    Décorateur des vues POST acceptant l'en-tête Idempotency-Key
+
+    À placer au-dessus de @api_view : la réponse mémorisée est celle rendue
+    au client. Sans en-tête, la vue s'exécute normalement. Fonctionne aussi
+    sur les vues asynchrones.
+    """
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(request, *args, **kwargs):
+            key, error = _parse_key(request)
+            if key is None:
+                return error or await func(request, *args, **kwargs)
+            endpoint = request.path
+            fingerprint = request_fingerprint(request)
+            config = get_idempotency_config()
+            deadline = time.monotonic() + config['WAIT_TIMEOUT']
+            delay = 0.05
+            while True:
+                outcome, value = await sync_to_async(claim_key)(endpoint, key, fingerprint)
+                if outcome != PENDING or time.monotonic() >= deadline:
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+            record_idempotent_request(outcome)
+            if outcome != OWNER:
+                return _refusal(outcome, value)
+
+            response = None
+            try:
+                response = await func(request, *args, **kwargs)
+                return response
+            finally:
+                await sync_to_async(store_response)(endpoint, key, value, response)
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        key, error = _parse_key(request)
+        if key is None:
+            return error or func(request, *args, **kwargs)
+        endpoint = request.path
+        fingerprint = request_fingerprint(request)
+        config = get_idempotency_config()
+        deadline = time.monotonic() + config['WAIT_TIMEOUT']
+        delay = 0.05
+        while True:
+            outcome, value = claim_key(endpoint, key, fingerprint)
+            if outcome != PENDING or time.monotonic() >= deadline:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        record_idempotent_request(outcome)
+        if outcome != OWNER:
+            return _refusal(outcome, value)
+
+        response = None
+        try:
+            response = func(request, *args, **kwargs)
+            # Réponse DRF : rendue maintenant pour mémoriser les octets envoyés au client
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+            return response
+        finally:
+            store_response(endpoint, key, value, response)
+
+    return wrapper
@@ -0,0 +1,360 @@
+"""
+Banc de charge de bout en bout du service Lending Management
+
+Exécuté par la commande loadtest : des bouchons HTTP locaux remplacent les
+microservices Book, User et Notification (construits depuis les fichiers
+d'expectations MockServer de mocks/, avec latence et erreurs injectables),
+le service est lancé dans un processus séparé puis sollicité par un mélange
+de lendBook, returnBook et getExpiredBooks à concurrence fixée.
+"""
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+# Fichiers d'expectations MockServer de chaque microservice
+STUB_EXPECTATIONS = {
+    'book': 'book-management-expectations.json',
+    'user': 'user-management-expectations.json',
+    'notification': 'notification-service-expectations.json',
+}
+
+# Variable d'environnement de l'URL de chaque microservice (voir projet/settings.py)
+SERVICE_URL_SETTINGS = {
+    'book': 'BOOK_MANAGEMENT_URL',
+    'user': 'USER_MANAGEMENT_URL',
+    'notification': 'NOTIFICATION_SERVICE_URL',
+}
+
+OPERATIONS = ('lend', 'return', 'expired')
+
+# Statut attendu de chaque opération ; tout autre statut compte comme une erreur
+EXPECTED_STATUS = {'lend': 201, 'return': 200, 'expired': 200}
+
+DEFAULT_MIX = {'lend': 4, 'return': 3, 'expired': 3}
+
+# En-tête posé par nginx en production : sans lui, SECURE_SSL_REDIRECT redirige vers HTTPS
+PROXY_HEADERS = {'X-Forwarded-Proto': 'https'}
+
+
+def load_expectations(path) -> List[Dict[str, Any]]:
+    """
+    Lit un fichier d'expectations MockServer
+
+    Returns:
+        list: une expectation par dict (méthode, motif de chemin compilé, statut, en-têtes, corps encodé)
+    """
+    expectations = []
+    for expectation in json.loads(Path(path).read_text(encoding='utf-8')):
+        request, response = expectation['httpRequest'], expectation['httpResponse']
+        headers = {name: values[0] for name, values in response.get('headers', {}).items()}
+        expectations.append({
+            'method': request.get('method', 'GET').upper(),
+            'path': re.compile(request['path']),
+            'status': response.get('statusCode', 200),
+            'headers': headers,
+            'body': json.dumps(response.get('body', {})).encode(),
+        })
+    return expectations
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Client parti avant la réponse (délai dépassé côté service) : rien à signaler
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    Bouchon HTTP d'un microservice, servi dans un thread du processus courant
+
+    Répond selon les expectations (méthode et chemin en expression régulière),
+    après `latency` secondes (± `jitter`) ; une fraction `error_rate` des
+    requêtes reçoit une erreur 503.
+    """
+
+    def __init__(self, name: str, expectations: List[Dict[str, Any]], latency: float = 0.0,
+                 jitter: float = 0.0, error_rate: float = 0.0, host: str = '127.0.0.1', port: int = 0):
+        self.name = name
+        self.expectations = expectations
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = _StubHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, comme les pools HTTP du service
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                status, headers, body = stub.respond(self.command, self.path)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_PATCH = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, method: str, path: str) -> Tuple[int, Dict[str, str], bytes]:
+        """Réponse à une requête : (statut, en-têtes, corps)"""
+        delay = self.latency + random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            time.sleep(delay)
+        inject_error = self.error_rate and random.random() < self.error_rate
+        with self._lock:
+            self.requests += 1
+            self.errors += bool(inject_error)
+        json_headers = {'Content-Type': 'application/json'}
+        if inject_error:
+            return 503, json_headers, b'{"error": "Erreur injectee par le bouchon"}'
+        path = path.split('?', 1)[0]
+        for expectation in self.expectations:
+            if expectation['method'] == method and expectation['path'].fullmatch(path):
+                return expectation['status'], expectation['headers'], expectation['body']
+        return 404, json_headers, b'{"error": "Aucune expectation"}'
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f'stub-{self.name}', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'url': self.url, 'requests': self.requests, 'injected_errors': self.errors}
+
+
+def start_stubs(mocks_dir, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                ports: Optional[Dict[str, int]] = None) -> Dict[str, StubServer]:
+    """Démarre un bouchon par microservice depuis les fichiers de mocks_dir"""
+    ports = ports or {}
+    return {
+        name: StubServer(
+            name, load_expectations(Path(mocks_dir) / filename),
+            latency=latency, jitter=jitter, error_rate=error_rate, port=ports.get(name, 0),
+        ).start()
+        for name, filename in STUB_EXPECTATIONS.items()
+    }
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'lend=4,return=3,expired=3' -> poids de chaque opération"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Opération inconnue : {name} (attendu : {', '.join(OPERATIONS)})")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise ValueError('Le mélange doit contenir au moins une opération de poids positif')
+    return mix
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Percentile par rang le plus proche d'une liste triée"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, duration: float) -> Dict[str, Any]:
+    """Débit et distribution des latences (en millisecondes)"""
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput': round(len(values) / duration, 2) if duration else 0.0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 2),
+        'p95_ms': round(percentile(values, 95) * 1000, 2),
+        'p99_ms': round(percentile(values, 99) * 1000, 2),
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+class LoadDriver:
+    """
+    Générateur de charge en boucle fermée : `concurrency` clients enchaînent
+    les requêtes, chaque opération étant tirée selon les poids de `mix`
+
+    Les prêts créés alimentent les retours ; sans prêt à retourner, un retour
+    est remplacé par un prêt.
+    """
+
+    def __init__(self, base_url: str, mix: Dict[str, float], concurrency: int = 10, users: int = 1000,
+                 books: int = 100000, page_size: int = 50, async_views: bool = False, timeout: float = 30.0):
+        self.base_url = base_url.rstrip('/')
+        self.prefix = '/api/async' if async_views else '/api'
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.concurrency = concurrency
+        self.users = users
+        self.books = books
+        self.page_size = page_size
+        self.timeout = timeout
+        self._borrowed = deque()
+        self._lock = threading.Lock()
+        self._results = []
+        self._recording = False
+
+    def _lend(self, session: requests.Session) -> Tuple[str, requests.Response]:
+        payload = {
+            'user_email': f'load{random.randrange(self.users)}@example.com',
+            'book_id': random.randint(1, self.books),
+        }
+        response = session.post(f'{self.base_url}{self.prefix}/lendBook/', json=payload, timeout=self.timeout)
+        if response.status_code == EXPECTED_STATUS['lend']:
+            self._borrowed.append(payload)
+        return 'lend', response
+
+    def _return(self, session: requests.Session) -> Tuple[str, requests.Response]:
+        try:
+            payload = self._borrowed.popleft()
+        except IndexError:
+            return self._lend(session)
+        response = session.post(f'{self.base_url}{self.prefix}/returnBook/', json=payload, timeout=self.timeout)
+        return 'return', response
+
+    def _expired(self, session: requests.Session) -> Tuple[str, requests.Response]:
+        response = session.get(
+            f'{self.base_url}{self.prefix}/getExpiredBooks/', params={'page_size': self.page_size},
+            timeout=self.timeout,
+        )
+        return 'expired', response
+
+    def _worker(self, deadline: float):
+        actions = {'lend': self._lend, 'return': self._return, 'expired': self._expired}
+        results = []
+        with requests.Session() as session:
+            session.headers.update(PROXY_HEADERS)
+            while time.monotonic() < deadline:
+                operation = random.choices(self.operations, self.weights)[0]
+                started = time.perf_counter()
+                try:
+                    operation, response = actions[operation](session)
+                    status = response.status_code
+                except requests.RequestException:
+                    status = 0
+                if self._recording:
+                    results.append((operation, status, time.perf_counter() - started))
+        with self._lock:
+            self._results.extend(results)
+
+    def _run_for(self, seconds: float):
+        deadline = time.monotonic() + seconds
+        threads = [
+            threading.Thread(target=self._worker, args=(deadline,), name=f'load-{i}')
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run(self, duration: float, warmup: float = 0.0) -> Dict[str, Any]:
+        """
+        Exécute la charge : `warmup` secondes non mesurées puis `duration` secondes mesurées
+
+        Returns:
+            dict: résultats globaux et par opération, statuts HTTP rencontrés
+        """
+        if warmup > 0:
+            self._recording = False
+            self._run_for(warmup)
+        self._results = []
+        self._recording = True
+        started = time.monotonic()
+        self._run_for(duration)
+        elapsed = time.monotonic() - started
+
+        by_operation = {}
+        statuses = {}
+        for operation, status, latency in self._results:
+            entry = by_operation.setdefault(operation, {'latencies': [], 'errors': 0})
+            entry['latencies'].append(latency)
+            entry['errors'] += status != EXPECTED_STATUS[operation]
+            counts = statuses.setdefault(operation, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+        operations = {
+            operation: {**summarize(entry['latencies'], entry['errors'], elapsed), 'statuses': statuses[operation]}
+            for operation, entry in sorted(by_operation.items())
+        }
+        overall = summarize(
+            [latency for _, _, latency in self._results],
+            sum(entry['errors'] for entry in by_operation.values()),
+            elapsed,
+        )
+        return {'duration': round(elapsed, 2), 'overall': overall, 'operations': operations}
+
+
+def compare_to_baseline(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2,
+                        error_tolerance: float = 0.01) -> List[str]:
+    """
+    Régressions par rapport à une exécution de référence
+
+    Un débit inférieur, ou un p95/p99 supérieur, de plus de `tolerance`
+    (fraction) à la référence est une régression, globalement et par opération,
+    de même qu'un taux d'erreurs en hausse de plus de `error_tolerance`.
+
+    Returns:
+        list: description de chaque régression (vide si aucune)
+    """
+    regressions = []
+    sections = [('overall', result['overall'], baseline.get('overall'))]
+    sections += [
+        (name, stats, baseline.get('operations', {}).get(name))
+        for name, stats in result['operations'].items()
+    ]
+    for name, current, reference in sections:
+        if not reference:
+            continue
+        if reference['throughput'] and current['throughput'] < reference['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{name} : débit {current['throughput']} req/s < référence {reference['throughput']} req/s"
+            )
+        for key in ('p95_ms', 'p99_ms'):
+            if reference[key] and current[key] > reference[key] * (1 + tolerance):
+                regressions.append(f"{name} : {key} {current[key]} > référence {reference[key]}")
+        error_rate = current['errors'] / max(current['requests'], 1)
+        if error_rate > reference['errors'] / max(reference['requests'], 1) + error_tolerance:
+            regressions.append(f"{name} : taux d'erreurs en hausse ({current['errors']}/{current['requests']})")
+    return regressions
@@ -0,0 +1,65 @@
+"""
+Commande de mesure des performances de sérialisation et des requêtes
+
+Usage :
+    python manage.py benchmark_lending
+    python manage.py benchmark_lending --rows 50000 --repeat 3
+    python manage.py generate_lendings --count 1000000 && python manage.py benchmark_lending --queries
+    python manage.py benchmark_lending --queries --history benchmarks.jsonl
+"""
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from lending.benchmarks import benchmark_queries, benchmark_serialization
+
+
+class Command(BaseCommand):
+    help = "Compare le débit de sérialisation des prêts (DRF, fast-path, orjson) et mesure les requêtes ORM"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Nombre de prêts sérialisés')
+        parser.add_argument('--repeat', type=int, default=5, help='Nombre de mesures (le meilleur temps est retenu)')
+        parser.add_argument('--queries', action='store_true',
+                            help='Mesure aussi les requêtes ORM sur la table Lending actuelle')
+        parser.add_argument('--samples', type=int, default=200, help='Appels par requête mesurée')
+        parser.add_argument('--history', help='Fichier JSON Lines où ajouter les résultats, comparés au précédent')
+
+    def handle(self, *args, **options):
+        result = benchmark_serialization(options['rows'], options['repeat'])
+        for name, path in result['paths'].items():
+            self.stdout.write(f"{name:<12} {path['rows_per_second']:>10} lignes/s ({path['seconds']}s)")
+        self.stdout.write(f"Accélération : x{result['speedup']}")
+        if not result['identical_output']:
+            raise CommandError('Les chemins de sérialisation ne produisent pas les mêmes octets')
+        record = {'timestamp': timezone.now().isoformat(), 'serialization': result}
+
+        if options['queries']:
+            queries = benchmark_queries(options['repeat'], options['samples'])
+            previous = self._previous(options['history'], queries)
+            self.stdout.write(f"{queries['lendings']} prêts ({queries['database']}) : {queries['by_status']}")
+            for name, timing in queries['queries'].items():
+                line = f"{name:<20} {timing['median_ms']:>10} ms (meilleur {timing['best_ms']} ms)"
+                reference = previous.get(name) if previous else None
+                if reference and reference['median_ms']:
+                    line += f"  x{timing['median_ms'] / reference['median_ms']:.2f} vs précédent"
+                self.stdout.write(line)
+            record['queries'] = queries
+
+        if options['history']:
+            with open(options['history'], 'a', encoding='utf-8') as history:
+                history.write(json.dumps(record) + '\n')
+        self.stdout.write(json.dumps(record))
+
+    def _previous(self, history, queries):
+        """Dernière mesure de l'historique sur une table de même taille et même base"""
+        if not history or not Path(history).exists():
+            return None
+        previous = None
+        for line in Path(history).read_text(encoding='utf-8').splitlines():
+            entry = json.loads(line).get('queries')
+            if entry and entry['lendings'] == queries['lendings'] and entry['database'] == queries['database']:
+                previous = entry['queries']
+        return previous
@@ -0,0 +1,90 @@
+"""
+Commande d'export de l'historique des prêts en CSV ou NDJSON
+
+Usage :
+    python manage.py export_lendings --format csv --output lendings.csv
+    python manage.py export_lendings --since 2026-01-01 --until 2026-02-01 --status RETURNED > janvier.ndjson
+    python manage.py export_lendings --format csv --output lendings.csv --resume   # après une interruption
+"""
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lending.export import export_queryset, iter_export, last_exported_id
+from lending.serializers import LendingExportQuerySerializer
+from lending.streaming import EXPORT_FORMATS, NDJSON
+
+# Progression affichée tous les PROGRESS_EVERY prêts
+PROGRESS_EVERY = 100000
+
+
+class Command(BaseCommand):
+    help = "Exporte les prêts en CSV ou NDJSON, à mémoire constante, avec reprise après le dernier id"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default=NDJSON)
+        parser.add_argument('--since', help="Emprunts à partir de cette date (AAAA-MM-JJ ou ISO 8601, incluse)")
+        parser.add_argument('--until', help="Emprunts avant cette date (exclue)")
+        parser.add_argument('--status', help="Statuts retenus, ex. 'RETURNED,OVERDUE'")
+        parser.add_argument('--fields', help="Champs exportés, ex. 'id,book_id,date_borrowed'")
+        parser.add_argument('--after-id', type=int, default=0, help='Reprendre après cet id (exclu)')
+        parser.add_argument('--limit', type=int, help='Nombre maximal de prêts')
+        parser.add_argument('--output', help='Fichier de sortie (par défaut, la sortie standard)')
+        parser.add_argument('--resume', action='store_true',
+                            help="Compléter --output à partir de son dernier prêt au lieu de l'écraser")
+
+    def handle(self, *args, **options):
+        query = LendingExportQuerySerializer(data={
+            key: value for key, value in (
+                ('stream', options['format']), ('since', options['since']), ('until', options['until']),
+                ('status', options['status']), ('fields', options['fields']),
+                ('after_id', options['after_id']), ('limit', options['limit']),
+            ) if value is not None
+        })
+        if not query.is_valid():
+            raise CommandError(', '.join(f"{name}: {' '.join(map(str, errors))}"
+                                         for name, errors in query.errors.items()))
+        params = query.validated_data
+        output = options['output']
+        if options['resume'] and not output:
+            raise CommandError('--resume nécessite --output')
+
+        after_id = params['after_id']
+        header = True
+        if options['resume'] and os.path.exists(output):
+            after_id = max(after_id, last_exported_id(output, params['stream']))
+            header = os.path.getsize(output) == 0
+            self.stderr.write(f"Reprise de {output} après l'id {after_id}")
+
+        lendings = export_queryset(params.get('since'), params.get('until'), params.get('status'))
+        exported = 0
+        last_id = after_id
+        next_report = PROGRESS_EVERY
+        started = time.monotonic()
+
+        def progress(count, chunk_last_id):
+            nonlocal exported, last_id, next_report
+            exported += count
+            last_id = chunk_last_id
+            if exported >= next_report:
+                self.stderr.write(f"{exported} prêts exportés (dernier id {last_id})")
+                next_report += PROGRESS_EVERY
+
+        content = iter_export(lendings, params['stream'], params.get('fields'), after_id, params.get('limit'),
+                              header=header, progress=progress)
+        target = open(output, 'ab' if options['resume'] else 'wb') if output else sys.stdout.buffer
+        try:
+            for block in content:
+                target.write(block)
+        finally:
+            if output:
+                target.close()
+            else:
+                target.flush()
+
+        duration = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"{exported} prêts exportés en {duration:.1f}s, dernier id {last_id}"
+        ))
@@ -0,0 +1,75 @@
+"""
+Commande de génération d'un jeu de données synthétique de prêts
+
+Usage :
+    python manage.py generate_lendings --count 1000000
+    python manage.py generate_lendings --count 10000000 --users 200000 --user-skew 1.1 --seed 42
+    python manage.py generate_lendings --count 10000 --status-mix RETURNED=0.5,ACTIVE=0.3,OVERDUE=0.2 --clear
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from lending.datasets import DEFAULT_STATUS_MIX, DUE_DISTRIBUTIONS, generate_lendings, parse_status_mix
+from lending.models import Lending
+
+
+class Command(BaseCommand):
+    help = "Insère des prêts synthétiques (bulk_create) pour les mesures de performance"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000, help='Nombre de prêts à créer')
+        parser.add_argument(
+            '--status-mix', default=','.join(f'{status}={share}' for status, share in DEFAULT_STATUS_MIX.items()),
+            help="Proportion de chaque statut, ex. 'RETURNED=0.75,ACTIVE=0.2,OVERDUE=0.05'",
+        )
+        parser.add_argument('--users', type=int, default=10000, help="Nombre d'utilisateurs distincts")
+        parser.add_argument('--user-skew', type=float, default=1.0,
+                            help='Exposant de Zipf de la répartition entre utilisateurs (0 : uniforme)')
+        parser.add_argument('--books', type=int, help='Nombre de livres distincts (défaut : count / 2)')
+        parser.add_argument('--span-days', type=int, default=365, help='Ancienneté maximale des emprunts (jours)')
+        parser.add_argument('--loan-days', type=int, default=60, help="Durée d'un prêt (jours)")
+        parser.add_argument('--due-distribution', choices=DUE_DISTRIBUTIONS, default='uniform',
+                            help='Répartition des échéances dans la période')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Prêts par INSERT')
+        parser.add_argument('--seed', type=int, help='Graine, pour reproduire un jeu de données')
+        parser.add_argument('--clear', action='store_true', help='Supprime tous les prêts existants avant')
+
+    def handle(self, *args, **options):
+        try:
+            status_mix = parse_status_mix(options['status_mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['clear']:
+            deleted, _ = Lending.objects.all().delete()
+            self.stdout.write(f"{deleted} prêts supprimés")
+
+        step = max(options['count'] // 20, options['batch_size'])
+        reported = [0]
+
+        def progress(created):
+            if created - reported[0] >= step or created == options['count']:
+                reported[0] = created
+                self.stdout.write(f"{created}/{options['count']} prêts créés")
+
+        try:
+            result = generate_lendings(
+                options['count'],
+                status_mix=status_mix,
+                users=options['users'],
+                user_skew=options['user_skew'],
+                books=options['books'],
+                span_days=options['span_days'],
+                loan_days=options['loan_days'],
+                due_distribution=options['due_distribution'],
+                batch_size=options['batch_size'],
+                seed=options['seed'],
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['created']} prêts en {result['duration']}s ({result['rows_per_second']} lignes/s) : "
+            + ', '.join(f'{status} {count}' for status, count in result['by_status'].items())
+        ))
+        # bulk_create ne passe pas par les compteurs de lending/stats.py
+        self.stdout.write("Statistiques de /api/stats/ à recalculer : python manage.py rebuild_lending_stats")
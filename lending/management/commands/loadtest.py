@@ -0,0 +1,196 @@
+"""
+Commande de test de charge de bout en bout
+
+Démarre les bouchons des microservices, lance le service (gunicorn, uvicorn
+ou runserver) sur une base SQLite jetable, quelle que soit la base configurée
+(--use-configured-db pour la base configurée), applique la charge puis affiche
+débit et percentiles. Les résultats peuvent servir de référence pour
+détecter les régressions d'une exécution à l'autre.
+
+Usage :
+    python manage.py loadtest --duration 30 --concurrency 20 --save-baseline loadtest-baseline.json
+    python manage.py loadtest --baseline loadtest-baseline.json --tolerance 0.15
+    python manage.py loadtest --server uvicorn --async-views --stub-latency 0.05 --stub-error-rate 0.02
+    python manage.py loadtest --url http://127.0.0.1:8000 --stub-port-base 18001
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lending.loadtest import (
+    DEFAULT_MIX, PROXY_HEADERS, SERVICE_URL_SETTINGS, LoadDriver, compare_to_baseline, parse_mix, start_stubs,
+)
+
+SERVERS = ('gunicorn', 'uvicorn', 'runserver')
+
+
+class Command(BaseCommand):
+    help = "Test de charge de lendBook, returnBook et getExpiredBooks avec des microservices bouchonnés"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=20, help='Durée mesurée (secondes)')
+        parser.add_argument('--warmup', type=float, default=3, help='Durée de chauffe non mesurée (secondes)')
+        parser.add_argument('--concurrency', type=int, default=10, help='Nombre de clients simultanés')
+        parser.add_argument(
+            '--mix', default=','.join(f'{name}={weight}' for name, weight in DEFAULT_MIX.items()),
+            help="Poids des opérations, ex. 'lend=4,return=3,expired=3'",
+        )
+        parser.add_argument('--users', type=int, default=1000, help="Nombre d'utilisateurs distincts")
+        parser.add_argument('--books', type=int, default=100000, help='Nombre de livres distincts')
+        parser.add_argument('--async-views', action='store_true', help='Cibler les vues /api/async/')
+        parser.add_argument('--server', choices=SERVERS, default='gunicorn', help='Serveur lancé pour le service')
+        parser.add_argument('--workers', type=int, default=2, help='Workers du serveur lancé')
+        parser.add_argument('--port', type=int, default=8765, help='Port du serveur lancé')
+        parser.add_argument('--url', help="Service déjà démarré (aucun serveur n'est lancé)")
+        parser.add_argument(
+            '--use-configured-db', action='store_true',
+            help='Migre la base configurée et y écrit les prêts de la charge, au lieu d\'une base SQLite jetable',
+        )
+        parser.add_argument('--stub-latency', type=float, default=0.01, help='Latence des bouchons (secondes)')
+        parser.add_argument('--stub-jitter', type=float, default=0.0, help='Variation de la latence (± secondes)')
+        parser.add_argument('--stub-error-rate', type=float, default=0.0, help='Fraction de réponses 503 des bouchons')
+        parser.add_argument(
+            '--stub-port-base', type=int, default=0,
+            help='Ports fixes des bouchons book, user, notification (base, base+1, base+2) ; utile avec --url',
+        )
+        parser.add_argument('--save-baseline', help='Enregistre les résultats comme référence (JSON)')
+        parser.add_argument('--baseline', help='Compare les résultats à une référence (JSON)')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Écart toléré par rapport à la référence')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        base = options['stub_port_base']
+        ports = {name: base + i for i, name in enumerate(SERVICE_URL_SETTINGS)} if base else None
+        stubs = start_stubs(
+            Path(settings.BASE_DIR) / 'mocks',
+            latency=options['stub_latency'], jitter=options['stub_jitter'],
+            error_rate=options['stub_error_rate'], ports=ports,
+        )
+        for name, stub in stubs.items():
+            self.stdout.write(f"Bouchon {name:<12} {stub.url}")
+
+        server = None
+        workdir = tempfile.TemporaryDirectory(prefix='lending-loadtest-')
+        try:
+            if options['url']:
+                url = options['url']
+            else:
+                server, url = self._start_server(options, stubs, workdir.name)
+            self._wait_ready(url, server, workdir.name)
+
+            driver = LoadDriver(
+                url, mix, concurrency=options['concurrency'], users=options['users'],
+                books=options['books'], async_views=options['async_views'],
+            )
+            self.stdout.write(
+                f"Charge : {options['concurrency']} clients, {options['duration']}s "
+                f"(+{options['warmup']}s de chauffe) sur {url}"
+            )
+            result = driver.run(options['duration'], options['warmup'])
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            for stub in stubs.values():
+                stub.stop()
+            workdir.cleanup()
+
+        result['config'] = {
+            key: options[key] for key in (
+                'duration', 'warmup', 'concurrency', 'mix', 'users', 'books', 'async_views',
+                'server', 'workers', 'url', 'use_configured_db', 'stub_latency', 'stub_jitter', 'stub_error_rate',
+            )
+        }
+        result['stubs'] = {name: stub.stats() for name, stub in stubs.items()}
+        self._report(result)
+
+        if options['save_baseline']:
+            Path(options['save_baseline']).write_text(json.dumps(result, indent=2), encoding='utf-8')
+            self.stdout.write(f"Référence enregistrée dans {options['save_baseline']}")
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text(encoding='utf-8'))
+            regressions = compare_to_baseline(result, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Régressions par rapport à la référence :\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Aucune régression par rapport à la référence'))
+
+    def _start_server(self, options, stubs, workdir):
+        """Lance le service sur une base SQLite jetable (ou la base configurée), pointé vers les bouchons"""
+        env = {
+            **os.environ,
+            'DJANGO_DEBUG': 'False',
+            'DJANGO_ALLOWED_HOSTS': '127.0.0.1,localhost',
+            'PROMETHEUS_MULTIPROC_DIR': os.path.join(workdir, 'prometheus'),
+            **{setting: stubs[name].url for name, setting in SERVICE_URL_SETTINGS.items()},
+        }
+        if options['use_configured_db']:
+            self.stdout.write(self.style.WARNING(
+                f"Les prêts de la charge sont écrits dans la base configurée ({settings.DATABASES['default']['NAME']})"
+            ))
+        else:
+            # Jamais la base configurée (PostgreSQL de production sur un pod) : migrate et
+            # les milliers de prêts synthétiques vont dans une base SQLite supprimée à la fin
+            env['DATABASE_ENGINE'] = 'django.db.backends.sqlite3'
+            env['DATABASE_NAME'] = os.path.join(workdir, 'loadtest.sqlite3')
+        os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+        subprocess.run(
+            [sys.executable, 'manage.py', 'migrate', '--noinput', '-v', '0'],
+            cwd=settings.BASE_DIR, env=env, check=True,
+        )
+
+        host, port, workers = '127.0.0.1', str(options['port']), str(options['workers'])
+        command = {
+            'gunicorn': [
+                sys.executable, '-m', 'gunicorn', '-c', 'docker/gunicorn.conf.py', '--bind', f'{host}:{port}',
+                '--workers', workers, 'projet.wsgi:application',
+            ],
+            'uvicorn': [
+                sys.executable, '-m', 'uvicorn', 'projet.asgi:application', '--host', host, '--port', port,
+                '--workers', workers, '--log-level', 'warning',
+            ],
+            'runserver': [sys.executable, 'manage.py', 'runserver', f'{host}:{port}', '--noreload'],
+        }[options['server']]
+        with open(os.path.join(workdir, 'server.log'), 'wb') as log:
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        return server, f'http://{host}:{port}'
+
+    def _wait_ready(self, url, server, workdir, timeout=30.0):
+        """Attend que le health check réponde"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                log = Path(workdir, 'server.log').read_text(errors='replace')
+                raise CommandError(f"Le serveur s'est arrêté au démarrage :\n{log[-2000:]}")
+            try:
+                if requests.get(f'{url}/api/health/', headers=PROXY_HEADERS, timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f"Le service ne répond pas sur {url} après {timeout}s")
+
+    def _report(self, result):
+        header = f"{'opération':<10} {'requêtes':>9} {'erreurs':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+        self.stdout.write(header)
+        rows = [*result['operations'].items(), ('total', result['overall'])]
+        for name, stats in rows:
+            self.stdout.write(
+                f"{name:<10} {stats['requests']:>9} {stats['errors']:>8} {stats['throughput']:>9} "
+                f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+            )
+        self.stdout.write(json.dumps(result))
@@ -0,0 +1,29 @@
+"""
+Commande de recalcul des statistiques des prêts
+
+Usage :
+    python manage.py rebuild_lending_stats              # recalcul complet
+    python manage.py rebuild_lending_stats --if-empty   # seulement si jamais calculées (démarrage)
+"""
+from django.core.management.base import BaseCommand
+
+from lending.stats import is_rollup_empty, rebuild_lending_stats
+
+
+class Command(BaseCommand):
+    help = "Recalcule les statistiques des prêts (/api/stats/) à partir de la table Lending"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Lignes par INSERT')
+        parser.add_argument('--if-empty', action='store_true',
+                            help='Ne rien faire si les statistiques ont déjà été calculées')
+
+    def handle(self, *args, **options):
+        if options['if_empty'] and not is_rollup_empty():
+            self.stdout.write('Statistiques déjà calculées')
+            return
+        stats = rebuild_lending_stats(batch_size=options['batch_size'])
+        self.stdout.write(
+            f"{sum(stats['by_status'].values())} prêts, {stats['books']} livres et {stats['days']} jours "
+            f"recomptés en {stats['duration']}s"
+        )
@@ -0,0 +1,60 @@
+"""
+Commande de relais de l'outbox des mises à jour de disponibilité
+
+Usage :
+    python manage.py relay_book_availability          # boucle continue
+    python manage.py relay_book_availability --once   # un seul lot
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from lending.outbox import purge_processed, relay_book_availability
+from lending.services import book_service
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Relaie les mises à jour de disponibilité de l'outbox vers le microservice Book Management"
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'BOOK_AVAILABILITY_OUTBOX', {})
+        parser.add_argument('--once', action='store_true', help='Traiter un seul lot puis quitter')
+        parser.add_argument('--batch-size', type=int, default=config.get('BATCH_SIZE', 100))
+        parser.add_argument('--interval', type=float, default=config.get('POLL_INTERVAL', 1.0),
+                            help='Attente en secondes lorsque l\'outbox est vide')
+        parser.add_argument('--lease', type=float, default=config.get('LEASE_SECONDS', 60))
+        parser.add_argument('--retention-days', type=int, default=config.get('RETENTION_DAYS', 7))
+
+    def handle(self, *args, **options):
+        config = getattr(settings, 'BOOK_AVAILABILITY_OUTBOX', {})
+        last_purge = 0.0
+        while True:
+            stats = relay_book_availability(
+                book_service,
+                batch_size=options['batch_size'],
+                lease_seconds=options['lease'],
+                retry_backoff=config.get('RETRY_BACKOFF', 1.0),
+                max_backoff=config.get('MAX_BACKOFF', 300.0),
+            )
+            if stats['claimed']:
+                logger.info(
+                    f"Outbox : {stats['claimed']} lignes, {stats['sent']} envoyées, "
+                    f"{stats['deduplicated']} dédoublonnées, {stats['failed']} en échec"
+                )
+            if options['once']:
+                self.stdout.write(str(stats))
+                return
+
+            if time.monotonic() - last_purge > 3600:
+                purge_processed(options['retention_days'])
+                last_purge = time.monotonic()
+
+            if stats['claimed'] < options['batch_size']:
+                # Connexion rendue au pool (ou vérifiée) pendant l'attente
+                close_old_connections()
+                time.sleep(options['interval'])
@@ -0,0 +1,47 @@
+"""
+Commande de passage des prêts échus au statut OVERDUE
+
+Usage :
+    python manage.py sweep_overdue_lendings          # boucle continue
+    python manage.py sweep_overdue_lendings --once   # un seul passage
+    python manage.py sweep_overdue_lendings --full   # ignorer le point de reprise
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from lending.sweeper import sweep_overdue_lendings
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Passe en OVERDUE les prêts actifs dont l'échéance est dépassée"
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'OVERDUE_SWEEPER', {})
+        parser.add_argument('--once', action='store_true', help='Faire un seul passage puis quitter')
+        parser.add_argument('--full', action='store_true',
+                            help='Parcourir toutes les échéances, pas seulement depuis le dernier passage')
+        parser.add_argument('--batch-size', type=int, default=config.get('BATCH_SIZE', 1000))
+        parser.add_argument('--interval', type=float, default=config.get('INTERVAL', 60.0),
+                            help='Attente en secondes entre deux passages')
+
+    def handle(self, *args, **options):
+        # En boucle, le premier passage est complet : il rattrape les prêts insérés avec une échéance passée
+        full = not options['once']
+        while True:
+            stats = sweep_overdue_lendings(batch_size=options['batch_size'], full=full or options['full'])
+            if options['once']:
+                self.stdout.write(
+                    f"{stats['swept']} prêts passés en OVERDUE en {stats['batches']} lots "
+                    f"({stats['duration']}s), point de reprise {stats['high_water_mark']}"
+                )
+                return
+            full = False
+            # Connexion rendue au pool (ou vérifiée) pendant l'attente
+            close_old_connections()
+            time.sleep(options['interval'])
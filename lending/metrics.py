@@ -0,0 +1,264 @@
+"""
+Métriques Prometheus du service Lending Management
+
+Exposées sur /metrics (annotation prometheus.io/path du déploiement). Sous
+gunicorn ou uvicorn avec plusieurs workers, PROMETHEUS_MULTIPROC_DIR doit
+désigner un répertoire vide au démarrage : chaque processus y écrit ses
+valeurs et la vue agrège les fichiers de tous les workers, quel que soit
+celui qui répond au scrape (voir docker/gunicorn.conf.py).
+"""
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from django.db import DatabaseError
+from django.db.models import Sum
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from .dbpool import get_db_pool_stats
+from .models import LendingStatusCount
+from .timing import current_profile, record_phase, record_query, request_profile_scope
+
+logger = logging.getLogger(__name__)
+
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+# Statuts exposés par la jauge lending_lendings
+GAUGE_STATUSES = ('ACTIVE', 'OVERDUE')
+
+REQUESTS = Counter(
+    'lending_http_requests_total', 'Requêtes HTTP traitées, par vue', ['view', 'method', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'lending_http_request_duration_seconds', 'Durée des requêtes HTTP, par vue', ['view', 'method'],
+)
+DB_QUERY_LATENCY = Histogram(
+    'lending_db_query_duration_seconds', 'Durée des requêtes SQL, par vue', ['view'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'lending_db_queries_per_request', 'Nombre de requêtes SQL par requête HTTP, par vue', ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DEPENDENCY_LATENCY = Histogram(
+    'lending_dependency_request_duration_seconds', 'Durée des appels aux microservices, par tentative',
+    ['service', 'method', 'endpoint', 'outcome'],
+)
+DEPENDENCY_ERRORS = Counter(
+    'lending_dependency_errors_total', 'Appels aux microservices en échec, par type d\'erreur',
+    ['service', 'method', 'endpoint', 'error'],
+)
+IDEMPOTENT_REQUESTS = Counter(
+    'lending_idempotent_requests_total', 'Requêtes POST avec Idempotency-Key, par issue', ['outcome'],
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'lending_db_pool_connections', 'Connexions du pool PostgreSQL, par état (in_use, idle, max)',
+    ['alias', 'state'], multiprocess_mode='livesum',
+)
+DB_POOL_WAITING = Gauge(
+    'lending_db_pool_waiting', 'Requêtes en attente d\'une connexion du pool', ['alias'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_CHECKOUTS = Counter(
+    'lending_db_pool_checkouts_total', 'Connexions empruntées au pool', ['alias'],
+)
+DB_POOL_WAIT = Counter(
+    'lending_db_pool_wait_seconds_total', 'Attente cumulée des connexions du pool', ['alias'],
+)
+DB_POOL_TIMEOUTS = Counter(
+    'lending_db_pool_timeouts_total', 'Emprunts abandonnés faute de connexion libre (DATABASE_POOL_TIMEOUT)',
+    ['alias'],
+)
+DB_POOL_LOST = Counter(
+    'lending_db_pool_connections_lost_total', 'Connexions du pool trouvées fermées ou rendues en mauvais état',
+    ['alias'],
+)
+BREAKER_STATE = Gauge(
+    'lending_circuit_breaker_state', 'État du disjoncteur (0 fermé, 1 semi-ouvert, 2 ouvert)', ['service'],
+    multiprocess_mode='livemax',
+)
+
+# Statistiques des pools publiées au plus une fois par intervalle (secondes)
+DB_POOL_METRICS_INTERVAL = 1.0
+
+_db_pool_published = 0.0
+_db_pool_totals = {}
+
+_SEGMENT_PATTERNS = (
+    (re.compile(r'^\d+$'), '{id}'),
+    (re.compile(r'@'), '{email}'),
+)
+
+
+def view_label(request) -> str:
+    """Nom de la route (lending/urls.py) servie par la requête"""
+    match = getattr(request, 'resolver_match', None)
+    return match.url_name if match is not None and match.url_name else 'unmatched'
+
+
+def endpoint_template(endpoint: str) -> str:
+    """
+    Chemin d'un appel sortant sans ses identifiants, pour borner la cardinalité
+
+    Exemple : '/getBooks/42' -> '/getBooks/{id}', '/users/a@b.fr' -> '/users/{email}'
+    """
+    segments = endpoint.split('?', 1)[0].split('/')
+    for i, segment in enumerate(segments):
+        for pattern, placeholder in _SEGMENT_PATTERNS:
+            if pattern.search(segment):
+                segments[i] = placeholder
+                break
+    return '/'.join(segments)
+
+
+@contextmanager
+def request_metrics_scope(request):
+    """
+    Mesure une requête HTTP : nombre, durée et requêtes SQL, labellisés par vue
+
+    Le statut de la réponse est à renseigner dans `status` du profil produit
+    (voir lending/timing.py).
+    """
+    started = time.perf_counter()
+    with request_profile_scope(request) as profile:
+        try:
+            yield profile
+        finally:
+            elapsed = time.perf_counter() - started
+            view = view_label(request)
+            method = request.method if request.method in HTTP_METHODS else 'other'
+            REQUESTS.labels(view, method, str(profile.status)).inc()
+            REQUEST_LATENCY.labels(view, method).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(view).observe(profile.count('db'))
+            publish_db_pool_stats()
+
+
+def observe_query(execute, sql, params, many, context):
+    """execute_wrapper mesurant chaque requête SQL ; hors requête HTTP, la vue est 'none'"""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        profile = current_profile()
+        view = 'none' if profile is None else view_label(profile.request)
+        DB_QUERY_LATENCY.labels(view).observe(duration)
+        record_query(sql, duration)
+
+
+def install_query_observer(sender, connection, **kwargs):
+    """
+    Récepteur de connection_created : instrumente chaque connexion une seule fois
+
+    Inséré en tête de liste pour que les execute_wrapper temporaires, retirés
+    par pop(), ne le retirent pas à leur place.
+    """
+    if observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, observe_query)
+
+
+def observe_dependency_call(service: str, method: str, endpoint: str, latency: float, outcome: str):
+    """
+    Enregistre une tentative d'appel à un microservice
+
+    Args:
+        outcome: 'success', 'client_error' (4xx) ou le type d'erreur
+            ('timeout', 'connection_error', 'server_error', 'error', 'cancelled')
+    """
+    record_phase(service, latency)
+    template = endpoint_template(endpoint)
+    DEPENDENCY_LATENCY.labels(service, method, template, outcome).observe(latency)
+    if outcome not in ('success', 'client_error'):
+        DEPENDENCY_ERRORS.labels(service, method, template, outcome).inc()
+
+
+def record_circuit_open(service: str, method: str, endpoint: str):
+    """Appel refusé par le disjoncteur, sans tentative"""
+    DEPENDENCY_ERRORS.labels(service, method, endpoint_template(endpoint), 'circuit_open').inc()
+
+
+def record_idempotent_request(outcome: str):
+    """Issue d'une requête avec Idempotency-Key : executed, replayed, in_progress ou mismatch"""
+    IDEMPOTENT_REQUESTS.labels(outcome).inc()
+
+
+def publish_db_pool_stats(force: bool = False):
+    """
+    Reporte les statistiques des pools de connexions du processus dans les métriques
+
+    Appelé en fin de requête, au plus une fois par DB_POOL_METRICS_INTERVAL ;
+    les compteurs cumulés du pool sont convertis en incréments.
+    """
+    global _db_pool_published
+    now = time.monotonic()
+    if not force and now - _db_pool_published < DB_POOL_METRICS_INTERVAL:
+        return
+    _db_pool_published = now
+    for stats in get_db_pool_stats():
+        alias = stats['alias']
+        for state in ('in_use', 'idle'):
+            DB_POOL_CONNECTIONS.labels(alias, state).set(stats[state])
+        DB_POOL_CONNECTIONS.labels(alias, 'max').set(stats['max_size'])
+        DB_POOL_WAITING.labels(alias).set(stats['waiting'])
+        previous = _db_pool_totals.get(alias, {})
+        for key, counter in (('checkouts', DB_POOL_CHECKOUTS), ('wait_seconds', DB_POOL_WAIT),
+                             ('timeouts', DB_POOL_TIMEOUTS), ('connections_lost', DB_POOL_LOST)):
+            delta = stats[key] - previous.get(key, 0)
+            if delta > 0:
+                counter.labels(alias).inc(delta)
+        _db_pool_totals[alias] = stats
+
+
+def set_breaker_state(service: str, value: int):
+    BREAKER_STATE.labels(service).set(value)
+
+
+class LendingStatusCollector:
+    """
+    Jauges des prêts ACTIVE et OVERDUE, lues à chaque scrape
+
+    Lues dans la table LendingStatusCount (lending/stats.py), tenue à jour
+    à chaque prêt, retour et passage en OVERDUE : quelques lignes par statut
+    au lieu d'un décompte de la table des prêts. La valeur vient de la base
+    et ne dépend donc pas du worker interrogé.
+    """
+
+    def collect(self):
+        try:
+            counts = dict(
+                LendingStatusCount.objects.filter(status__in=GAUGE_STATUSES)
+                .values_list('status').annotate(total=Sum('count')).order_by()
+            )
+        except DatabaseError as e:
+            logger.error(f"Impossible de compter les prêts pour /metrics: {str(e)}")
+            return
+        gauge = GaugeMetricFamily('lending_lendings', 'Prêts par statut', labels=['status'])
+        for status in GAUGE_STATUSES:
+            gauge.add_metric([status], counts.get(status, 0))
+        yield gauge
+
+
+_status_registry = CollectorRegistry(auto_describe=False)
+_status_registry.register(LendingStatusCollector())
+
+
+def is_multiprocess() -> bool:
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def metrics_view(request):
+    """Exposition au format texte Prometheus"""
+    publish_db_pool_stats(force=True)
+    if is_multiprocess():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry) + generate_latest(_status_registry)
+    return HttpResponse(body, content_type=CONTENT_TYPE_LATEST)
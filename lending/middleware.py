@@ -0,0 +1,100 @@
+"""
+Middlewares du service Lending Management
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .cache import request_cache_scope
+from .metrics import request_metrics_scope
+from .timing import get_profiling_config, log_if_slow, request_profile_scope
+
+
+class RequestCacheMiddleware:
+    """
+    Ouvre un cache de requête pour que les appels aux microservices
+    ne soient jamais répétés au cours d'une même requête HTTP
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with request_cache_scope():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_cache_scope():
+            return await self.get_response(request)
+
+
+class PrometheusMetricsMiddleware:
+    """
+    Compte et chronomètre chaque requête HTTP par vue (voir lending/metrics.py)
+
+    Placé en tête de MIDDLEWARE pour mesurer l'ensemble de la chaîne.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with request_metrics_scope(request) as metrics:
+            response = self.get_response(request)
+            metrics.status = response.status_code
+            return response
+
+    async def __acall__(self, request):
+        with request_metrics_scope(request) as metrics:
+            response = await self.get_response(request)
+            metrics.status = response.status_code
+            return response
+
+
+class ServerTimingMiddleware:
+    """
+    Renvoie la décomposition du temps de la requête dans l'en-tête Server-Timing
+    (SQL, appels aux microservices, sérialisation ; voir lending/timing.py) et
+    journalise les requêtes lentes échantillonnées
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        config = get_profiling_config()
+        self.server_timing = config['SERVER_TIMING']
+        self.slow_threshold = config['SLOW_REQUEST_THRESHOLD']
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with request_profile_scope(request) as profile:
+            return self._finish(profile, self.get_response(request))
+
+    async def __acall__(self, request):
+        with request_profile_scope(request) as profile:
+            return self._finish(profile, await self.get_response(request))
+
+    def _finish(self, profile, response):
+        profile.status = response.status_code
+        # Réponse en streaming : seule la préparation précède l'envoi de l'en-tête
+        if self.server_timing:
+            response['Server-Timing'] = profile.server_timing()
+        log_if_slow(profile, self.slow_threshold)
+        return response
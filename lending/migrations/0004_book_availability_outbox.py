@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0003_lending_date_returned_lending_status_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookAvailabilityOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("book_id", models.PositiveIntegerField()),
+                ("available", models.BooleanField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("claimed_until", models.DateTimeField(blank=True, null=True)),
+                ("processed_at", models.DateTimeField(blank=True, null=True)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                (
+                    "last_error",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["processed_at", "next_attempt_at"],
+                        name="lending_boo_process_0c556b_idx",
+                    ),
+                    models.Index(
+                        fields=["book_id"], name="lending_boo_book_id_262df2_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0004_book_availability_outbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OverdueSweepState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("high_water_mark", models.DateTimeField(blank=True, null=True)),
+                ("last_run_at", models.DateTimeField(blank=True, null=True)),
+                ("last_duration", models.FloatField(default=0)),
+                ("last_swept", models.PositiveIntegerField(default=0)),
+                ("last_batches", models.PositiveIntegerField(default=0)),
+                ("total_swept", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
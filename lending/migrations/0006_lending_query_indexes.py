@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0005_overdue_sweep_state"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="lending",
+            name="lending_len_status_9cf3f7_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="lending",
+            name="lending_len_date_du_8a0519_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="lending",
+            name="lending_len_user_em_ce0f12_idx",
+        ),
+        migrations.AlterUniqueTogether(
+            name="lending",
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name="lending",
+            index=models.Index(
+                fields=["status", "date_due"], name="lending_status_due_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lending",
+            index=models.Index(
+                fields=["book_id", "status"], name="lending_book_status_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="lending",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "ACTIVE")),
+                fields=("user_email", "book_id"),
+                name="lending_unique_active_loan",
+            ),
+        ),
+    ]
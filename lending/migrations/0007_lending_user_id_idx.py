@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0006_lending_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="lending",
+            index=models.Index(fields=["user_email", "id"], name="lending_user_id_idx"),
+        ),
+    ]
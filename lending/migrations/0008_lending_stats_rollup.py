@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0007_lending_user_id_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookLendingCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("book_id", models.PositiveIntegerField(unique=True)),
+                ("lend_count", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["lend_count", "book_id"], name="lending_book_count_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyLendingVolume",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("shard", models.PositiveSmallIntegerField(default=0)),
+                ("lent", models.BigIntegerField(default=0)),
+                ("returned", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "shard"), name="lending_daily_volume_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="LendingStatusCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("ACTIVE", "Active"),
+                            ("RETURNED", "Returned"),
+                            ("OVERDUE", "Overdue"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("shard", models.PositiveSmallIntegerField(default=0)),
+                ("count", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("status", "shard"), name="lending_status_count_unique"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0008_lending_stats_rollup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lendingstatuscount",
+            name="changes",
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lending", "0010_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="lending",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status__in", ["ACTIVE", "OVERDUE"])),
+                fields=("book_id",),
+                name="lending_unique_open_book_loan",
+            ),
+        ),
+    ]
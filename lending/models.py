@@ -13,6 +13,8 @@ class Lending(models.Model):
         ('RETURNED', 'Returned'),
         ('OVERDUE', 'Overdue'),
     ]
+    # Statuts d'un prêt en cours : le livre est entre les mains de l'emprunteur
+    OPEN_STATUSES = ('ACTIVE', 'OVERDUE')
     
     user_email = models.EmailField()  # Champ pour stocker l'adresse e-mail de l'utilisateur
     book_id = models.PositiveIntegerField()  # ID du livre dans le microservice Book Management
@@ -22,12 +24,31 @@ class Lending(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='ACTIVE')
     
     class Meta:
-        # Empêcher qu'un utilisateur emprunte plusieurs fois le même livre
-        unique_together = [['user_email', 'book_id', 'status']]
+        constraints = [
+            # Empêcher qu'un utilisateur emprunte plusieurs fois le même livre en même temps ;
+            # les prêts retournés, eux, peuvent s'accumuler. Sert aussi d'index pour
+            # user_email = … AND book_id = … AND status = 'ACTIVE'.
+            models.UniqueConstraint(
+                fields=['user_email', 'book_id'],
+                condition=models.Q(status='ACTIVE'),
+                name='lending_unique_active_loan',
+            ),
+            # Un livre n'a qu'un prêt en cours, tous utilisateurs confondus : tant que
+            # l'outbox n'a pas relayé l'indisponibilité au service des livres, c'est
+            # cette contrainte qui refuse un second emprunt (autre utilisateur, autre worker)
+            models.UniqueConstraint(
+                fields=['book_id'],
+                condition=models.Q(status__in=['ACTIVE', 'OVERDUE']),
+                name='lending_unique_open_book_loan',
+            ),
+        ]
         indexes = [
-            models.Index(fields=['status']),
-            models.Index(fields=['date_due']),
-            models.Index(fields=['user_email']),
+            # Livres expirés et sweeper : status = … AND date_due < … ORDER BY date_due
+            models.Index(fields=['status', 'date_due'], name='lending_status_due_idx'),
+            # Retour groupé sans email : book_id IN (…) AND status = 'ACTIVE'
+            models.Index(fields=['book_id', 'status'], name='lending_book_status_idx'),
+            # Prêts d'un utilisateur, tous statuts : user_email = … ORDER BY id (pagination keyset)
+            models.Index(fields=['user_email', 'id'], name='lending_user_id_idx'),
         ]
 
     def __str__(self):
@@ -38,3 +59,134 @@ class Lending(models.Model):
         if self.status == 'ACTIVE' and self.date_due < timezone.now():
             return True
         return False
+
+
+class BookAvailabilityOutbox(models.Model):
+    """
+    Mises à jour de disponibilité à transmettre au microservice Book Management
+
+    Les lignes sont écrites dans la même transaction que le prêt, puis relayées
+    par la commande relay_book_availability : aucune requête HTTP n'est faite
+    pendant que la transaction est ouverte.
+    """
+    book_id = models.PositiveIntegerField()
+    available = models.BooleanField()
+    created_at = models.DateTimeField(default=timezone.now)
+    next_attempt_at = models.DateTimeField(default=timezone.now)  # backoff entre deux tentatives
+    claimed_until = models.DateTimeField(null=True, blank=True)  # bail du relais qui traite la ligne
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.CharField(max_length=255, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'next_attempt_at']),
+            models.Index(fields=['book_id']),
+        ]
+
+    def __str__(self):
+        return f"Outbox {self.id} - Book ID: {self.book_id}, Available: {self.available}"
+
+
+class OverdueSweepState(models.Model):
+    """
+    Point de reprise (high-water mark) et bilan du dernier passage du sweeper
+
+    Les prêts dont l'échéance est antérieure à high_water_mark ont déjà été
+    traités : chaque passage ne parcourt que la plage d'échéances écoulée depuis.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_duration = models.FloatField(default=0)  # en secondes
+    last_swept = models.PositiveIntegerField(default=0)
+    last_batches = models.PositiveIntegerField(default=0)
+    total_swept = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sweep {self.name} - High-water mark: {self.high_water_mark}, Last swept: {self.last_swept}"
+
+
+class LendingStatusCount(models.Model):
+    """
+    Nombre de prêts par statut, tenu à jour dans la transaction de chaque changement
+
+    Chaque statut est réparti sur plusieurs lignes (shard) : les prêts
+    concurrents n'attendent pas tous le verrou d'une même ligne. Le total
+    d'un statut est la somme de ses lignes. La somme de `changes` sur toutes
+    les lignes est la version de la table Lending (ETag des lectures).
+    """
+    status = models.CharField(max_length=10, choices=Lending.STATUS_CHOICES)
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.BigIntegerField(default=0)
+    changes = models.BigIntegerField(default=0)  # mises à jour de la ligne, jamais décrémenté
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'shard'], name='lending_status_count_unique'),
+        ]
+
+    def __str__(self):
+        return f"Status {self.status}/{self.shard} - Count: {self.count}"
+
+
+class BookLendingCount(models.Model):
+    """Nombre d'emprunts de chaque livre, pour les livres les plus empruntés"""
+    book_id = models.PositiveIntegerField(unique=True)
+    lend_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Livres les plus empruntés : ORDER BY lend_count DESC LIMIT …
+            models.Index(fields=['lend_count', 'book_id'], name='lending_book_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"Book ID: {self.book_id} - Lendings: {self.lend_count}"
+
+
+class DailyLendingVolume(models.Model):
+    """Emprunts et retours par jour (fuseau TIME_ZONE), répartis sur plusieurs lignes comme LendingStatusCount"""
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    lent = models.BigIntegerField(default=0)
+    returned = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'shard'], name='lending_daily_volume_unique'),
+        ]
+
+    def __str__(self):
+        return f"Day {self.day}/{self.shard} - Lent: {self.lent}, Returned: {self.returned}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Réponse mémorisée d'une requête POST portant un en-tête Idempotency-Key
+
+    Tant que status_code est nul, la requête est en cours de traitement par
+    `owner` jusqu'à locked_until ; ensuite, la réponse est rejouée à
+    l'identique pour toute requête de même clé jusqu'à expires_at.
+    """
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)  # chemin de la requête
+    fingerprint = models.CharField(max_length=64)  # empreinte du corps, pour détecter une réutilisation de clé
+    owner = models.CharField(max_length=32)  # jeton de la requête qui traite la clé
+    locked_until = models.DateTimeField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.BinaryField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['endpoint', 'key'], name='lending_idempotency_key_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='lending_idempotency_exp_idx'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency-Key {self.key} - {self.endpoint}, Status: {self.status_code}"
@@ -0,0 +1,237 @@
+"""
+Envoi des notifications en arrière-plan
+
+Les vues déposent les notifications dans une file bornée ; un thread du
+worker les envoie par lots, hors du chemin de la requête HTTP, avec des
+tentatives espacées (backoff exponentiel) en cas d'échec.
+"""
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from django.conf import settings
+
+from .services import book_service, notification_service
+from .utils import NotificationHelper
+
+logger = logging.getLogger(__name__)
+
+LENDING_CONFIRMATION = 'lending_confirmation'
+RETURN_CONFIRMATION = 'return_confirmation'
+# Retour de plusieurs livres d'un même utilisateur : book_id est alors une liste d'IDs
+GROUPED_RETURN_CONFIRMATION = 'grouped_return_confirmation'
+
+
+class NotificationDispatcher:
+    """
+    File de notifications bornée, vidée par lots par un thread d'arrière-plan
+
+    En mode synchrone (ASYNC=False), les notifications sont envoyées
+    immédiatement, comme avant l'introduction de la file.
+    """
+
+    def __init__(self, notification_service, book_service, config: Dict[str, Any] = None):
+        config = config or {}
+        self.notification_service = notification_service
+        self.book_service = book_service
+        self.async_mode = config.get('ASYNC', True)
+        self.maxsize = config.get('QUEUE_MAX_SIZE', 1000)
+        self.batch_size = config.get('BATCH_SIZE', 20)
+        self.batch_wait = config.get('BATCH_WAIT', 0.05)
+        self.max_retries = config.get('MAX_RETRIES', 3)
+        self.retry_backoff = config.get('RETRY_BACKOFF', 1.0)
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._reset()
+        atexit.register(self.shutdown)
+
+    def _reset(self):
+        """État propre au processus : file, tentatives en attente, thread et compteurs"""
+        self._queue = queue.Queue(maxsize=self.maxsize)
+        self._retries = []
+        self._thread = None
+        self._stopping = threading.Event()
+        # Protège les latences, ajoutées par le worker et lues par stats()
+        self._lock = threading.Lock()
+        self._send_latencies = deque(maxlen=1000)
+        self._queue_latencies = deque(maxlen=1000)
+        self.enqueued = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def _ensure_worker(self):
+        """Démarre le thread d'envoi dans le processus courant (après le fork gunicorn)"""
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != pid:
+                self._reset()
+                self._pid = pid
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='notification-dispatcher', daemon=True
+                )
+                self._thread.start()
+
+    def enqueue(self, message_type: str, user_email: str, book_id: int, date_due=None) -> bool:
+        """
+        Dépose une notification dans la file
+
+        Returns:
+            bool: False si la file est pleine et la notification abandonnée
+        """
+        job = {
+            'message_type': message_type,
+            'user_email': user_email,
+            'book_id': book_id,
+            'date_due': date_due,
+            'attempts': 0,
+            'enqueued_at': time.monotonic(),
+        }
+        if not self.async_mode:
+            return self._send(job)
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"File de notifications pleine, notification {message_type} pour {user_email} abandonnée")
+            return False
+        self.enqueued += 1
+        return True
+
+    def _send(self, job: Dict[str, Any]) -> bool:
+        """Envoie une notification via le microservice"""
+        started = time.monotonic()
+        if job['message_type'] == LENDING_CONFIRMATION:
+            success = NotificationHelper.send_lending_notification(
+                self.notification_service, self.book_service,
+                job['user_email'], job['book_id'], job['date_due']
+            )
+        elif job['message_type'] == GROUPED_RETURN_CONFIRMATION:
+            success = NotificationHelper.send_grouped_return_notification(
+                self.notification_service, self.book_service,
+                job['user_email'], job['book_id']
+            )
+        else:
+            success = NotificationHelper.send_return_notification(
+                self.notification_service, self.book_service,
+                job['user_email'], job['book_id']
+            )
+        with self._lock:
+            self._send_latencies.append(time.monotonic() - started)
+        return success
+
+    def _next_batch(self):
+        """Attend la première notification puis complète le lot pendant batch_wait"""
+        now = time.monotonic()
+        batch = []
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._retries)[2])
+
+        timeout = self.batch_wait if batch else 0.5
+        if self._retries:
+            timeout = min(timeout, max(self._retries[0][0] - now, 0))
+        deadline = now + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+            # Une fois le lot entamé, on n'attend plus que batch_wait
+            deadline = min(deadline, time.monotonic() + self.batch_wait)
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            for job in batch:
+                self._process(job)
+
+    def _process(self, job: Dict[str, Any]):
+        """Envoie une notification et planifie une nouvelle tentative si besoin"""
+        from_queue = job['attempts'] == 0
+        if from_queue:
+            with self._lock:
+                self._queue_latencies.append(time.monotonic() - job['enqueued_at'])
+        try:
+            success = self._send(job)
+        except Exception as e:
+            logger.warning(f"Erreur lors de l'envoi de la notification: {str(e)}")
+            success = False
+
+        if success:
+            self.sent += 1
+        elif job['attempts'] < self.max_retries:
+            job['attempts'] += 1
+            self.retried += 1
+            delay = self.retry_backoff * (2 ** (job['attempts'] - 1)) * (0.5 + random.random())
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), job))
+        else:
+            self.failed += 1
+            logger.error(
+                f"Notification {job['message_type']} pour {job['user_email']} abandonnée "
+                f"après {job['attempts'] + 1} tentatives"
+            )
+        if from_queue:
+            self._queue.task_done()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Attend que la file soit vidée (tentatives différées exclues)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def shutdown(self, timeout: float = 5.0):
+        """Vide la file avant l'arrêt du worker"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            self.flush(timeout)
+            self._stopping.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Profondeur de la file, compteurs et latences d'envoi"""
+        with self._lock:
+            send_latencies = list(self._send_latencies)
+            queue_latencies = list(self._queue_latencies)
+        send_latencies.sort()
+        queue_latencies.sort()
+
+        def percentile(values, ratio):
+            return round(values[min(int(len(values) * ratio), len(values) - 1)], 4) if values else None
+
+        return {
+            'async': self.async_mode,
+            'queue_depth': self._queue.qsize(),
+            'pending_retries': len(self._retries),
+            'queue_max_size': self.maxsize,
+            'enqueued': self.enqueued,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'send_latency_p50': percentile(send_latencies, 0.5),
+            'send_latency_p99': percentile(send_latencies, 0.99),
+            'queue_latency_p50': percentile(queue_latencies, 0.5),
+            'queue_latency_p99': percentile(queue_latencies, 0.99),
+        }
+
+
+notification_dispatcher = NotificationDispatcher(
+    notification_service, book_service, getattr(settings, 'NOTIFICATION_DISPATCH', {})
+)
@@ -0,0 +1,254 @@
+"""
+Opérations d'écriture sur les prêts, partagées par les vues synchrones et asynchrones
+"""
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from .models import Lending, BookAvailabilityOutbox
+from .notifications import (
+    notification_dispatcher, LENDING_CONFIRMATION, RETURN_CONFIRMATION, GROUPED_RETURN_CONFIRMATION,
+)
+from .services import book_service
+from .stats import record_lent, record_returned
+
+
+def create_lending(user_email, book_id):
+    """
+    Crée un prêt actif et programme la mise à jour de disponibilité du livre
+    
+    L'absence de prêt en cours n'est pas vérifiée au préalable : l'INSERT
+    échoue sur lending_unique_active_loan (l'utilisateur a déjà ce livre) ou
+    sur lending_unique_open_book_loan (le livre est prêté à un autre
+    utilisateur). La seconde ferme la fenêtre pendant laquelle le service des
+    livres, pas encore prévenu par l'outbox, le dit toujours disponible ; les
+    deux restent correctes quand des requêtes concurrentes empruntent le même livre.
+    
+    Args:
+        user_email: Email de l'utilisateur
+        book_id: ID du livre
+    
+    Returns:
+        Lending: Le prêt créé, ou None si le livre a déjà un prêt en cours
+    """
+    # Transaction pour créer le prêt et marquer le livre comme indisponible
+    try:
+        with transaction.atomic():
+            lending = Lending.objects.create(
+                user_email=user_email,
+                book_id=book_id,
+                status='ACTIVE'
+            )
+            
+            # Marquer le livre comme indisponible (relayé par l'outbox, hors transaction)
+            BookAvailabilityOutbox.objects.create(book_id=book_id, available=False)
+            record_lent([book_id], lending.date_borrowed)
+    except IntegrityError:
+        return None
+    book_service.apply_cached_availability(book_id, False)
+    
+    # Envoyer la notification en arrière-plan
+    notification_dispatcher.enqueue(LENDING_CONFIRMATION, user_email, book_id, lending.date_due)
+    return lending
+
+
+def create_lendings(user_email, book_ids):
+    """
+    Crée plusieurs prêts actifs en une seule transaction (bulk_create)
+    
+    Args:
+        user_email: Email de l'utilisateur
+        book_ids: IDs des livres à emprunter
+    
+    Returns:
+        tuple: (prêts créés, IDs des livres déjà empruntés entre-temps, par cet utilisateur ou un autre)
+    """
+    conflicts = set()
+    try:
+        with transaction.atomic():
+            created = Lending.objects.bulk_create([
+                Lending(user_email=user_email, book_id=book_id, status='ACTIVE') for book_id in book_ids
+            ])
+            BookAvailabilityOutbox.objects.bulk_create([
+                BookAvailabilityOutbox(book_id=book_id, available=False) for book_id in book_ids
+            ])
+            record_lent(book_ids)
+    except IntegrityError:
+        # Un prêt concurrent est apparu depuis la vérification : repli ligne par ligne
+        created = []
+        with transaction.atomic():
+            for book_id in book_ids:
+                try:
+                    with transaction.atomic():
+                        created.append(Lending.objects.create(
+                            user_email=user_email, book_id=book_id, status='ACTIVE'
+                        ))
+                except IntegrityError:
+                    conflicts.add(book_id)
+            BookAvailabilityOutbox.objects.bulk_create([
+                BookAvailabilityOutbox(book_id=lending.book_id, available=False) for lending in created
+            ])
+            record_lent([lending.book_id for lending in created])
+    
+    for lending in created:
+        book_service.apply_cached_availability(lending.book_id, False)
+        notification_dispatcher.enqueue(LENDING_CONFIRMATION, user_email, lending.book_id, lending.date_due)
+    return created, conflicts
+
+
+def supports_update_returning(connection) -> bool:
+    """UPDATE … RETURNING : PostgreSQL, et SQLite à partir de 3.35"""
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+
+def _update_returning(using, filters, values):
+    """
+    UPDATE … RETURNING paramétré : met à jour les prêts filtrés et les relit dans la même requête
+    
+    Args:
+        using: Alias de la base
+        filters: Conditions d'égalité par champ (une liste de valeurs donne un IN)
+        values: Nouvelles valeurs par champ
+    
+    Returns:
+        list: Les prêts mis à jour, valeurs converties comme par l'ORM (Manager.raw)
+    """
+    connection = connections[using]
+    meta = Lending._meta
+    quote = connection.ops.quote_name
+    assignments, conditions, params = [], [], []
+    for name, value in values.items():
+        field = meta.get_field(name)
+        assignments.append(f'{quote(field.column)} = %s')
+        params.append(field.get_db_prep_save(value, connection))
+    for name, value in filters.items():
+        field = meta.get_field(name)
+        if isinstance(value, (list, tuple, set)):
+            conditions.append(f"{quote(field.column)} IN ({', '.join(['%s'] * len(value))})")
+            params.extend(field.get_db_prep_value(item, connection) for item in value)
+        else:
+            conditions.append(f'{quote(field.column)} = %s')
+            params.append(field.get_db_prep_value(value, connection))
+    returning = ', '.join(quote(field.column) for field in meta.concrete_fields)
+    statement = (
+        f"UPDATE {quote(meta.db_table)} SET {', '.join(assignments)} "
+        f"WHERE {' AND '.join(conditions)} RETURNING {returning}"
+    )
+    return list(Lending.objects.raw(statement, params, using=using))
+
+
+def _update_without_returning(using, filters, values):
+    """
+    Repli sans RETURNING (mêmes arguments que _update_returning) : lecture
+    des prêts puis UPDATE conditionnel par id, sans réécrire les autres colonnes
+    
+    Si l'UPDATE modifie moins de lignes que lues (prêts clôturés entre-temps
+    par une autre requête), les prêts effectivement clôturés sont relus.
+    """
+    lookups = {f'{name}__in' if isinstance(value, list) else name: value for name, value in filters.items()}
+    lendings = list(Lending.objects.using(using).filter(**lookups))
+    ids = [lending.id for lending in lendings]
+    if not ids:
+        return []
+    updated = Lending.objects.using(using).filter(id__in=ids, **lookups).update(**values)
+    if updated != len(ids):
+        closed_ids = set(Lending.objects.using(using).filter(id__in=ids, **values).values_list('id', flat=True))
+        lendings = [lending for lending in lendings if lending.id in closed_ids]
+    for lending in lendings:
+        for name, value in values.items():
+            setattr(lending, name, value)
+    return lendings
+
+
+def close_lendings(using, filters, values):
+    """
+    UPDATE conditionnel des prêts filtrés, qui renvoie les prêts effectivement modifiés
+    
+    Un seul UPDATE … RETURNING quand la base le permet, sinon le repli
+    _update_without_returning ; les deux reçoivent les mêmes arguments que
+    _update_returning, et la même base (using).
+    """
+    if supports_update_returning(connections[using]):
+        return _update_returning(using, filters, values)
+    return _update_without_returning(using, filters, values)
+
+
+def return_lending(user_email, book_id):
+    """
+    Clôture le prêt actif d'un livre et programme la remise à disposition du livre
+    
+    Un seul UPDATE conditionnel (status = 'ACTIVE') trouve et clôture le prêt ;
+    avec RETURNING, la même requête renvoie le prêt mis à jour. Deux retours
+    concurrents du même prêt ne peuvent donc pas réussir tous les deux.
+    
+    Args:
+        user_email: Email de l'utilisateur
+        book_id: ID du livre
+    
+    Returns:
+        Lending: Le prêt clôturé, ou None si aucun prêt actif ne correspond
+    """
+    filters = {'user_email': user_email, 'book_id': book_id, 'status': 'ACTIVE'}
+    now = timezone.now()
+    values = {'status': 'RETURNED', 'date_returned': now}
+    using = router.db_for_write(Lending)
+    
+    # Transaction pour marquer le prêt comme retourné et le livre comme disponible
+    with transaction.atomic(using=using):
+        lendings = close_lendings(using, filters, values)
+        if not lendings:
+            return None
+        lending = lendings[0]
+        
+        # Marquer le livre comme disponible (relayé par l'outbox, hors transaction)
+        BookAvailabilityOutbox.objects.create(book_id=lending.book_id, available=True)
+        record_returned(1, 'ACTIVE', now)
+    book_service.apply_cached_availability(lending.book_id, True)
+    
+    # Envoyer la notification de retour en arrière-plan
+    notification_dispatcher.enqueue(RETURN_CONFIRMATION, lending.user_email, lending.book_id)
+    return lending
+
+
+def return_lendings(book_ids, user_email=None):
+    """
+    Clôture en une seule requête UPDATE les prêts actifs de plusieurs livres
+    
+    Avec RETURNING, le même UPDATE conditionnel (status = 'ACTIVE') trouve,
+    clôture et renvoie les prêts : un prêt clôturé entre-temps par une autre
+    requête n'est ni compté ni notifié.
+    
+    Args:
+        book_ids: IDs des livres retournés
+        user_email: Restreindre aux prêts de cet utilisateur (optionnel)
+    
+    Returns:
+        list: Les prêts clôturés
+    """
+    filters = {'book_id': list(book_ids), 'status': 'ACTIVE'}
+    if user_email:
+        filters['user_email'] = user_email
+    now = timezone.now()
+    values = {'status': 'RETURNED', 'date_returned': now}
+    using = router.db_for_write(Lending)
+    
+    with transaction.atomic(using=using):
+        lendings = close_lendings(using, filters, values)
+        if not lendings:
+            return []
+        BookAvailabilityOutbox.objects.bulk_create([
+            BookAvailabilityOutbox(book_id=lending.book_id, available=True) for lending in lendings
+        ])
+        record_returned(len(lendings), when=now)
+    
+    # Une notification par utilisateur pour l'ensemble de ses livres
+    books_by_user = {}
+    for lending in lendings:
+        book_service.apply_cached_availability(lending.book_id, True)
+        books_by_user.setdefault(lending.user_email, []).append(lending.book_id)
+    for email, returned_book_ids in books_by_user.items():
+        notification_dispatcher.enqueue(GROUPED_RETURN_CONFIRMATION, email, returned_book_ids)
+    return lendings
@@ -0,0 +1,94 @@
+"""
+Relais de l'outbox des mises à jour de disponibilité vers Book Management
+"""
+import logging
+from datetime import timedelta
+from typing import Any, Dict
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import BookAvailabilityOutbox
+from .utils import update_book_availability_safe
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts: int, base: float = 1.0, maximum: float = 300.0) -> timedelta:
+    """Backoff exponentiel plafonné avant la prochaine tentative"""
+    return timedelta(seconds=min(base * (2 ** max(attempts - 1, 0)), maximum))
+
+
+def _claim_batch(batch_size: int, lease_seconds: float):
+    """
+    Réserve un lot de lignes en attente pour ce relais
+
+    Les livres dont une ligne est déjà réservée par un autre relais sont
+    ignorés afin de préserver l'ordre des mises à jour d'un même livre.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        claimed_books = BookAvailabilityOutbox.objects.filter(
+            processed_at__isnull=True, claimed_until__gt=now
+        ).values('book_id')
+        pending = BookAvailabilityOutbox.objects.filter(
+            processed_at__isnull=True, next_attempt_at__lte=now
+        ).exclude(book_id__in=claimed_books).order_by('id')
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        rows = list(pending[:batch_size])
+        BookAvailabilityOutbox.objects.filter(id__in=[row.id for row in rows]).update(
+            claimed_until=now + timedelta(seconds=lease_seconds)
+        )
+    return rows
+
+
+def relay_book_availability(book_service, batch_size: int = 100, lease_seconds: float = 60,
+                            retry_backoff: float = 1.0, max_backoff: float = 300.0) -> Dict[str, Any]:
+    """
+    Transmet un lot de mises à jour de disponibilité au microservice
+
+    Seul le dernier état de chaque livre est envoyé : les mises à jour
+    intermédiaires du lot sont marquées comme traitées sans appel HTTP.
+
+    Returns:
+        dict: nombre de lignes lues, d'appels envoyés, dédoublonnés et en échec
+    """
+    rows = _claim_batch(batch_size, lease_seconds)
+    latest_by_book = {}
+    for row in rows:
+        latest_by_book[row.book_id] = row
+
+    sent = failed = 0
+    # Ordre FIFO : les livres sont traités dans l'ordre de leur dernière mise à jour
+    for book_id, latest in sorted(latest_by_book.items(), key=lambda item: item[1].id):
+        group = BookAvailabilityOutbox.objects.filter(
+            book_id=book_id, id__lte=latest.id, processed_at__isnull=True
+        )
+        if update_book_availability_safe(book_service, book_id, latest.available):
+            group.update(processed_at=timezone.now(), claimed_until=None)
+            sent += 1
+        else:
+            attempts = latest.attempts + 1
+            group.update(
+                attempts=attempts,
+                next_attempt_at=timezone.now() + retry_delay(attempts, retry_backoff, max_backoff),
+                claimed_until=None,
+                last_error='Mise à jour de disponibilité refusée ou service injoignable',
+            )
+            failed += 1
+            logger.warning(f"Outbox : échec de la tentative {attempts} pour le livre {book_id}")
+
+    return {
+        'claimed': len(rows),
+        'sent': sent,
+        'deduplicated': len(rows) - len(latest_by_book),
+        'failed': failed,
+    }
+
+
+def purge_processed(retention_days: int) -> int:
+    """Supprime les lignes traitées depuis plus de retention_days jours"""
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = BookAvailabilityOutbox.objects.filter(processed_at__lt=cutoff).delete()
+    return deleted
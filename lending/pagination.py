@@ -0,0 +1,133 @@
+"""
+Pagination par clé (keyset) pour les listes de prêts
+
+La page suivante est obtenue par un filtre sur les colonnes de tri
+(WHERE (date_due, id) > (…)), servi par l'index, au lieu d'un OFFSET dont
+le coût croît avec la position. Le curseur est opaque pour les clients.
+Aucun COUNT(*) n'est exécuté : le décompte, facultatif, est borné
+(bounded_count).
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.urls import replace_query_param
+
+
+class InvalidCursor(ValueError):
+    """Curseur ou taille de page invalide fourni par le client"""
+
+
+class KeysetPagination:
+    """
+    Pagination keyset sur des champs de tri uniques ensemble (le dernier étant l'id)
+
+    Args:
+        ordering: Champs de tri, par ordre croissant
+        params: Paramètres de la requête (cursor, page_size)
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+
+    def __init__(self, ordering: Sequence[str], params):
+        config = getattr(settings, 'KEYSET_PAGINATION', {})
+        self.ordering = tuple(ordering)
+        self.max_page_size = config.get('MAX_PAGE_SIZE', 1000)
+        self.max_count = config.get('MAX_COUNT', 10000)
+        self.page_size = getattr(settings, 'REST_FRAMEWORK', {}).get('PAGE_SIZE', 20)
+        # Taille de page demandée : réponse dans l'enveloppe {next, results}
+        self.page_size_requested = bool(params.get(self.page_size_query_param))
+        if self.page_size_requested:
+            try:
+                self.page_size = int(params[self.page_size_query_param])
+            except ValueError:
+                raise InvalidCursor('Taille de page invalide')
+            if self.page_size < 1:
+                raise InvalidCursor('Taille de page invalide')
+            self.page_size = min(self.page_size, self.max_page_size)
+        self.position = self.decode_cursor(params.get(self.cursor_query_param))
+
+    @staticmethod
+    def encode_cursor(values: Sequence[Any]) -> str:
+        """Encode la position (valeurs des champs de tri) en curseur opaque"""
+        payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor: Optional[str]) -> Optional[List[Any]]:
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        except (ValueError, UnicodeDecodeError):
+            raise InvalidCursor('Curseur invalide')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor('Curseur invalide')
+        return values
+
+    def _typed_position(self, model) -> List[Any]:
+        """Convertit les valeurs du curseur selon le type des champs de tri"""
+        typed = []
+        for name, value in zip(self.ordering, self.position):
+            field = model._meta.get_field(name)
+            if isinstance(field, models.DateTimeField):
+                value = parse_datetime(value) if isinstance(value, str) else None
+            elif isinstance(field, models.IntegerField) and not isinstance(value, int):
+                value = None
+            if value is None:
+                raise InvalidCursor('Curseur invalide')
+            typed.append(value)
+        return typed
+
+    def paginate_queryset(self, queryset):
+        """Trie, filtre après la position du curseur et limite à une page (+1 pour savoir s'il reste des lignes)"""
+        queryset = queryset.order_by(*self.ordering)
+        if self.position is not None:
+            position = self._typed_position(queryset.model)
+            # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+            after = Q()
+            for index, name in enumerate(self.ordering):
+                condition = Q(**{f'{name}__gt': position[index]})
+                for previous in range(index):
+                    condition &= Q(**{self.ordering[previous]: position[previous]})
+                after |= condition
+            queryset = queryset.filter(after)
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, rows: List[Any]) -> Tuple[List[Any], Optional[str]]:
+        """Coupe la page (en place, le type de la liste est conservé) et calcule le curseur de la page suivante"""
+        if len(rows) <= self.page_size:
+            return rows, None
+        del rows[self.page_size:]
+        last = rows[-1]
+        values = [last[name] if isinstance(last, dict) else getattr(last, name) for name in self.ordering]
+        return rows, self.encode_cursor(values)
+
+    def get_next_url(self, request, next_cursor: Optional[str]) -> Optional[str]:
+        """URL de la page suivante (mêmes paramètres, curseur remplacé)"""
+        if not next_cursor:
+            return None
+        return replace_query_param(request.build_absolute_uri(), self.cursor_query_param, next_cursor)
+
+    def get_paginated_data(self, request, results: List[Dict[str, Any]], next_cursor: Optional[str]) -> Dict[str, Any]:
+        """Enveloppe de réponse : lien vers la page suivante et résultats"""
+        return {'next': self.get_next_url(request, next_cursor), 'results': results}
+
+    def get_link_header(self, request, next_cursor: Optional[str]) -> Optional[str]:
+        """En-tête Link (RFC 8288) vers la page suivante, pour les réponses sans enveloppe"""
+        next_url = self.get_next_url(request, next_cursor)
+        return f'<{next_url}>; rel="next"' if next_url else None
+
+    def bounded_count(self, queryset) -> Tuple[int, bool]:
+        """
+        Compte au plus max_count lignes (COUNT sur une sous-requête LIMIT)
+
+        Returns:
+            tuple: (nombre de lignes, vrai si le décompte est exact)
+        """
+        count = queryset.order_by().values('pk')[:self.max_count + 1].count()
+        return min(count, self.max_count), count <= self.max_count
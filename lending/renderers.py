@@ -0,0 +1,71 @@
+"""
+Rendu JSON rapide des réponses de l'API
+"""
+from rest_framework.renderers import JSONRenderer
+
+from .timing import phase
+
+try:
+    import orjson
+except ImportError:  # orjson absent : rendu standard de DRF
+    orjson = None
+
+_SCALAR_TYPES = frozenset((str, int, bool, type(None)))
+
+
+class ScalarRows(list):
+    """
+    Lignes sérialisées dont toutes les valeurs sont des str, int, bool ou None
+
+    Produites par LendingRowSerializer : le renderer n'a pas besoin de les
+    parcourir pour vérifier qu'orjson les rendra comme json.dumps.
+    """
+
+
+def _needs_standard_encoder(data) -> bool:
+    """
+    Vrai si les données contiennent une valeur qu'orjson ne rend pas comme json.dumps
+
+    Les flottants (notation exponentielle différente) et les types confiés à
+    l'encodeur de DRF (dates, Decimal, chaînes paresseuses…) sont concernés.
+    """
+    if isinstance(data, ScalarRows):
+        return False
+    if isinstance(data, dict):
+        values = data.values()
+    elif isinstance(data, (list, tuple)):
+        values = data
+    else:
+        return type(data) not in _SCALAR_TYPES
+    return any(type(value) not in _SCALAR_TYPES and _needs_standard_encoder(value) for value in values)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer accéléré par orjson, produisant exactement les mêmes octets
+
+    Les cas où orjson diffère de json.dumps passent par le rendu standard :
+    indentation demandée, valeurs non scalaires, clés non textuelles ou
+    entiers de plus de 64 bits.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with phase('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if data is None:
+            return b''
+        if (orjson is None
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or _needs_standard_encoder(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Comme JSONRenderer : U+2028 et U+2029 sont échappés pour JavaScript
+        if not ret.isascii():
+            ret = ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return ret
@@ -0,0 +1,332 @@
+"""
+Disjoncteurs et budget de tentatives pour les appels aux microservices
+
+Chaque microservice a son disjoncteur (fermé, ouvert, semi-ouvert) : lorsque
+le taux d'erreurs ou d'appels lents dépasse un seuil, les appels échouent
+immédiatement au lieu d'occuper un worker jusqu'au timeout. Les nouvelles
+tentatives sont espacées (backoff exponentiel avec jitter) et limitées par
+un budget proportionnel au trafic, pour ne pas amplifier une panne.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from .metrics import set_breaker_state
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Valeur de la jauge lending_circuit_breaker_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Méthodes rejouables sans effet de bord supplémentaire
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+# Configuration par défaut, surchargée par settings.MICROSERVICE_RESILIENCE
+DEFAULT_RESILIENCE_CONFIG = {
+    'CONNECT_TIMEOUT': 2.0,
+    'TIMEOUT': 5.0,
+    'MAX_RETRIES': 2,
+    'RETRY_BACKOFF': 0.1,
+    'RETRY_MAX_BACKOFF': 1.0,
+    'RETRY_BUDGET_RATIO': 0.2,
+    'RETRY_BUDGET_MIN_PER_SECOND': 1.0,
+    'BREAKER_WINDOW': 30.0,
+    'BREAKER_MIN_CALLS': 10,
+    'BREAKER_FAILURE_RATE': 0.5,
+    'BREAKER_SLOW_CALL_THRESHOLD': 2.0,
+    'BREAKER_SLOW_CALL_RATE': 0.8,
+    'BREAKER_OPEN_SECONDS': 15.0,
+    'BREAKER_HALF_OPEN_CALLS': 3,
+}
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur sur fenêtre glissante
+
+    Fermé : les appels passent et leurs résultats sont comptés sur `window`
+    secondes. Au-delà de `min_calls` appels, un taux d'échecs ou d'appels
+    lents trop élevé ouvre le circuit. Ouvert : les appels sont refusés
+    pendant `open_seconds`. Semi-ouvert : `half_open_calls` appels d'essai
+    passent ; s'ils réussissent tous le circuit se referme, sinon il se rouvre.
+    """
+
+    def __init__(self, name: str, window: float = 30.0, min_calls: int = 10, failure_rate: float = 0.5,
+                 slow_call_threshold: float = 2.0, slow_call_rate: float = 0.8, open_seconds: float = 15.0,
+                 half_open_calls: int = 3):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_threshold = slow_call_threshold
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._reset()
+
+    def _reset(self):
+        """État propre au processus (appelé aussi après un fork)"""
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._calls = deque()  # (horodatage, échec, lent)
+        self._failures = 0
+        self._slow = 0
+        self._trial_calls = 0
+        self._trial_successes = 0
+        self.rejected = 0
+        self.transitions = {}
+        self.recent_transitions = deque(maxlen=20)
+        set_breaker_state(self.name, STATE_VALUES[CLOSED])
+
+    def _transition(self, state: str, now: float):
+        previous = self._state
+        self._state = state
+        key = f'{previous}->{state}'
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.recent_transitions.append({'at': time.time(), 'from': previous, 'to': state})
+        set_breaker_state(self.name, STATE_VALUES[state])
+        if state == OPEN:
+            self._opened_at = now
+        elif state == HALF_OPEN:
+            self._trial_calls = 0
+            self._trial_successes = 0
+        elif state == CLOSED:
+            self._calls.clear()
+            self._failures = 0
+            self._slow = 0
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Disjoncteur {self.name} : {previous} -> {state}")
+
+    def _refresh(self, now: float):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN, now)
+        elif self._state == HALF_OPEN and now - self._opened_at >= 2 * self.open_seconds:
+            # Appels d'essai restés sans réponse : on en autorise de nouveaux
+            self._opened_at = now - self.open_seconds
+            self._trial_calls = self._trial_successes
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._calls and self._calls[0][0] < cutoff:
+            _, failed, slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Vrai si l'appel peut être tenté ; chaque appel autorisé doit être suivi d'un record_*"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._trial_calls < self.half_open_calls:
+                self._trial_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency: float):
+        self._record(False, latency)
+
+    def record_failure(self, latency: float):
+        self._record(True, latency)
+
+    def _record(self, failed: bool, latency: float):
+        now = time.monotonic()
+        slow = latency >= self.slow_call_threshold
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._transition(OPEN, now)
+                else:
+                    self._trial_successes += 1
+                    if self._trial_successes >= self.half_open_calls:
+                        self._transition(CLOSED, now)
+                return
+            if self._state == OPEN:
+                # Réponse d'un appel parti avant l'ouverture du circuit
+                return
+
+            self._calls.append((now, failed, slow))
+            self._failures += failed
+            self._slow += slow
+            self._expire(now)
+            total = len(self._calls)
+            if total >= self.min_calls and (
+                self._failures / total >= self.failure_rate or self._slow / total >= self.slow_call_rate
+            ):
+                self._transition(OPEN, now)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            self._expire(now)
+            total = len(self._calls)
+            return {
+                'state': self._state,
+                'calls_in_window': total,
+                'failure_rate': round(self._failures / total, 4) if total else 0.0,
+                'slow_call_rate': round(self._slow / total, 4) if total else 0.0,
+                'rejected': self.rejected,
+                'transitions': dict(self.transitions),
+                'recent_transitions': list(self.recent_transitions),
+            }
+
+
+class RetryBudget:
+    """
+    Budget de nouvelles tentatives sur une fenêtre glissante
+
+    Les tentatives supplémentaires sont limitées à `ratio` fois le nombre de
+    requêtes de la fenêtre, plus un minimum par seconde pour le trafic faible.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._requests = deque()
+        self._retries = deque()
+        self.retried = 0
+        self.exhausted = 0
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        for timestamps in (self._requests, self._retries):
+            while timestamps and timestamps[0] < cutoff:
+                timestamps.popleft()
+
+    def record_request(self):
+        with self._lock:
+            self._requests.append(time.monotonic())
+
+    def try_acquire(self) -> bool:
+        """Réserve une nouvelle tentative si le budget le permet"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            allowed = self.min_per_second * self.window + self.ratio * len(self._requests)
+            if len(self._retries) >= allowed:
+                self.exhausted += 1
+                return False
+            self._retries.append(now)
+            self.retried += 1
+            return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {
+                'requests_in_window': len(self._requests),
+                'retries_in_window': len(self._retries),
+                'retried': self.retried,
+                'budget_exhausted': self.exhausted,
+            }
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Backoff exponentiel avec jitter complet : uniforme entre 0 et base * 2^(attempt-1)"""
+    return random.uniform(0, min(maximum, base * (2 ** max(attempt - 1, 0))))
+
+
+class ServiceResilience:
+    """Délais, disjoncteur et budget de tentatives d'un microservice, partagés par ses clients"""
+
+    def __init__(self, service_name: str, config: Optional[Dict[str, Any]] = None):
+        config = {**DEFAULT_RESILIENCE_CONFIG, **(config or {})}
+        self.service_name = service_name
+        self.connect_timeout = config['CONNECT_TIMEOUT']
+        self.timeout = config['TIMEOUT']
+        self.max_retries = config['MAX_RETRIES']
+        self.retry_backoff = config['RETRY_BACKOFF']
+        self.retry_max_backoff = config['RETRY_MAX_BACKOFF']
+        self.breaker = CircuitBreaker(
+            service_name,
+            window=config['BREAKER_WINDOW'],
+            min_calls=config['BREAKER_MIN_CALLS'],
+            failure_rate=config['BREAKER_FAILURE_RATE'],
+            slow_call_threshold=config['BREAKER_SLOW_CALL_THRESHOLD'],
+            slow_call_rate=config['BREAKER_SLOW_CALL_RATE'],
+            open_seconds=config['BREAKER_OPEN_SECONDS'],
+            half_open_calls=config['BREAKER_HALF_OPEN_CALLS'],
+        )
+        self.retry_budget = RetryBudget(
+            ratio=config['RETRY_BUDGET_RATIO'],
+            min_per_second=config['RETRY_BUDGET_MIN_PER_SECOND'],
+        )
+
+    def retry_delay(self, method: str, attempt: int) -> Optional[float]:
+        """
+        Délai avant la tentative suivante, ou None s'il ne faut pas réessayer
+
+        Args:
+            method: Méthode HTTP (seules les méthodes idempotentes sont rejouées)
+            attempt: Numéro de la tentative qui vient d'échouer (1 pour le premier appel)
+        """
+        if method.upper() not in IDEMPOTENT_METHODS or attempt > self.max_retries:
+            return None
+        if not self.retry_budget.try_acquire():
+            logger.warning(f"Budget de tentatives épuisé pour le service {self.service_name}")
+            return None
+        return backoff_delay(attempt, self.retry_backoff, self.retry_max_backoff)
+
+    def _reset(self):
+        self.breaker._reset()
+        self.retry_budget._reset()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'service': self.service_name, **self.breaker.stats(), **self.retry_budget.stats()}
+
+
+_registry: Dict[str, ServiceResilience] = {}
+_registry_lock = threading.Lock()
+
+
+def get_resilience(service_name: str) -> ServiceResilience:
+    """Politique du service, créée depuis settings.MICROSERVICE_RESILIENCE à la première demande"""
+    policy = _registry.get(service_name)
+    if policy is None:
+        with _registry_lock:
+            policy = _registry.get(service_name)
+            if policy is None:
+                config = getattr(settings, 'MICROSERVICE_RESILIENCE', {}).get(service_name, {})
+                policy = _registry[service_name] = ServiceResilience(service_name, config)
+    return policy
+
+
+def get_resilience_stats() -> List[Dict[str, Any]]:
+    """État des disjoncteurs et budgets de tentatives du processus courant"""
+    return [policy.stats() for policy in list(_registry.values())]
+
+
+def _reset_after_fork():
+    """Un worker gunicorn ne doit hériter ni des verrous ni de l'état du processus parent"""
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    for policy in _registry.values():
+        policy._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,5 +1,9 @@
-from rest_framework import serializers
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
 from .models import Lending
+from .renderers import ScalarRows
+from .streaming import EXPORT_FORMATS, NDJSON
 
 class LendingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -7,6 +11,65 @@ class LendingSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_email', 'book_id', 'date_borrowed', 'date_due', 'date_returned', 'status']
         read_only_fields = ['id', 'date_borrowed']
 
+class LendingRowSerializer:
+    """
+    Sérialisation rapide des prêts lus avec .values_list(*LendingRowSerializer.fields)
+
+    Produit les mêmes dictionnaires que LendingSerializer, sans instancier de
+    modèle ni de champ DRF par ligne : le fuseau horaire est résolu une fois
+    pour toutes les lignes. Avec `fields`, seuls ces champs sont produits, lus
+    dans cet ordre (les colonnes supplémentaires en fin de ligne sont ignorées).
+    """
+    fields = tuple(LendingSerializer.Meta.fields)
+    datetime_fields = frozenset(('date_borrowed', 'date_due', 'date_returned'))
+
+    def __init__(self, fields=None):
+        self.timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+        if fields:
+            self.fields = tuple(fields)
+
+    def format_datetime(self, value):
+        """Même rendu ISO 8601 que serializers.DateTimeField"""
+        if value is None:
+            return None
+        if self.timezone is not None and value.tzinfo is not None:
+            value = value.astimezone(self.timezone)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    def to_representation(self, row):
+        return self.serialize((row,))[0]
+
+    def serialize(self, rows):
+        if self.fields != LendingRowSerializer.fields:
+            return self._serialize_fields(rows)
+        format_datetime = self.format_datetime
+        return ScalarRows(
+            {
+                'id': lending_id,
+                'user_email': user_email,
+                'book_id': book_id,
+                'date_borrowed': format_datetime(date_borrowed),
+                'date_due': format_datetime(date_due),
+                'date_returned': format_datetime(date_returned),
+                'status': status,
+            }
+            for lending_id, user_email, book_id, date_borrowed, date_due, date_returned, status in rows
+        )
+
+    def _serialize_fields(self, rows):
+        """Sélection partielle des champs (?fields=)"""
+        formatters = [
+            (name, self.format_datetime if name in self.datetime_fields else None) for name in self.fields
+        ]
+        return ScalarRows(
+            {
+                name: format_value(value) if format_value else value
+                for (name, format_value), value in zip(formatters, row)
+            }
+            for row in rows
+        )
+
 class LendBookSerializer(serializers.Serializer):
     """Serializer pour l'endpoint lendBook"""
     user_email = serializers.EmailField()
@@ -16,3 +79,68 @@ class ReturnBookSerializer(serializers.Serializer):
     """Serializer pour l'endpoint returnBook"""
     user_email = serializers.EmailField()
     book_id = serializers.IntegerField(min_value=1)
+
+class LendBooksSerializer(serializers.Serializer):
+    """Serializer pour l'endpoint lendBooks (plusieurs livres pour un utilisateur)"""
+    user_email = serializers.EmailField()
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=getattr(settings, 'BULK_MAX_ITEMS', 500)
+    )
+
+class LendingRowsQuerySerializer(serializers.Serializer):
+    """Filtre par statut (?status=) et sélection des champs (?fields=) des listes de prêts"""
+    status = serializers.CharField(required=False)
+    fields = serializers.CharField(required=False)
+
+    def validate_status(self, value):
+        """'ACTIVE,OVERDUE' -> ['ACTIVE', 'OVERDUE']"""
+        statuses = list(dict.fromkeys(item.strip().upper() for item in value.split(',') if item.strip()))
+        allowed = {choice for choice, _ in Lending.STATUS_CHOICES}
+        unknown = [item for item in statuses if item not in allowed]
+        if unknown or not statuses:
+            raise serializers.ValidationError(f"Statut invalide, valeurs possibles : {', '.join(sorted(allowed))}")
+        return statuses
+
+    def validate_fields(self, value):
+        """'id,book_id' -> ('id', 'book_id'), dans l'ordre demandé"""
+        fields = tuple(dict.fromkeys(item.strip() for item in value.split(',') if item.strip()))
+        unknown = [item for item in fields if item not in LendingRowSerializer.fields]
+        if unknown or not fields:
+            raise serializers.ValidationError(
+                f"Champ invalide, valeurs possibles : {', '.join(LendingRowSerializer.fields)}"
+            )
+        return fields
+
+class UserLendingsQuerySerializer(LendingRowsQuerySerializer):
+    """Paramètres de l'endpoint lendings (prêts d'un utilisateur)"""
+    user_email = serializers.EmailField()
+    count = serializers.BooleanField(required=False, default=False)
+
+class LendingExportQuerySerializer(LendingRowsQuerySerializer):
+    """Paramètres de l'endpoint lendings/export (dates d'emprunt : since inclus, until exclu)"""
+    stream = serializers.ChoiceField(choices=EXPORT_FORMATS, required=False, default=NDJSON)
+    since = serializers.DateTimeField(required=False, input_formats=[ISO_8601, '%Y-%m-%d'])
+    until = serializers.DateTimeField(required=False, input_formats=[ISO_8601, '%Y-%m-%d'])
+    after_id = serializers.IntegerField(required=False, min_value=0, default=0)
+    limit = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, attrs):
+        if attrs.get('since') and attrs.get('until') and attrs['since'] >= attrs['until']:
+            raise serializers.ValidationError({'until': 'until doit être postérieur à since'})
+        return attrs
+
+class StatsQuerySerializer(serializers.Serializer):
+    """Paramètres de l'endpoint stats"""
+    top = serializers.IntegerField(required=False, min_value=1, max_value=100)
+    days = serializers.IntegerField(required=False, min_value=1, max_value=366)
+
+class ReturnBooksSerializer(serializers.Serializer):
+    """Serializer pour l'endpoint returnBooks (boîte de retour : l'utilisateur est optionnel)"""
+    user_email = serializers.EmailField(required=False)
+    book_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1,
+        max_length=getattr(settings, 'BULK_MAX_ITEMS', 500)
+    )
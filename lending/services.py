@@ -1,59 +1,241 @@
+import os
+import threading
+import time
+import weakref
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from django.conf import settings
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+
+from .cache import TTLCache
+from .metrics import observe_dependency_call, record_circuit_open
+from .resilience import get_resilience
 
 logger = logging.getLogger(__name__)
 
+# Configuration par défaut des pools HTTP, surchargée par settings.MICROSERVICE_HTTP_POOLS
+DEFAULT_HTTP_POOL_CONFIG = {
+    'POOL_CONNECTIONS': 2,
+    'POOL_MAXSIZE': 10,
+    'POOL_BLOCK': False,
+    'KEEP_ALIVE': True,
+}
+
+class ServiceUnavailableError(Exception):
+    """Le microservice est injoignable (timeout, connexion refusée ou erreur 5xx)"""
+
+
+class CircuitOpenError(ServiceUnavailableError):
+    """Le disjoncteur du microservice est ouvert : l'appel n'a pas été tenté"""
+
+
+# Clients vivants, réinitialisés dans le processus enfant après un fork
+_clients = weakref.WeakSet()
+
+
+def _reset_clients_after_fork():
+    """Oublie les sessions héritées du processus parent (workers gunicorn)"""
+    for client in list(_clients):
+        client._reset_session()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
 class MicroserviceClient:
     """Client de base pour communiquer avec les microservices"""
     
-    def __init__(self, base_url: str, timeout: int = 30):
+    # Clé de configuration du service dans settings.MICROSERVICE_HTTP_POOLS
+    service_name = 'default'
+    
+    def __init__(self, base_url: str, timeout: Optional[float] = None):
         self.base_url = base_url.rstrip('/')
-        self.timeout = timeout
+        # Délais, disjoncteur et budget de tentatives (settings.MICROSERVICE_RESILIENCE)
+        self.resilience = get_resilience(self.service_name)
+        self.timeout = timeout if timeout is not None else self.resilience.timeout
+        self.connect_timeout = min(self.resilience.connect_timeout, self.timeout)
+        self._reset_session()
+        _clients.add(self)
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
-        """Effectue une requête HTTP vers le microservice"""
+    def _reset_session(self):
+        """Réinitialise la session sans fermer les sockets (elles peuvent appartenir au parent)"""
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+    
+    def _get_pool_config(self) -> Dict[str, Any]:
+        """Retourne la configuration du pool HTTP pour ce service"""
+        pools = getattr(settings, 'MICROSERVICE_HTTP_POOLS', {})
+        return {**DEFAULT_HTTP_POOL_CONFIG, **pools.get(self.service_name, {})}
+    
+    def _create_session(self) -> requests.Session:
+        """Crée une session HTTP avec un pool de connexions keep-alive dédié"""
+        config = self._get_pool_config()
+        adapter = HTTPAdapter(
+            pool_connections=config['POOL_CONNECTIONS'],
+            pool_maxsize=config['POOL_MAXSIZE'],
+            pool_block=config['POOL_BLOCK'],
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Content-Type': 'application/json'})
+        if not config['KEEP_ALIVE']:
+            session.headers['Connection'] = 'close'
+        return session
+    
+    @property
+    def session(self) -> requests.Session:
+        """Session HTTP du processus courant, créée à la première utilisation"""
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            with self._session_lock:
+                if self._session is None or self._session_pid != pid:
+                    self._session = self._create_session()
+                    self._session_pid = pid
+        return self._session
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """
+        Compteurs de réutilisation du pool de connexions
+        
+        Un hit est une requête servie par une connexion déjà ouverte,
+        un miss correspond à l'ouverture d'une nouvelle connexion TCP.
+        """
+        total_requests = 0
+        new_connections = 0
+        session = self._session if self._session_pid == os.getpid() else None
+        if session is not None:
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        total_requests += pool.num_requests
+                        new_connections += pool.num_connections
+        return {
+            'service': self.service_name,
+            'requests': total_requests,
+            'hits': max(total_requests - new_connections, 0),
+            'misses': new_connections,
+        }
+    
+    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None, params: Optional[Dict] = None,
+                      raise_unavailable: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Effectue une requête HTTP vers le microservice
+        
+        Retourne None en cas d'erreur. Avec raise_unavailable, une indisponibilité
+        du service lève ServiceUnavailableError au lieu de retourner None, afin de
+        la distinguer d'une ressource absente.
+        
+        Les requêtes idempotentes sont rejouées après une indisponibilité (backoff
+        avec jitter, dans la limite du budget de tentatives) ; lorsque le disjoncteur
+        du service est ouvert, l'appel échoue immédiatement.
+        """
         url = f"{self.base_url}{endpoint}"
+        breaker = self.resilience.breaker
+        self.resilience.retry_budget.record_request()
+        attempt = 0
         
-        try:
-            response = requests.request(
-                method=method,
-                url=url,
-                json=data,
-                params=params,
-                timeout=self.timeout,
-                headers={'Content-Type': 'application/json'}
-            )
-            response.raise_for_status()
-            return response.json() if response.content else None
-        except requests.exceptions.Timeout:
-            logger.error(f"Timeout lors de la requête vers {url}")
-            return None
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Erreur de connexion vers {url}")
-            return None
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"Erreur HTTP {e.response.status_code} vers {url}: {e.response.text}")
-            return None
-        except Exception as e:
-            logger.error(f"Erreur inattendue lors de la requête vers {url}: {str(e)}")
-            return None
+        while True:
+            attempt += 1
+            if not breaker.allow_request():
+                logger.warning(f"Disjoncteur ouvert, requête vers {url} non tentée")
+                record_circuit_open(self.service_name, method, endpoint)
+                if raise_unavailable:
+                    raise CircuitOpenError(url)
+                return None
+            
+            started = time.monotonic()
+            try:
+                response = self.session.request(
+                    method=method,
+                    url=url,
+                    json=data,
+                    params=params,
+                    timeout=(self.connect_timeout, self.timeout)
+                )
+                response.raise_for_status()
+                result = response.json() if response.content else None
+            except requests.exceptions.Timeout:
+                logger.error(f"Timeout lors de la requête vers {url}")
+                outcome = 'timeout'
+            except requests.exceptions.ConnectionError:
+                logger.error(f"Erreur de connexion vers {url}")
+                outcome = 'connection_error'
+            except requests.exceptions.HTTPError as e:
+                logger.error(f"Erreur HTTP {e.response.status_code} vers {url}: {e.response.text}")
+                if e.response.status_code < 500:
+                    # Erreur du client (404…) : le service répond normalement
+                    self._record_attempt(method, endpoint, started, 'client_error')
+                    return None
+                outcome = 'server_error'
+            except Exception as e:
+                logger.error(f"Erreur inattendue lors de la requête vers {url}: {str(e)}")
+                self._record_attempt(method, endpoint, started, 'error')
+                return None
+            else:
+                self._record_attempt(method, endpoint, started, 'success')
+                return result
+            
+            # Service indisponible (timeout, connexion ou erreur 5xx)
+            self._record_attempt(method, endpoint, started, outcome)
+            delay = self.resilience.retry_delay(method, attempt)
+            if delay is None:
+                if raise_unavailable:
+                    raise ServiceUnavailableError(url)
+                return None
+            time.sleep(delay)
+    
+    def _record_attempt(self, method: str, endpoint: str, started: float, outcome: str):
+        """Résultat d'une tentative : disjoncteur du service et métriques Prometheus"""
+        latency = time.monotonic() - started
+        if outcome in ('success', 'client_error'):
+            self.resilience.breaker.record_success(latency)
+        else:
+            self.resilience.breaker.record_failure(latency)
+        observe_dependency_call(self.service_name, method, endpoint, latency, outcome)
 
 class BookManagementService(MicroserviceClient):
     """Service pour communiquer avec le microservice Book Management"""
     
+    service_name = 'book'
+    
     def __init__(self):
         base_url = getattr(settings, 'BOOK_MANAGEMENT_URL', 'http://book-management-service:8001')
         super().__init__(base_url)
+        cache_config = getattr(settings, 'BOOK_DETAILS_CACHE', {})
+        self.details_cache = TTLCache(
+            'book_details',
+            maxsize=cache_config.get('MAX_SIZE', 1024),
+            ttl=cache_config.get('TTL', 30),
+        )
     
-    def get_book_details(self, book_id: int) -> Optional[Dict[str, Any]]:
-        """Récupère les détails d'un livre"""
-        return self._make_request('GET', f'/getBooks/{book_id}')
+    def get_book_details(self, book_id: int, fresh: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Récupère les détails d'un livre (depuis le cache si possible)
+        
+        Args:
+            book_id: ID du livre
+            fresh: Ignore le cache du processus (seul le cache de la requête est lu)
+        """
+        return self.details_cache.get_or_load(
+            book_id, lambda: self._make_request('GET', f'/getBooks/{book_id}'), request_only=fresh
+        )
     
     def check_book_availability(self, book_id: int) -> bool:
-        """Vérifie si un livre est disponible pour emprunt"""
-        book_details = self.get_book_details(book_id)
+        """
+        Vérifie si un livre est disponible pour emprunt
+        
+        La disponibilité change à chaque prêt, dans n'importe quel worker ou
+        pod : elle est toujours demandée au service des livres (au plus une
+        fois par requête), jamais lue dans le cache du processus.
+        """
+        book_details = self.get_book_details(book_id, fresh=True)
         if book_details:
             return book_details.get('available', False)
         return False
@@ -62,21 +244,138 @@ class BookManagementService(MicroserviceClient):
         """Met à jour la disponibilité d'un livre"""
         data = {'available': available}
         result = self._make_request('PUT', f'/updateBook/{book_id}', data=data)
-        return result is not None
+        if result is None:
+            return False
+        self.apply_cached_availability(book_id, available)
+        return True
+    
+    def apply_cached_availability(self, book_id: int, available: bool):
+        """Écriture traversante : le cache reflète la nouvelle disponibilité"""
+        self.details_cache.update(book_id, lambda details: {**details, 'available': available})
 
 class UserManagementService(MicroserviceClient):
     """Service pour communiquer avec le microservice User Management"""
     
+    service_name = 'user'
+    
     def __init__(self):
         base_url = getattr(settings, 'USER_MANAGEMENT_URL', 'http://user-management-service:8002')
         super().__init__(base_url)
+        cache_config = getattr(settings, 'USER_VERIFICATION_CACHE', {})
+        self.positive_ttl = cache_config.get('POSITIVE_TTL', 300)
+        self.negative_ttl = cache_config.get('NEGATIVE_TTL', 30)
+        self.stale_ttl = cache_config.get('STALE_TTL', 600)
+        self.fail_open = cache_config.get('FAIL_OPEN', False)
+        self.refresh_workers = cache_config.get('REFRESH_WORKERS', 2)
+        # Les entrées sont conservées au-delà de leur fraîcheur pour servir les données périmées
+        self.verification_cache = TTLCache(
+            'user_verification',
+            maxsize=cache_config.get('MAX_SIZE', 4096),
+            ttl=max(self.positive_ttl + self.stale_ttl, self.negative_ttl),
+        )
+        self.stale_hits = 0
+        self.background_refreshes = 0
+        self.unavailable_fallbacks = 0
+    
+    def _reset_session(self):
+        super()._reset_session()
+        self._refresh_executor = None
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+    
+    def _fetch_verification(self, user_email: str) -> Dict[str, Any]:
+        """Interroge le microservice et met le résultat en cache (lève ServiceUnavailableError)"""
+        user_details = self._make_request('GET', f'/users/{user_email}', raise_unavailable=True)
+        return self.store_verification(user_email, user_details)
+    
+    def store_verification(self, user_email: str, user_details: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Met en cache le résultat d'une vérification"""
+        entry = {
+            'active': bool(user_details.get('active', False)) if user_details else False,
+            'fetched_at': time.monotonic(),
+        }
+        self.verification_cache.set(user_email.lower(), entry)
+        return entry
+    
+    def _refresh_in_background(self, user_email: str):
+        """Rafraîchit une entrée périmée hors du chemin de la requête (une seule fois par email)"""
+        key = user_email.lower()
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._refresh_executor is None:
+                self._refresh_executor = ThreadPoolExecutor(
+                    max_workers=self.refresh_workers, thread_name_prefix='user-verification-refresh'
+                )
+            self.background_refreshes += 1
+        
+        def refresh():
+            try:
+                self._fetch_verification(user_email)
+            except ServiceUnavailableError:
+                logger.warning(f"Rafraîchissement de la vérification de {user_email} impossible")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+        
+        self._refresh_executor.submit(refresh)
     
     def verify_user(self, user_email: str) -> bool:
-        """Vérifie si l'utilisateur existe et est actif"""
-        user_details = self._make_request('GET', f'/users/{user_email}')
-        if user_details:
-            return user_details.get('active', False)
-        return False
+        """
+        Vérifie si l'utilisateur existe et est actif
+        
+        Les résultats positifs et négatifs sont mis en cache avec des TTL distincts.
+        Un résultat positif périmé est servi immédiatement pendant qu'un
+        rafraîchissement tourne en arrière-plan (stale-while-revalidate).
+        """
+        decision, entry = self.cached_verification(user_email)
+        if decision is not None:
+            return decision
+        try:
+            return self._fetch_verification(user_email)['active']
+        except ServiceUnavailableError:
+            return self.unavailable_decision(user_email, entry)
+    
+    def cached_verification(self, user_email: str):
+        """
+        Décision tirée du cache, sans appel bloquant
+        
+        Returns:
+            tuple: (décision ou None s'il faut interroger le service, entrée en cache ou None)
+        """
+        entry = self.verification_cache.get(user_email.lower())
+        if entry is not None:
+            age = time.monotonic() - entry['fetched_at']
+            if age < (self.positive_ttl if entry['active'] else self.negative_ttl):
+                return entry['active'], entry
+            if entry['active'] and age < self.positive_ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(user_email)
+                return True, entry
+        return None, entry
+    
+    def unavailable_decision(self, user_email: str, entry: Optional[Dict[str, Any]]) -> bool:
+        """Décision lorsque le service utilisateurs est indisponible"""
+        self.unavailable_fallbacks += 1
+        if entry is not None:
+            # Dernier résultat connu plutôt qu'une décision par défaut
+            logger.warning(f"Service utilisateurs indisponible, dernier résultat connu pour {user_email}")
+            return entry['active']
+        logger.warning(
+            f"Service utilisateurs indisponible, vérification de {user_email} "
+            f"{'acceptée' if self.fail_open else 'refusée'} (FAIL_OPEN={self.fail_open})"
+        )
+        return self.fail_open
+    
+    def verification_stats(self) -> Dict[str, Any]:
+        """Statistiques du cache de vérification des utilisateurs"""
+        return {
+            **self.verification_cache.stats(),
+            'stale_hits': self.stale_hits,
+            'background_refreshes': self.background_refreshes,
+            'unavailable_fallbacks': self.unavailable_fallbacks,
+        }
     
     def get_user_details(self, user_email: str) -> Optional[Dict[str, Any]]:
         """Récupère les détails d'un utilisateur"""
@@ -85,6 +384,8 @@ class UserManagementService(MicroserviceClient):
 class NotificationService(MicroserviceClient):
     """Service pour communiquer avec le système de notification"""
     
+    service_name = 'notification'
+    
     def __init__(self):
         base_url = getattr(settings, 'NOTIFICATION_SERVICE_URL', 'http://notification-service:8003')
         super().__init__(base_url)
@@ -113,4 +414,14 @@ class NotificationService(MicroserviceClient):
 # Instances globales des services
 book_service = BookManagementService()
 user_service = UserManagementService()
-notification_service = NotificationService()
\ No newline at end of file
+notification_service = NotificationService()
+
+
+def get_http_pool_stats() -> List[Dict[str, Any]]:
+    """Statistiques des pools HTTP de tous les services du processus courant"""
+    return [service.get_pool_stats() for service in (book_service, user_service, notification_service)]
+
+
+def get_cache_stats() -> List[Dict[str, Any]]:
+    """Statistiques des caches de réponses du processus courant"""
+    return [book_service.details_cache.stats(), user_service.verification_stats()]
@@ -0,0 +1,222 @@
+"""
+Statistiques des prêts tenues à jour de façon incrémentale
+
+Prêts par statut, emprunts par livre et volumes quotidiens sont mis à jour
+dans la transaction qui modifie les prêts (operations.py, sweeper.py) :
+/api/stats/ les lit sans parcourir la table Lending. La commande
+rebuild_lending_stats les recalcule entièrement.
+
+Chaque mise à jour d'un compteur de statut incrémente aussi sa colonne
+`changes` : leur somme, qui augmente à chaque transaction validée qui modifie
+des prêts, sert de version de la table Lending (get_lending_version).
+
+Les lignes sont verrouillées toujours dans le même ordre (livres, jour,
+statuts par ordre alphabétique) pour éviter les interblocages, et en fin de
+transaction pour que le verrou soit gardé le moins longtemps possible.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import BookLendingCount, DailyLendingVolume, Lending, LendingStatusCount
+
+logger = logging.getLogger(__name__)
+
+# Configuration par défaut, surchargée par settings.LENDING_STATS
+DEFAULT_STATS_CONFIG = {
+    'SHARDS': 8,
+    'TOP_BOOKS': 10,
+    'DAILY_DAYS': 30,
+}
+
+ROLLUP_MODELS = (LendingStatusCount, BookLendingCount, DailyLendingVolume)
+
+
+def get_stats_config() -> Dict[str, Any]:
+    return {**DEFAULT_STATS_CONFIG, **getattr(settings, 'LENDING_STATS', {})}
+
+
+def _increment(model, lookup: Dict[str, Any], **deltas: int):
+    """UPDATE … SET champ = champ + delta sur une ligne, créée au premier changement"""
+    expressions = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**expressions):
+        return
+    _, created = model.objects.get_or_create(**lookup, defaults=deltas)
+    if not created:
+        # Ligne créée entre-temps par une transaction concurrente
+        model.objects.filter(**lookup).update(**expressions)
+
+
+def _increment_books(book_ids: Iterable[int]):
+    """+1 emprunt pour chaque livre, en un seul UPDATE pour les livres déjà comptés"""
+    book_ids = sorted(set(book_ids))
+    updated = BookLendingCount.objects.filter(book_id__in=book_ids).update(lend_count=F('lend_count') + 1)
+    if updated == len(book_ids):
+        return
+    counted = set(BookLendingCount.objects.filter(book_id__in=book_ids).values_list('book_id', flat=True))
+    for book_id in book_ids:
+        if book_id not in counted:
+            _increment(BookLendingCount, {'book_id': book_id}, lend_count=1)
+
+
+def _update_counts(shard: int, day=None, lent: int = 0, returned: int = 0, **status_deltas: int):
+    """Volume du jour puis compteurs de statut, dans l'ordre de verrouillage"""
+    if day is not None and (lent or returned):
+        _increment(DailyLendingVolume, {'day': day, 'shard': shard}, lent=lent, returned=returned)
+    for status in sorted(status_deltas):
+        if status_deltas[status]:
+            _increment(
+                LendingStatusCount, {'status': status, 'shard': shard}, count=status_deltas[status], changes=1
+            )
+
+
+def _shard() -> int:
+    return random.randrange(get_stats_config()['SHARDS'])
+
+
+def record_lent(book_ids: Iterable[int], when=None):
+    """
+    Prêts ACTIVE créés, à appeler dans la transaction qui les crée
+
+    Args:
+        book_ids: Livres empruntés (un prêt par livre)
+        when: Date d'emprunt (par défaut, maintenant)
+    """
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    _increment_books(book_ids)
+    _update_counts(_shard(), timezone.localdate(when), lent=len(book_ids), ACTIVE=len(book_ids))
+
+
+def record_returned(count: int, previous_status: str = 'ACTIVE', when=None):
+    """Prêts passés de `previous_status` à RETURNED, dans la transaction du retour"""
+    if count:
+        _update_counts(
+            _shard(), timezone.localdate(when), returned=count, **{previous_status: -count, 'RETURNED': count}
+        )
+
+
+def record_status_change(previous_status: str, new_status: str, count: int):
+    """Prêts changés de statut sans emprunt ni retour (passage en OVERDUE par le sweeper)"""
+    if count:
+        _update_counts(_shard(), **{previous_status: -count, new_status: count})
+
+
+def get_lending_stats(top: Optional[int] = None, days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Lecture des statistiques, indépendante de la taille de la table Lending
+
+    Args:
+        top: Nombre de livres les plus empruntés
+        days: Nombre de jours de volumes quotidiens, aujourd'hui compris
+
+    Returns:
+        dict: prêts par statut, total, livres les plus empruntés et volumes par jour
+    """
+    config = get_stats_config()
+    top = top or config['TOP_BOOKS']
+    days = days or config['DAILY_DAYS']
+
+    by_status = dict.fromkeys((status for status, _ in Lending.STATUS_CHOICES), 0)
+    by_status.update(LendingStatusCount.objects.values_list('status').annotate(total=Sum('count')).order_by())
+    top_books = list(
+        BookLendingCount.objects.filter(lend_count__gt=0)
+        .order_by('-lend_count', '-book_id').values('book_id', 'lend_count')[:top]
+    )
+    since = timezone.localdate() - timedelta(days=days - 1)
+    daily = [
+        {'day': row['day'].isoformat(), 'lent': row['lent'], 'returned': row['returned']}
+        for row in DailyLendingVolume.objects.filter(day__gte=since).values('day').annotate(
+            lent=Sum('lent'), returned=Sum('returned')
+        ).order_by('day')
+    ]
+    return {
+        'by_status': by_status,
+        'total': sum(by_status.values()),
+        'top_books': top_books,
+        'daily': daily,
+    }
+
+
+def get_lending_version() -> int:
+    """Version de la table Lending : change à chaque prêt, retour ou passage en OVERDUE validé"""
+    return LendingStatusCount.objects.aggregate(version=Sum('changes'))['version'] or 0
+
+
+def is_rollup_empty() -> bool:
+    return not LendingStatusCount.objects.exists()
+
+
+def rebuild_lending_stats(batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Recalcule toutes les statistiques à partir de la table Lending, en une transaction
+
+    Sous PostgreSQL, les tables de statistiques sont verrouillées en écriture
+    dès le début : les transactions qui modifient des prêts pendant le calcul
+    attendent sa fin pour compter leurs changements, qui ne sont donc ni
+    perdus ni comptés deux fois. Les lectures de /api/stats/ continuent.
+
+    Returns:
+        dict: statuts, livres et jours comptés, et durée
+    """
+    started = time.monotonic()
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for model in ROLLUP_MODELS:
+                    cursor.execute(f'LOCK TABLE {model._meta.db_table} IN EXCLUSIVE MODE')
+        # La version continue d'augmenter : un ETag antérieur au recalcul ne peut plus correspondre
+        version = get_lending_version()
+        for model in ROLLUP_MODELS:
+            model.objects.all().delete()
+
+        by_status = dict.fromkeys((status for status, _ in Lending.STATUS_CHOICES), 0)
+        by_status.update(Lending.objects.values_list('status').annotate(count=Count('id')).order_by())
+        LendingStatusCount.objects.bulk_create([
+            LendingStatusCount(status=status, count=count, changes=version + 1 if index == 0 else 0)
+            for index, (status, count) in enumerate(by_status.items())
+        ])
+
+        books = 0
+        batch = []
+        per_book = Lending.objects.values_list('book_id').annotate(count=Count('id')).order_by()
+        for book_id, count in per_book.iterator(chunk_size=batch_size):
+            batch.append(BookLendingCount(book_id=book_id, lend_count=count))
+            if len(batch) >= batch_size:
+                BookLendingCount.objects.bulk_create(batch)
+                books += len(batch)
+                batch = []
+        BookLendingCount.objects.bulk_create(batch)
+        books += len(batch)
+
+        volumes = {}
+        lent = Lending.objects.annotate(day=TruncDate('date_borrowed')).values_list('day').annotate(
+            count=Count('id')
+        ).order_by()
+        for day, count in lent:
+            volumes.setdefault(day, DailyLendingVolume(day=day)).lent = count
+        returned = Lending.objects.filter(date_returned__isnull=False).annotate(
+            day=TruncDate('date_returned')
+        ).values_list('day').annotate(count=Count('id')).order_by()
+        for day, count in returned:
+            volumes.setdefault(day, DailyLendingVolume(day=day)).returned = count
+        DailyLendingVolume.objects.bulk_create(volumes.values(), batch_size=batch_size)
+
+    duration = time.monotonic() - started
+    logger.info(f"Statistiques recalculées : {sum(by_status.values())} prêts, {books} livres, "
+                f"{len(volumes)} jours en {duration:.3f}s")
+    return {
+        'by_status': by_status,
+        'books': books,
+        'days': len(volumes),
+        'duration': round(duration, 4),
+    }
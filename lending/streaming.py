@@ -0,0 +1,172 @@
+"""
+Réponses en streaming pour les listes volumineuses
+
+Les lignes sont lues par paquets avec .iterator(chunk_size=...) (curseur
+côté serveur sous PostgreSQL) et envoyées au fil de l'eau : la mémoire du
+worker reste constante quelle que soit la taille du résultat.
+
+Les exports complets (iter_keyset) enchaînent des lots ordonnés par id
+plutôt qu'un seul curseur : chaque requête reste courte, et un export
+interrompu reprend après le dernier id reçu.
+"""
+from itertools import islice
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .renderers import ORJSONRenderer
+
+NDJSON = 'ndjson'
+JSON = 'json'
+CSV = 'csv'
+STREAM_FORMATS = (NDJSON, JSON)
+EXPORT_FORMATS = (NDJSON, CSV)
+
+
+def _chunk_size() -> int:
+    return getattr(settings, 'KEYSET_PAGINATION', {}).get('STREAM_CHUNK_SIZE', 2000)
+
+
+def iter_ndjson(rows: Iterable[Any], serialize: Callable[[Any], Dict[str, Any]]) -> Iterator[bytes]:
+    """Une ligne JSON par élément"""
+    renderer = ORJSONRenderer()
+    for row in rows:
+        yield renderer.render(serialize(row)) + b'\n'
+
+
+def iter_json_array(rows: Iterable[Any], serialize: Callable[[Any], Dict[str, Any]]) -> Iterator[bytes]:
+    """Tableau JSON produit morceau par morceau, identique au rendu d'une liste complète"""
+    renderer = ORJSONRenderer()
+    yield b'['
+    first = True
+    for row in rows:
+        yield (b'' if first else b',') + renderer.render(serialize(row))
+        first = False
+    yield b']'
+
+
+def stream_queryset(queryset, serialize: Callable[[Any], Dict[str, Any]], stream_format: str) -> StreamingHttpResponse:
+    """
+    Réponse en streaming d'un queryset, en NDJSON ou en tableau JSON
+
+    Args:
+        queryset: Requête déjà filtrée et triée
+        serialize: Conversion d'une ligne en dictionnaire
+        stream_format: 'ndjson' ou 'json'
+    """
+    rows = queryset.iterator(chunk_size=_chunk_size())
+    if stream_format == NDJSON:
+        return StreamingHttpResponse(iter_ndjson(rows, serialize), content_type='application/x-ndjson')
+    return StreamingHttpResponse(iter_json_array(rows, serialize), content_type='application/json')
+
+
+def iter_keyset(queryset, batch_size: int, after_id: int = 0, limit: Optional[int] = None, key_index: int = 0,
+                chunk_size: Optional[int] = None) -> Iterator[List[Any]]:
+    """
+    Parcourt un queryset dans l'ordre des id, par paquets de chunk_size lignes
+
+    Chaque lot est une requête WHERE id > dernier id ORDER BY id LIMIT
+    batch_size, lue avec .iterator(chunk_size=...) : curseur côté serveur
+    sous PostgreSQL ; derrière pgbouncer (curseurs désactivés), la mémoire
+    reste bornée par batch_size. Aucune transaction ne dure le temps de
+    l'export complet.
+
+    Args:
+        queryset: Requête .values_list() filtrée, non triée
+        after_id: Reprise après cet id (exclu)
+        limit: Nombre maximal de lignes (par défaut, jusqu'à la fin)
+        key_index: Position de l'id dans les lignes
+        chunk_size: Lignes par paquet (par défaut, STREAM_CHUNK_SIZE)
+    """
+    chunk_size = chunk_size or _chunk_size()
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rows = queryset.filter(pk__gt=after_id).order_by('pk')[:size].iterator(chunk_size=chunk_size)
+        read = 0
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            read += len(chunk)
+            after_id = chunk[-1][key_index]
+            yield chunk
+        if remaining is not None:
+            remaining -= read
+        if read < size:
+            return
+
+
+async def aiter_in_thread(iterator: Iterator[Any]) -> AsyncIterator[Any]:
+    """
+    Consomme un itérateur synchrone qui lit la base, élément par élément, dans le thread de la base
+
+    À réserver aux itérateurs produisant peu d'éléments volumineux (paquets
+    de lignes) : chaque élément coûte un passage par sync_to_async.
+    """
+    done = object()
+    try:
+        while True:
+            item = await sync_to_async(next)(iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+async def aiter_ndjson(rows: AsyncIterable[Any], serialize: Callable[[Any], Dict[str, Any]]) -> AsyncIterator[bytes]:
+    renderer = ORJSONRenderer()
+    async for row in rows:
+        yield renderer.render(serialize(row)) + b'\n'
+
+
+async def aiter_json_array(rows: AsyncIterable[Any], serialize: Callable[[Any], Dict[str, Any]]) -> AsyncIterator[bytes]:
+    renderer = ORJSONRenderer()
+    yield b'['
+    first = True
+    async for row in rows:
+        yield (b'' if first else b',') + renderer.render(serialize(row))
+        first = False
+    yield b']'
+
+
+async def aiter_queryset(queryset, chunk_size: int) -> AsyncIterator[Any]:
+    """
+    Parcourt un queryset par paquets depuis une vue asynchrone
+
+    QuerySet.aiterator() exécute la requête des .values_list() dans la boucle
+    d'événements (SynchronousOnlyOperation) : l'itérateur synchrone est donc
+    créé puis consommé paquet par paquet dans le thread de la base.
+    """
+    iterator = None
+
+    def next_chunk():
+        nonlocal iterator
+        if iterator is None:
+            iterator = queryset.iterator(chunk_size=chunk_size)
+        return list(islice(iterator, chunk_size))
+
+    while True:
+        chunk = await sync_to_async(next_chunk)()
+        for row in chunk:
+            yield row
+        if len(chunk) < chunk_size:
+            break
+
+
+def astream_queryset(queryset, serialize: Callable[[Any], Dict[str, Any]], stream_format: str) -> StreamingHttpResponse:
+    """
+    Variante asynchrone de stream_queryset pour les vues ASGI
+
+    Sous ASGI, Django consommerait entièrement un itérateur synchrone avant
+    l'envoi : les lignes sont donc produites par un itérateur asynchrone.
+    """
+    rows = aiter_queryset(queryset, _chunk_size())
+    if stream_format == NDJSON:
+        return StreamingHttpResponse(aiter_ndjson(rows, serialize), content_type='application/x-ndjson')
+    return StreamingHttpResponse(aiter_json_array(rows, serialize), content_type='application/json')
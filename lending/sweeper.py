@@ -0,0 +1,107 @@
+"""
+Passage des prêts échus au statut OVERDUE
+
+Exécuté périodiquement par la commande sweep_overdue_lendings, à la place
+de l'UPDATE que faisait chaque appel à GET /getExpiredBooks : l'endpoint
+n'est plus qu'une lecture indexée.
+"""
+import logging
+import time
+from typing import Any, Dict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Lending, OverdueSweepState
+from .stats import record_status_change
+
+logger = logging.getLogger(__name__)
+
+SWEEP_NAME = 'overdue_lendings'
+
+
+def _get_state() -> OverdueSweepState:
+    state, _ = OverdueSweepState.objects.get_or_create(name=SWEEP_NAME)
+    return state
+
+
+def sweep_overdue_lendings(batch_size: int = 1000, full: bool = False, now=None) -> Dict[str, Any]:
+    """
+    Passe en OVERDUE les prêts actifs échus, par lots bornés
+
+    Seuls les prêts dont l'échéance est postérieure au point de reprise du
+    passage précédent sont parcourus (index sur date_due). Chaque lot est une
+    transaction courte qui fait aussi avancer le point de reprise.
+
+    Args:
+        batch_size: Nombre maximal de prêts mis à jour par transaction
+        full: Ignorer le point de reprise et parcourir toutes les échéances
+        now: Date limite des échéances (par défaut, maintenant)
+
+    Returns:
+        dict: prêts mis à jour, nombre de lots, durée et point de reprise
+    """
+    started = time.monotonic()
+    cutoff = now or timezone.now()
+    state = _get_state()
+    position = None if full else state.high_water_mark
+    swept = 0
+    batches = 0
+
+    while True:
+        with transaction.atomic():
+            # Le verrou sur l'état sérialise les sweepers concurrents
+            state = OverdueSweepState.objects.select_for_update().get(name=SWEEP_NAME)
+            due = Lending.objects.filter(status='ACTIVE', date_due__lt=cutoff)
+            if position is not None:
+                # >= : les prêts restants de même échéance que la fin du lot précédent
+                due = due.filter(date_due__gte=position)
+            batch = list(due.order_by('date_due', 'id').values_list('id', 'date_due')[:batch_size])
+
+            if batch:
+                updated = Lending.objects.filter(
+                    id__in=[lending_id for lending_id, _ in batch], status='ACTIVE'
+                ).update(status='OVERDUE')
+                record_status_change('ACTIVE', 'OVERDUE', updated)
+                swept += updated
+                batches += 1
+            # Lot incomplet : toutes les échéances jusqu'à cutoff sont traitées
+            position = cutoff if len(batch) < batch_size else batch[-1][1]
+            if state.high_water_mark is None or position > state.high_water_mark:
+                state.high_water_mark = position
+                state.save(update_fields=['high_water_mark'])
+
+        if len(batch) < batch_size:
+            break
+
+    duration = time.monotonic() - started
+    OverdueSweepState.objects.filter(name=SWEEP_NAME).update(
+        last_run_at=timezone.now(),
+        last_duration=duration,
+        last_swept=swept,
+        last_batches=batches,
+        total_swept=F('total_swept') + swept,
+    )
+    logger.info(f"Sweep OVERDUE : {swept} prêts en {batches} lots, {duration:.3f}s")
+    return {
+        'swept': swept,
+        'batches': batches,
+        'duration': round(duration, 4),
+        'high_water_mark': position.isoformat(),
+    }
+
+
+def get_sweeper_stats() -> Dict[str, Any]:
+    """Bilan du dernier passage, pour le health check"""
+    state = OverdueSweepState.objects.filter(name=SWEEP_NAME).first()
+    if state is None:
+        return {'last_run_at': None}
+    return {
+        'last_run_at': state.last_run_at.isoformat() if state.last_run_at else None,
+        'last_duration': round(state.last_duration, 4),
+        'last_swept': state.last_swept,
+        'last_batches': state.last_batches,
+        'total_swept': state.total_swept,
+        'high_water_mark': state.high_water_mark.isoformat() if state.high_water_mark else None,
+    }
@@ -6,6 +6,7 @@ Ces tests peuvent être exécutés avec ou sans environnement Django complet
 import os
 import sys
 import json
+import time
 import unittest
 from unittest.mock import patch, Mock, MagicMock
 from datetime import datetime, timedelta
@@ -13,6 +14,9 @@ from datetime import datetime, timedelta
 # Configuration pour les tests
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projet.settings')
 
+import django
+django.setup()
+
 
 class TestLendingLogic(unittest.TestCase):
     """Tests pour la logique métier du service de prêt"""
@@ -183,6 +187,1963 @@ class TestMicroserviceCommunication(unittest.TestCase):
             self.assertIn("connection", str(e).lower())
 
 
+class TestMicroserviceClientPooling(unittest.TestCase):
+    """Tests pour les sessions HTTP poolées des clients microservices"""
+    
+    def setUp(self):
+        from lending.services import MicroserviceClient
+        self.client = MicroserviceClient('http://book-service:8001/')
+    
+    def test_session_reused_between_calls(self):
+        """La même session keep-alive est réutilisée d'un appel à l'autre"""
+        self.assertIs(self.client.session, self.client.session)
+    
+    def test_session_recreated_after_fork(self):
+        """Un processus enfant ne réutilise pas la session du parent"""
+        parent_session = self.client.session
+        with patch('lending.services.os.getpid', return_value=-1):
+            child_session = self.client.session
+        self.assertIsNot(parent_session, child_session)
+    
+    @patch('requests.Session.request')
+    def test_make_request_goes_through_session(self, mock_request):
+        """Les requêtes passent par la session poolée"""
+        mock_response = Mock()
+        mock_response.content = b'{"id": 123}'
+        mock_response.json.return_value = {'id': 123}
+        mock_request.return_value = mock_response
+        
+        result = self.client._make_request('GET', '/getBooks/123')
+        
+        self.assertEqual(result, {'id': 123})
+        mock_request.assert_called_once()
+        self.assertEqual(mock_request.call_args.kwargs['url'], 'http://book-service:8001/getBooks/123')
+    
+    def test_pool_stats_hits_and_misses(self):
+        """Les hits correspondent aux requêtes servies sans nouvelle connexion"""
+        adapter = self.client.session.get_adapter('http://book-service:8001')
+        pool = adapter.poolmanager.connection_from_url('http://book-service:8001')
+        pool.num_requests = 5
+        pool.num_connections = 2
+        
+        stats = self.client.get_pool_stats()
+        
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['hits'], 3)
+        self.assertEqual(stats['misses'], 2)
+
+
+class TestBookDetailsCache(unittest.TestCase):
+    """Tests pour le cache TTL/LRU des détails de livres"""
+    
+    def setUp(self):
+        from lending.services import BookManagementService
+        self.service = BookManagementService()
+        self.service._make_request = Mock(side_effect=lambda method, endpoint, **kwargs: (
+            {'id': 123, 'title': 'Test Book', 'available': True} if method == 'GET' else {'success': True}
+        ))
+    
+    def test_second_lookup_served_from_cache(self):
+        """Un livre déjà récupéré n'est pas redemandé au microservice"""
+        self.service.get_book_details(123)
+        self.service.get_book_details(123)
+        
+        self.assertEqual(self.service._make_request.call_count, 1)
+        self.assertEqual(self.service.details_cache.stats()['hit_ratio'], 0.5)
+    
+    def test_entries_expire_after_ttl(self):
+        """Une entrée expirée est rechargée"""
+        with patch('lending.cache.time.monotonic', return_value=1000):
+            self.service.get_book_details(123)
+        with patch('lending.cache.time.monotonic', return_value=1000 + self.service.details_cache.ttl + 1):
+            self.service.get_book_details(123)
+        
+        self.assertEqual(self.service._make_request.call_count, 2)
+        self.assertEqual(self.service.details_cache.stats()['expirations'], 1)
+    
+    def test_lru_eviction(self):
+        """Le cache reste borné en évinçant l'entrée la moins récemment utilisée"""
+        from lending.cache import TTLCache
+        cache = TTLCache('test', maxsize=2, ttl=60)
+        cache.set(1, 'a')
+        cache.set(2, 'b')
+        cache.get(1)
+        cache.set(3, 'c')
+        
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), 'a')
+        self.assertEqual(cache.stats()['evictions'], 1)
+    
+    def test_request_scope_without_process_cache(self):
+        """Le cache de requête évite les doublons même si le cache processus est désactivé"""
+        from lending.cache import request_cache_scope
+        self.service.details_cache.ttl = 0
+        with request_cache_scope():
+            self.service.get_book_details(123)
+            self.service.get_book_details(123)
+        self.service.get_book_details(123)
+        
+        self.assertEqual(self.service._make_request.call_count, 2)
+    
+    def test_availability_update_writes_through(self):
+        """Une mise à jour de disponibilité réussie met à jour le cache"""
+        self.service.get_book_details(123)
+        self.assertTrue(self.service.update_book_availability(123, False))
+        
+        self.assertFalse(self.service.get_book_details(123)['available'])
+        self.assertEqual(self.service._make_request.call_count, 2)
+    
+    def test_availability_not_served_from_process_cache(self):
+        """La disponibilité est redemandée à chaque requête, une seule fois par requête"""
+        from lending.cache import request_cache_scope
+        self.service.get_book_details(123)
+        with request_cache_scope():
+            self.assertTrue(self.service.check_book_availability(123))
+            self.assertTrue(self.service.check_book_availability(123))
+        
+        self.assertEqual(self.service._make_request.call_count, 2)
+    
+    def test_async_availability_not_served_from_process_cache(self):
+        """Le client asynchrone ne lit pas non plus la disponibilité dans le cache du processus"""
+        import asyncio
+        from unittest.mock import AsyncMock
+        from lending.async_services import AsyncBookManagementService
+        async_service = AsyncBookManagementService(self.service)
+        async_service._make_request = AsyncMock(return_value={'id': 123, 'title': 'Test Book', 'available': False})
+        self.service.get_book_details(123)
+        
+        self.assertFalse(asyncio.run(async_service.check_book_availability(123)))
+        async_service._make_request.assert_awaited_once()
+
+
+class TestUserVerificationCache(unittest.TestCase):
+    """Tests pour le cache de vérification des utilisateurs"""
+    
+    def setUp(self):
+        from lending.services import UserManagementService
+        self.service = UserManagementService()
+        self.service._make_request = Mock(return_value={'email': 'test@example.com', 'active': True})
+        self.service._refresh_in_background = Mock()
+    
+    def _verify_at(self, now):
+        with patch('lending.services.time.monotonic', return_value=now):
+            return self.service.verify_user('test@example.com')
+    
+    def test_positive_result_cached(self):
+        """Un utilisateur actif n'est vérifié qu'une fois pendant le TTL positif"""
+        self.assertTrue(self._verify_at(1000))
+        self.assertTrue(self._verify_at(1000 + self.service.positive_ttl - 1))
+        self.assertEqual(self.service._make_request.call_count, 1)
+    
+    def test_negative_result_uses_negative_ttl(self):
+        """Un résultat négatif expire après le TTL négatif"""
+        self.service._make_request.return_value = None
+        self.assertFalse(self._verify_at(1000))
+        self.assertFalse(self._verify_at(1000 + self.service.negative_ttl + 1))
+        self.assertEqual(self.service._make_request.call_count, 2)
+    
+    def test_stale_positive_served_while_revalidating(self):
+        """Un résultat positif périmé est servi et rafraîchi en arrière-plan"""
+        self._verify_at(1000)
+        self.assertTrue(self._verify_at(1000 + self.service.positive_ttl + 1))
+        
+        self.assertEqual(self.service._make_request.call_count, 1)
+        self.service._refresh_in_background.assert_called_once_with('test@example.com')
+    
+    def test_fail_closed_when_service_unavailable(self):
+        """Sans résultat connu, un service indisponible refuse l'utilisateur par défaut"""
+        from lending.services import ServiceUnavailableError
+        self.service._make_request.side_effect = ServiceUnavailableError('http://user-service')
+        self.assertFalse(self.service.verify_user('test@example.com'))
+    
+    def test_fail_open_when_configured(self):
+        """Avec FAIL_OPEN, un service indisponible accepte l'utilisateur"""
+        from lending.services import ServiceUnavailableError
+        self.service.fail_open = True
+        self.service._make_request.side_effect = ServiceUnavailableError('http://user-service')
+        self.assertTrue(self.service.verify_user('test@example.com'))
+        self.assertEqual(self.service.verification_stats()['unavailable_fallbacks'], 1)
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    """Tests pour l'envoi des notifications en arrière-plan"""
+    
+    def _make_dispatcher(self, **config):
+        from lending.notifications import NotificationDispatcher
+        notification_service = Mock()
+        notification_service.send_return_confirmation.return_value = True
+        book_service = Mock()
+        book_service.get_book_details.return_value = {'title': 'Test Book'}
+        config = {'BATCH_WAIT': 0.01, 'RETRY_BACKOFF': 0.01, **config}
+        return NotificationDispatcher(notification_service, book_service, config), notification_service
+    
+    def test_notifications_sent_by_background_worker(self):
+        """Les notifications déposées sont envoyées par le thread d'arrière-plan"""
+        from lending.notifications import RETURN_CONFIRMATION
+        dispatcher, notification_service = self._make_dispatcher()
+        for book_id in range(5):
+            self.assertTrue(dispatcher.enqueue(RETURN_CONFIRMATION, 'test@example.com', book_id))
+        
+        self.assertTrue(dispatcher.flush(timeout=2))
+        self.assertEqual(notification_service.send_return_confirmation.call_count, 5)
+        self.assertEqual(dispatcher.stats()['sent'], 5)
+        dispatcher.shutdown()
+    
+    def test_failed_notification_retried(self):
+        """Un envoi en échec est retenté avec backoff"""
+        from lending.notifications import RETURN_CONFIRMATION
+        dispatcher, notification_service = self._make_dispatcher()
+        notification_service.send_return_confirmation.side_effect = [False, True]
+        dispatcher.enqueue(RETURN_CONFIRMATION, 'test@example.com', 1)
+        
+        deadline = time.monotonic() + 2
+        while dispatcher.stats()['sent'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(dispatcher.stats()['retried'], 1)
+        self.assertEqual(dispatcher.stats()['sent'], 1)
+        dispatcher.shutdown()
+    
+    def test_queue_is_bounded(self):
+        """Une file pleine abandonne les notifications au lieu de grossir"""
+        from lending.notifications import RETURN_CONFIRMATION
+        dispatcher, _ = self._make_dispatcher(QUEUE_MAX_SIZE=1)
+        dispatcher._ensure_worker = Mock()
+        
+        self.assertTrue(dispatcher.enqueue(RETURN_CONFIRMATION, 'test@example.com', 1))
+        self.assertFalse(dispatcher.enqueue(RETURN_CONFIRMATION, 'test@example.com', 2))
+        self.assertEqual(dispatcher.stats()['dropped'], 1)
+    
+    def test_sync_mode_sends_inline(self):
+        """En mode synchrone, l'envoi a lieu pendant l'appel"""
+        from lending.notifications import RETURN_CONFIRMATION
+        dispatcher, notification_service = self._make_dispatcher(ASYNC=False)
+        
+        self.assertTrue(dispatcher.enqueue(RETURN_CONFIRMATION, 'test@example.com', 1))
+        notification_service.send_return_confirmation.assert_called_once_with('test@example.com', 'Test Book')
+    
+    def test_latencies_recorded_under_stats_lock(self):
+        """Le worker ajoute ses latences sous le verrou que stats() prend pour les lire"""
+        import threading
+        from lending.notifications import RETURN_CONFIRMATION
+        dispatcher, _ = self._make_dispatcher()
+        job = {'message_type': RETURN_CONFIRMATION, 'user_email': 'test@example.com', 'book_id': 1}
+        
+        with dispatcher._lock:
+            thread = threading.Thread(target=dispatcher._send, args=(job,))
+            thread.start()
+            thread.join(timeout=0.1)
+            self.assertTrue(thread.is_alive())
+        thread.join(timeout=1)
+        
+        self.assertFalse(thread.is_alive())
+        self.assertIsNotNone(dispatcher.stats()['send_latency_p50'])
+
+
+class TestBookAvailabilityOutbox(unittest.TestCase):
+    """Tests pour le relais de l'outbox des mises à jour de disponibilité"""
+    
+    def _row(self, row_id, book_id, available, attempts=0):
+        return Mock(id=row_id, book_id=book_id, available=available, attempts=attempts)
+    
+    @patch('lending.outbox.BookAvailabilityOutbox.objects')
+    @patch('lending.outbox._claim_batch')
+    def test_only_latest_state_per_book_is_sent(self, mock_claim, mock_objects):
+        """Les mises à jour successives d'un même livre sont dédoublonnées, dans l'ordre"""
+        from lending.outbox import relay_book_availability
+        mock_claim.return_value = [
+            self._row(1, 10, False),
+            self._row(2, 20, False),
+            self._row(3, 10, True),
+        ]
+        book_service = Mock()
+        book_service.update_book_availability.return_value = True
+        
+        stats = relay_book_availability(book_service)
+        
+        self.assertEqual(book_service.update_book_availability.call_args_list, [
+            unittest.mock.call(20, False),
+            unittest.mock.call(10, True),
+        ])
+        self.assertEqual(stats, {'claimed': 3, 'sent': 2, 'deduplicated': 1, 'failed': 0})
+        mock_objects.filter.assert_any_call(book_id=10, id__lte=3, processed_at__isnull=True)
+    
+    @patch('lending.outbox.BookAvailabilityOutbox.objects')
+    @patch('lending.outbox._claim_batch')
+    def test_failed_update_rescheduled_with_backoff(self, mock_claim, mock_objects):
+        """Un échec incrémente les tentatives et repousse la prochaine tentative"""
+        from lending.outbox import relay_book_availability
+        mock_claim.return_value = [self._row(1, 10, False, attempts=2)]
+        book_service = Mock()
+        book_service.update_book_availability.return_value = False
+        
+        stats = relay_book_availability(book_service)
+        
+        self.assertEqual(stats['failed'], 1)
+        update_kwargs = mock_objects.filter.return_value.update.call_args.kwargs
+        self.assertEqual(update_kwargs['attempts'], 3)
+        self.assertIsNone(update_kwargs['claimed_until'])
+    
+    def test_retry_delay_is_capped(self):
+        """Le backoff double à chaque tentative sans dépasser le plafond"""
+        from lending.outbox import retry_delay
+        self.assertEqual(retry_delay(1).total_seconds(), 1)
+        self.assertEqual(retry_delay(4).total_seconds(), 8)
+        self.assertEqual(retry_delay(20, maximum=300).total_seconds(), 300)
+
+
+class TestLendChecks(unittest.TestCase):
+    """Tests pour les vérifications séquentielles et concurrentes de lendBook"""
+    
+    def _run(self, mode, verify_user=True, book_available=True, deadline=5.0):
+        from lending.checks import run_lend_checks
+        with patch('lending.checks.settings') as mock_settings, \
+                patch('lending.checks.user_service') as mock_user_service, \
+                patch('lending.checks.book_service') as mock_book_service:
+            mock_settings.LEND_CHECKS = {'MODE': mode, 'DEADLINE': deadline}
+            for mock_check, outcome in ((mock_user_service.verify_user, verify_user),
+                                        (mock_book_service.check_book_availability, book_available)):
+                if callable(outcome):
+                    mock_check.side_effect = outcome
+                else:
+                    mock_check.return_value = outcome
+            return run_lend_checks('test@example.com', 123), mock_book_service
+    
+    def test_sequential_stops_at_first_failure(self):
+        """En séquentiel, un utilisateur invalide évite l'appel au service livres"""
+        result, mock_book_service = self._run('sequential', verify_user=False)
+        
+        self.assertEqual(result['failed'], 'user')
+        self.assertEqual(result['mode'], 'sequential')
+        mock_book_service.check_book_availability.assert_not_called()
+    
+    def test_concurrent_all_checks_pass(self):
+        """En concurrent, toutes les vérifications sont chronométrées"""
+        result, _ = self._run('concurrent')
+        
+        self.assertIsNone(result['failed'])
+        self.assertEqual(set(result['timings']), {'user', 'book'})
+    
+    def test_concurrent_latency_is_slowest_branch(self):
+        """Les appels distants se recouvrent au lieu de s'additionner"""
+        def slow_check(*args):
+            time.sleep(0.2)
+            return True
+        result, _ = self._run('concurrent', verify_user=slow_check, book_available=slow_check)
+        
+        self.assertIsNone(result['failed'])
+        self.assertLess(result['total'], 0.35)
+    
+    def test_concurrent_deadline(self):
+        """Les vérifications trop lentes échouent au délai commun"""
+        def slow_user(email):
+            time.sleep(0.3)
+            return True
+        result, _ = self._run('concurrent', verify_user=slow_user, deadline=0.05)
+        
+        self.assertEqual(result['failed'], 'timeout')
+        self.assertLess(result['total'], 0.2)
+
+
+class TestAsyncServingPath(unittest.TestCase):
+    """Tests pour les clients et vérifications asynchrones"""
+    
+    def test_async_checks_run_concurrently(self):
+        """Les vérifications asynchrones se recouvrent"""
+        import asyncio
+        from lending.checks import arun_lend_checks
+        
+        async def slow_check(*args):
+            await asyncio.sleep(0.2)
+            return True
+        
+        with patch('lending.checks.async_user_service') as mock_user_service, \
+                patch('lending.checks.async_book_service') as mock_book_service:
+            mock_user_service.verify_user.side_effect = slow_check
+            mock_book_service.check_book_availability.side_effect = slow_check
+            result = asyncio.run(arun_lend_checks('test@example.com', 123))
+        
+        self.assertIsNone(result['failed'])
+        self.assertEqual(result['mode'], 'async')
+        self.assertLess(result['total'], 0.35)
+    
+    def test_async_client_maps_server_errors_to_unavailable(self):
+        """Une erreur 5xx du client asynchrone signale un service indisponible"""
+        import asyncio
+        import httpx
+        from lending.async_services import AsyncMicroserviceClient
+        from lending.services import ServiceUnavailableError
+        
+        client = AsyncMicroserviceClient('http://user-service:8002')
+        transport = httpx.MockTransport(lambda request: httpx.Response(503, text='down'))
+        
+        with patch.object(client, '_build_client', return_value=httpx.AsyncClient(base_url=client.base_url, transport=transport)):
+            with self.assertRaises(ServiceUnavailableError):
+                asyncio.run(client._make_request('GET', '/users/test@example.com', raise_unavailable=True))
+    
+    def _tracked_clients(self, clients):
+        """Remplace httpx.AsyncClient par un client de test qui répond 200 et s'enregistre dans clients"""
+        import httpx
+        
+        def handler(request):
+            if request.url.path.startswith('/users/'):
+                return httpx.Response(200, json={'email': 'test@example.com', 'is_active': True})
+            return httpx.Response(200, json={'id': 123, 'title': 'Titre', 'available': True})
+        
+        class TrackedClient(httpx.AsyncClient):
+            def __init__(self, **kwargs):
+                super().__init__(transport=httpx.MockTransport(handler), **kwargs)
+                clients.append(self)
+        
+        return patch('lending.async_services.httpx.AsyncClient', TrackedClient)
+    
+    def test_async_view_under_wsgi_closes_its_clients(self):
+        """Une vue asynchrone appelée deux fois via async_to_sync ne laisse pas de client HTTP ouvert"""
+        from asgiref.sync import async_to_sync
+        from django.test import RequestFactory
+        from lending.async_services import AsyncBookManagementService, AsyncUserManagementService
+        from lending.async_views import lend_book_async
+        from lending.cache import TTLCache
+        
+        clients = []
+        user_service = MagicMock(base_url='http://user-service:8002', timeout=5)
+        user_service.cached_verification.return_value = (None, None)
+        user_service.store_verification.side_effect = lambda email, details: {'active': details['is_active']}
+        book_service = MagicMock(base_url='http://book-service:8001', timeout=5, details_cache=TTLCache('book_details', maxsize=0))
+        lending = MagicMock()
+        with self._tracked_clients(clients), \
+                patch('lending.checks.async_user_service', AsyncUserManagementService(user_service)), \
+                patch('lending.checks.async_book_service', AsyncBookManagementService(book_service)), \
+                patch('lending.async_views.create_lending', return_value=lending), \
+                patch('lending.async_views.LendingSerializer') as mock_serializer:
+            mock_serializer.return_value.data = {'id': 1}
+            for _ in range(2):
+                request = RequestFactory().post(
+                    '/api/async/lendBook', {'user_email': 'test@example.com', 'book_id': 123},
+                    content_type='application/json',
+                )
+                response = async_to_sync(lend_book_async)(request)
+                self.assertEqual(response.status_code, 201)
+        
+        self.assertGreaterEqual(len(clients), 2)
+        self.assertEqual([client for client in clients if not client.is_closed], [])
+    
+    def test_async_client_reused_on_persistent_loop(self):
+        """Sur la boucle d'un serveur ASGI, un seul client keep-alive sert tous les appels"""
+        import asyncio
+        from lending.async_services import AsyncMicroserviceClient, register_persistent_loop
+        
+        clients = []
+        client = AsyncMicroserviceClient('http://book-service:8001')
+        
+        async def serve():
+            register_persistent_loop()
+            for _ in range(2):
+                await client._make_request('GET', '/getBooks/123')
+            return [tracked for tracked in clients if not tracked.is_closed]
+        
+        with self._tracked_clients(clients):
+            open_clients = asyncio.run(serve())
+        
+        self.assertEqual(len(clients), 1)
+        self.assertEqual(open_clients, clients)
+    
+    def test_json_response_matches_drf_rendering(self):
+        """Les vues asynchrones produisent le même corps JSON que les vues DRF"""
+        from rest_framework.renderers import JSONRenderer
+        from lending.utils import json_response
+        data = {'error': 'Livre non disponible pour l\'emprunt', 'book_id': 123}
+        
+        response = json_response(data, 400)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, JSONRenderer().render(data))
+
+
+class TestBulkLending(unittest.TestCase):
+    """Tests pour l'emprunt groupé de livres"""
+    
+    def test_availability_checked_concurrently(self):
+        """La disponibilité de tous les livres du lot est vérifiée en parallèle"""
+        from lending.checks import check_books_availability
+        
+        def slow_availability(book_id):
+            time.sleep(0.1)
+            return book_id != 3
+        
+        with patch('lending.checks.settings') as mock_settings, \
+                patch('lending.checks.book_service') as mock_book_service:
+            mock_settings.LEND_CHECKS = {'MODE': 'concurrent', 'MAX_WORKERS': 8}
+            mock_book_service.check_book_availability.side_effect = slow_availability
+            started = time.perf_counter()
+            availability = check_books_availability([1, 2, 3, 4])
+            elapsed = time.perf_counter() - started
+        
+        self.assertEqual(availability, {1: True, 2: True, 3: False, 4: True})
+        self.assertLess(elapsed, 0.3)
+    
+    def test_unfinished_availability_reported_as_none(self):
+        """Un livre dont la vérification dépasse le délai est marqué None"""
+        from lending.checks import check_books_availability
+        
+        with patch('lending.checks.settings') as mock_settings, \
+                patch('lending.checks.book_service') as mock_book_service:
+            mock_settings.LEND_CHECKS = {'MODE': 'concurrent', 'DEADLINE': 0.05}
+            mock_book_service.check_book_availability.side_effect = lambda book_id: time.sleep(0.3) or True
+            availability = check_books_availability([1])
+        
+        self.assertIsNone(availability[1])
+    
+    def test_bulk_serializer_limits(self):
+        """Le lot doit contenir au moins un livre et pas plus que BULK_MAX_ITEMS"""
+        from lending.serializers import LendBooksSerializer
+        
+        self.assertTrue(LendBooksSerializer(data={'user_email': 'test@example.com', 'book_ids': [1, 2]}).is_valid())
+        self.assertFalse(LendBooksSerializer(data={'user_email': 'test@example.com', 'book_ids': []}).is_valid())
+        self.assertFalse(LendBooksSerializer(data={'user_email': 'test@example.com', 'book_ids': [0]}).is_valid())
+
+
+class TestBulkReturn(unittest.TestCase):
+    """Tests pour le retour groupé de livres"""
+    
+    def test_grouped_return_notification_lists_all_titles(self):
+        """Un seul message de retour est envoyé pour tous les livres d'un utilisateur"""
+        from lending.notifications import NotificationDispatcher, GROUPED_RETURN_CONFIRMATION
+        notification_service = Mock()
+        notification_service.send_return_confirmation.return_value = True
+        book_service = Mock()
+        book_service.get_book_details.side_effect = lambda book_id: {'title': f'Livre {book_id}'}
+        dispatcher = NotificationDispatcher(notification_service, book_service, {'ASYNC': False})
+        
+        self.assertTrue(dispatcher.enqueue(GROUPED_RETURN_CONFIRMATION, 'test@example.com', [1, 2, 3]))
+        notification_service.send_return_confirmation.assert_called_once_with(
+            'test@example.com', 'Livre 1, Livre 2, Livre 3'
+        )
+    
+    def test_user_email_optional_for_book_drop(self):
+        """La boîte de retour peut retourner des livres sans connaître l'emprunteur"""
+        from lending.serializers import ReturnBooksSerializer
+        
+        self.assertTrue(ReturnBooksSerializer(data={'book_ids': [1, 2]}).is_valid())
+        self.assertFalse(ReturnBooksSerializer(data={'user_email': 'invalid', 'book_ids': [1]}).is_valid())
+
+
+class TestKeysetPagination(unittest.TestCase):
+    """Tests pour la pagination par curseur et le streaming des livres expirés"""
+    
+    ordering = ('date_due', 'id')
+    
+    def test_cursor_round_trip(self):
+        """Le curseur opaque restitue la position de la dernière ligne"""
+        from django.utils import timezone
+        from lending.pagination import KeysetPagination
+        due = timezone.now()
+        cursor = KeysetPagination.encode_cursor([due, 42])
+        paginator = KeysetPagination(self.ordering, {'cursor': cursor})
+        
+        from lending.models import Lending
+        self.assertEqual(paginator._typed_position(Lending), [due, 42])
+    
+    def test_invalid_cursor_and_page_size_rejected(self):
+        """Un curseur ou une taille de page invalide donne une erreur client"""
+        from lending.pagination import KeysetPagination, InvalidCursor
+        
+        for params in ({'cursor': 'zzz'}, {'cursor': KeysetPagination.encode_cursor([1])},
+                       {'page_size': '0'}, {'page_size': 'abc'}):
+            with self.assertRaises(InvalidCursor):
+                KeysetPagination(self.ordering, params)
+    
+    def test_page_size_capped(self):
+        """La taille de page demandée est bornée par MAX_PAGE_SIZE"""
+        from lending.pagination import KeysetPagination
+        
+        paginator = KeysetPagination(self.ordering, {'page_size': '100000'})
+        self.assertEqual(paginator.page_size, paginator.max_page_size)
+        self.assertEqual(KeysetPagination(self.ordering, {}).page_size, 20)
+    
+    def test_next_cursor_only_when_more_rows(self):
+        """La ligne supplémentaire lue indique qu'une page suivante existe"""
+        from lending.pagination import KeysetPagination
+        paginator = KeysetPagination(self.ordering, {'page_size': '2'})
+        rows = [Mock(date_due=datetime(2026, 1, 1), id=i) for i in range(3)]
+        
+        page, next_cursor = paginator.get_page(rows)
+        self.assertEqual(len(page), 2)
+        self.assertEqual(paginator.decode_cursor(next_cursor), ['2026-01-01T00:00:00', 1])
+        self.assertEqual(paginator.get_page(rows[:2])[1], None)
+    
+    def test_keyset_filter_uses_row_comparison(self):
+        """La page suivante filtre sur (date_due, id) au lieu d'un OFFSET"""
+        from django.utils import timezone
+        from lending.models import Lending
+        from lending.pagination import KeysetPagination
+        cursor = KeysetPagination.encode_cursor([timezone.now(), 7])
+        queryset = KeysetPagination(self.ordering, {'cursor': cursor, 'page_size': '5'}).paginate_queryset(
+            Lending.objects.all()
+        )
+        sql = str(queryset.query)
+        
+        self.assertIn('"date_due" >', sql)
+        self.assertIn('"id" >', sql)
+        self.assertIn('LIMIT 6', sql)
+        self.assertNotIn('OFFSET', sql)
+    
+    def test_streamed_array_matches_rendered_list(self):
+        """Le tableau JSON en streaming est identique au rendu de la liste complète"""
+        from rest_framework.renderers import JSONRenderer
+        from lending.streaming import iter_json_array, iter_ndjson
+        rows = [{'id': 1, 'book_id': 10}, {'id': 2, 'book_id': 20}]
+        
+        self.assertEqual(b''.join(iter_json_array(rows, dict)), JSONRenderer().render(rows))
+        self.assertEqual(b''.join(iter_json_array([], dict)), b'[]')
+        self.assertEqual(b''.join(iter_ndjson(rows, dict)).splitlines()[1], b'{"id":2,"book_id":20}')
+
+
+class TestOverdueSweeper(unittest.TestCase):
+    """Tests pour le passage des prêts échus en OVERDUE"""
+    
+    def test_sweep_in_bounded_batches_and_advance_high_water_mark(self):
+        """Les prêts échus sont mis à jour par lots et le point de reprise avance"""
+        from django.utils import timezone
+        from lending import sweeper
+        now = timezone.now()
+        batches = [[(1, now - timedelta(days=2)), (2, now - timedelta(days=1))], [(3, now - timedelta(hours=1))]]
+        
+        due = MagicMock()
+        due.filter.return_value = due
+        due.order_by.return_value.values_list.return_value.__getitem__.side_effect = lambda _: batches.pop(0)
+        updated = MagicMock()
+        updated.update.side_effect = lambda **kwargs: 2 if len(batches) == 1 else 1
+        state = Mock(high_water_mark=None)
+        
+        with patch.object(sweeper, 'Lending') as lending_model, \
+             patch.object(sweeper, 'OverdueSweepState') as state_model, \
+             patch.object(sweeper, 'record_status_change') as record_status_change, \
+             patch.object(sweeper.transaction, 'atomic'):
+            lending_model.objects.filter.side_effect = lambda **kwargs: updated if 'id__in' in kwargs else due
+            state_model.objects.get_or_create.return_value = (state, False)
+            state_model.objects.select_for_update.return_value.get.return_value = state
+            stats = sweeper.sweep_overdue_lendings(batch_size=2, now=now)
+        
+        self.assertEqual(stats['swept'], 3)
+        self.assertEqual(stats['batches'], 2)
+        # Lot incomplet : toutes les échéances jusqu'à maintenant sont traitées
+        self.assertEqual(state.high_water_mark, now)
+        updated.update.assert_called_with(status='OVERDUE')
+        # Statistiques mises à jour dans la transaction de chaque lot
+        self.assertEqual([call.args for call in record_status_change.call_args_list],
+                         [('ACTIVE', 'OVERDUE', 2), ('ACTIVE', 'OVERDUE', 1)])
+    
+    def test_expired_books_endpoint_is_read_only(self):
+        """GET /getExpiredBooks ne fait plus d'UPDATE"""
+        from rest_framework.test import APIRequestFactory
+        from lending import views
+        
+        with patch.object(views, 'Lending') as lending_model, patch('lending.utils.get_lending_version', return_value=0):
+            response = views.get_expired_books(APIRequestFactory().get('/api/getExpiredBooks/'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+        self.assertNotIn('update', [call[0].split('.')[-1] for call in lending_model.mock_calls])
+    
+    def _get_expired_books(self, query, rows):
+        from rest_framework.test import APIRequestFactory
+        from lending import views
+        
+        with patch.object(views, 'Lending') as lending_model, patch('lending.utils.get_lending_version', return_value=0):
+            queryset = lending_model.objects.filter.return_value.values_list.return_value
+            queryset.order_by.return_value.__getitem__.return_value = rows
+            return views.get_expired_books(APIRequestFactory().get(f'/api/getExpiredBooks/{query}', HTTP_HOST='localhost'))
+    
+    def test_expired_books_keep_array_shape(self):
+        """Sans page_size, la réponse reste un tableau ; la page suivante est dans l'en-tête Link"""
+        from lending.benchmarks import make_lending_rows
+        _, rows = make_lending_rows(21)
+        
+        response = self._get_expired_books('', rows)
+        
+        self.assertIsInstance(response.data, list)
+        self.assertEqual([item['id'] for item in response.data], list(range(1, 21)))
+        self.assertRegex(response['Link'], r'^<http://localhost/api/getExpiredBooks/\?cursor=[\w-]+>; rel="next"$')
+        self.assertFalse(self._get_expired_books('', rows[:3]).has_header('Link'))
+    
+    def test_expired_books_envelope_with_page_size(self):
+        """Avec page_size, la réponse est l'enveloppe {next, results}"""
+        from lending.benchmarks import make_lending_rows
+        _, rows = make_lending_rows(6)
+        
+        response = self._get_expired_books('?page_size=5', rows)
+        
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIn('page_size=5', response.data['next'])
+        self.assertFalse(response.has_header('Link'))
+
+
+class TestLendingQueryIndexes(unittest.TestCase):
+    """Vérifie que les requêtes des vues sont servies par un index (EXPLAIN)"""
+    
+    def _view_queries(self):
+        """Formes des requêtes de views.py, operations.py, export.py et sweeper.py"""
+        from django.utils import timezone
+        from lending.models import Lending
+        now = timezone.now()
+        active = Lending.objects.filter(user_email='test@example.com', book_id=123, status='ACTIVE')
+        return {
+            'prêt actif existant': active,
+            'retour': active.order_by('pk')[:1],
+            'retour groupé': Lending.objects.filter(book_id__in=[1, 2, 3], status='ACTIVE'),
+            'livres expirés': Lending.objects.filter(
+                date_due__lt=now, status='OVERDUE'
+            ).order_by('date_due', 'id')[:21],
+            'sweeper': Lending.objects.filter(
+                status='ACTIVE', date_due__lt=now, date_due__gte=now - timedelta(days=1)
+            ).order_by('date_due', 'id').values_list('id', 'date_due')[:1000],
+            'prêts d\'un utilisateur': Lending.objects.filter(
+                user_email='test@example.com', id__gt=10
+            ).order_by('id')[:21],
+            'export': Lending.objects.filter(
+                date_borrowed__gte=now - timedelta(days=30), pk__gt=1000
+            ).order_by('pk')[:50000],
+            'prêts d\'un utilisateur par statut': Lending.objects.filter(
+                user_email='test@example.com', status__in=['ACTIVE', 'OVERDUE']
+            ).order_by('id')[:21],
+        }
+    
+    def _plans(self, connection, explain_prefix):
+        plans = {}
+        with connection.cursor() as cursor:
+            for name, queryset in self._view_queries().items():
+                sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+                cursor.execute(explain_prefix + sql, params)
+                plans[name] = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        return plans
+    
+    def test_view_queries_use_indexes_on_sqlite(self):
+        """SQLite : aucune requête ne parcourt toute la table"""
+        from django.db.utils import ConnectionHandler
+        from lending.models import Lending
+        connection = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+        })['default']
+        try:
+            with connection.schema_editor() as editor:
+                editor.create_model(Lending)
+            plans = self._plans(connection, 'EXPLAIN QUERY PLAN ')
+        finally:
+            connection.close()
+        
+        for name, plan in plans.items():
+            self.assertIn('USING', plan, f"{name}: {plan}")
+            self.assertNotIn('SCAN lending_lending', plan, f"{name}: {plan}")
+    
+    def test_view_queries_use_indexes_on_postgresql(self):
+        """PostgreSQL : plans sans Seq Scan, dans un schéma temporaire annulé en fin de test"""
+        from django.conf import settings
+        from django.db.utils import ConnectionHandler
+        from lending.models import Lending
+        database = settings.DATABASES['default']
+        if 'postgresql' not in database['ENGINE']:
+            self.skipTest('Base PostgreSQL non configurée')
+        
+        connection = ConnectionHandler({'default': dict(database)})['default']
+        try:
+            connection.set_autocommit(False)
+            with connection.cursor() as cursor:
+                cursor.execute('CREATE SCHEMA lending_explain_test')
+                cursor.execute('SET LOCAL search_path TO lending_explain_test')
+                # Table vide : on interdit le parcours séquentiel pour savoir si un index est utilisable
+                cursor.execute('SET LOCAL enable_seqscan TO off')
+            with connection.schema_editor(atomic=False) as editor:
+                editor.create_model(Lending)
+            plans = self._plans(connection, 'EXPLAIN ')
+        finally:
+            connection.rollback()
+            connection.close()
+        
+        for name, plan in plans.items():
+            self.assertIn('Index', plan, f"{name}: {plan}")
+            self.assertNotIn('Seq Scan', plan, f"{name}: {plan}")
+
+
+class TestFastSerialization(unittest.TestCase):
+    """Tests pour la sérialisation rapide et le renderer orjson"""
+    
+    def test_row_serializer_matches_model_serializer(self):
+        """Le fast-path produit les mêmes dictionnaires que LendingSerializer"""
+        from django.utils import timezone
+        from lending.benchmarks import make_lending_rows
+        from lending.serializers import LendingSerializer, LendingRowSerializer
+        instances, rows = make_lending_rows(30)
+        
+        for zone in ('Europe/Paris', 'UTC'):
+            with timezone.override(zone):
+                self.assertEqual(
+                    list(LendingRowSerializer().serialize(rows)),
+                    [dict(item) for item in LendingSerializer(instances, many=True).data]
+                )
+        with timezone.override('UTC'):
+            self.assertTrue(LendingRowSerializer().to_representation(rows[0])['date_due'].endswith('Z'))
+    
+    def test_orjson_renderer_is_byte_compatible(self):
+        """ORJSONRenderer produit exactement les octets de JSONRenderer"""
+        from decimal import Decimal
+        from django.utils import timezone
+        from rest_framework.renderers import JSONRenderer
+        from lending.renderers import ORJSONRenderer
+        payloads = [
+            {'next': None, 'results': [{'id': 1, 'user_email': 'test@example.com', 'status': 'ACTIVE'}]},
+            {'latency_p99': 5e-05, 'big': 1e16, 'ratio': 0.25},
+            {'title': 'Ligne\u2028suivante \u00e9\u00e8 \U0001F4DA', 'escapes': '"\\\n\t\x00'},
+            {1: 'clé entière', 'huge': 2 ** 70, 'price': Decimal('1.50'), 'now': timezone.now()},
+            [],
+        ]
+        
+        for payload in payloads:
+            self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        indented = ORJSONRenderer().render({'a': [1]}, 'application/json; indent=2', {})
+        self.assertEqual(indented, JSONRenderer().render({'a': [1]}, 'application/json; indent=2', {}))
+    
+    def test_benchmark_reports_identical_output(self):
+        """Le benchmark compare des chemins qui produisent les mêmes octets"""
+        from lending.benchmarks import benchmark_serialization
+        result = benchmark_serialization(count=200, repeat=1)
+        
+        self.assertTrue(result['identical_output'])
+        self.assertEqual(set(result['paths']), {'drf', 'rows', 'rows_orjson'})
+        self.assertGreater(result['paths']['rows_orjson']['rows_per_second'], 0)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Tests pour le disjoncteur et le budget de tentatives des appels aux microservices"""
+    
+    def setUp(self):
+        self.now = [1000.0]
+        clock = Mock(monotonic=lambda: self.now[0], time=lambda: self.now[0])
+        patcher = patch('lending.resilience.time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def _breaker(self, **kwargs):
+        from lending.resilience import CircuitBreaker
+        config = {'window': 30, 'min_calls': 4, 'failure_rate': 0.5, 'slow_call_threshold': 2.0,
+                  'slow_call_rate': 0.8, 'open_seconds': 15, 'half_open_calls': 2}
+        return CircuitBreaker('book', **{**config, **kwargs})
+    
+    def test_opens_on_error_rate_then_half_opens_and_closes(self):
+        """Fermé -> ouvert sur taux d'erreurs, puis semi-ouvert et refermé après des essais réussis"""
+        from lending.resilience import CLOSED, OPEN, HALF_OPEN
+        breaker = self._breaker()
+        for failed in (False, True, False, True):
+            self.assertTrue(breaker.allow_request())
+            breaker._record(failed, 0.1)
+        
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow_request())
+        self.now[0] += 15
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success(0.1)
+        breaker.record_success(0.1)
+        
+        stats = breaker.stats()
+        self.assertEqual(stats['state'], CLOSED)
+        self.assertEqual(stats['rejected'], 2)
+        self.assertEqual(stats['transitions'], {'closed->open': 1, 'open->half_open': 1, 'half_open->closed': 1})
+    
+    def test_opens_on_slow_calls_and_half_open_failure_reopens(self):
+        """Les appels lents ouvrent le circuit ; un essai en échec le rouvre"""
+        from lending.resilience import OPEN
+        breaker = self._breaker()
+        for _ in range(4):
+            breaker.record_success(2.5)
+        self.assertEqual(breaker.state, OPEN)
+        
+        self.now[0] += 15
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, OPEN)
+    
+    def test_old_calls_leave_the_window(self):
+        """Les échecs anciens ne comptent plus"""
+        from lending.resilience import CLOSED
+        breaker = self._breaker()
+        for _ in range(3):
+            breaker.record_failure(0.1)
+        self.now[0] += 31
+        breaker.record_failure(0.1)
+        self.assertEqual(breaker.state, CLOSED)
+    
+    def test_retry_budget_limits_retries(self):
+        """Le budget borne les tentatives à ratio × requêtes + minimum"""
+        from lending.resilience import RetryBudget
+        budget = RetryBudget(ratio=0.5, min_per_second=0.1, window=10)
+        for _ in range(4):
+            budget.record_request()
+        
+        self.assertEqual([budget.try_acquire() for _ in range(4)], [True, True, True, False])
+        self.assertEqual(budget.stats()['budget_exhausted'], 1)
+    
+    def _client(self, **config):
+        from lending.resilience import ServiceResilience
+        from lending.services import MicroserviceClient
+        client = MicroserviceClient('http://book-service:8001')
+        client.resilience = ServiceResilience('book', {'BREAKER_MIN_CALLS': 2, **config})
+        return client
+    
+    @patch('lending.services.time.sleep')
+    @patch('requests.Session.request')
+    def test_idempotent_requests_retried_with_backoff(self, mock_request, mock_sleep):
+        """Un GET est rejoué après une erreur de connexion, un POST ne l'est pas"""
+        import requests
+        ok = Mock(content=b'{"id": 1}')
+        ok.json.return_value = {'id': 1}
+        mock_request.side_effect = [requests.exceptions.ConnectionError(), ok]
+        client = self._client(BREAKER_MIN_CALLS=10)
+        
+        self.assertEqual(client._make_request('GET', '/getBooks/1'), {'id': 1})
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(mock_sleep.call_count, 1)
+        self.assertLessEqual(mock_sleep.call_args[0][0], 0.1)
+        
+        mock_request.reset_mock(side_effect=True)
+        mock_request.side_effect = requests.exceptions.ConnectionError()
+        self.assertIsNone(client._make_request('POST', '/send-notification', data={}))
+        self.assertEqual(mock_request.call_count, 1)
+    
+    @patch('lending.services.time.sleep')
+    @patch('requests.Session.request')
+    def test_open_circuit_fails_fast(self, mock_request, mock_sleep):
+        """Circuit ouvert : aucun appel HTTP, CircuitOpenError si l'indisponibilité est demandée"""
+        import requests
+        from lending.services import CircuitOpenError
+        mock_request.side_effect = requests.exceptions.Timeout()
+        client = self._client(MAX_RETRIES=0)
+        client._make_request('GET', '/getBooks/1')
+        client._make_request('GET', '/getBooks/2')
+        mock_request.reset_mock()
+        
+        with self.assertRaises(CircuitOpenError):
+            client._make_request('GET', '/users/test@example.com', raise_unavailable=True)
+        mock_request.assert_not_called()
+    
+    @patch('requests.Session.request')
+    def test_client_errors_do_not_trip_breaker(self, mock_request):
+        """Une 404 est une réponse normale du service"""
+        import requests
+        from lending.resilience import CLOSED
+        not_found = Mock(status_code=404, text='Not found')
+        not_found.raise_for_status.side_effect = requests.exceptions.HTTPError(response=not_found)
+        mock_request.return_value = not_found
+        client = self._client()
+        
+        for _ in range(5):
+            self.assertIsNone(client._make_request('GET', '/getBooks/404'))
+        self.assertEqual(client.resilience.breaker.state, CLOSED)
+
+
+class TestPrometheusMetrics(unittest.TestCase):
+    """Tests pour les métriques Prometheus exposées sur /metrics"""
+    
+    def _sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+    
+    def test_endpoint_template_hides_identifiers(self):
+        """Les identifiants des appels sortants ne deviennent pas des labels"""
+        from lending.metrics import endpoint_template
+        self.assertEqual(endpoint_template('/getBooks/42'), '/getBooks/{id}')
+        self.assertEqual(endpoint_template('/users/test@example.com'), '/users/{email}')
+        self.assertEqual(endpoint_template('/send-notification'), '/send-notification')
+    
+    def test_middleware_counts_requests_and_queries_per_view(self):
+        """Requête comptée sous le nom de sa route, avec les requêtes SQL exécutées pendant la vue"""
+        from django.test import RequestFactory
+        from lending.metrics import observe_query
+        from lending.middleware import PrometheusMetricsMiddleware
+        
+        def view(request):
+            request.resolver_match = Mock(url_name='metrics_test_view')
+            for _ in range(3):
+                observe_query(Mock(), 'SELECT 1', (), False, {})
+            return Mock(status_code=201)
+        
+        before = self._sample('lending_http_requests_total', view='metrics_test_view', method='POST', status='201')
+        PrometheusMetricsMiddleware(view)(RequestFactory().post('/api/test/'))
+        
+        self.assertEqual(self._sample('lending_http_requests_total', view='metrics_test_view',
+                                      method='POST', status='201') - before, 1)
+        self.assertEqual(self._sample('lending_db_queries_per_request_sum', view='metrics_test_view'), 3)
+        self.assertEqual(self._sample('lending_db_query_duration_seconds_count', view='metrics_test_view'), 3)
+    
+    def test_query_observer_installed_once_before_temporary_wrappers(self):
+        """Une connexion rouverte n'est pas instrumentée deux fois"""
+        from lending.metrics import install_query_observer, observe_query
+        temporary = Mock()
+        connection = Mock(execute_wrappers=[temporary])
+        install_query_observer(None, connection)
+        install_query_observer(None, connection)
+        self.assertEqual(connection.execute_wrappers, [observe_query, temporary])
+    
+    @patch('requests.Session.request')
+    def test_dependency_calls_recorded_by_outcome(self, mock_request):
+        """Chaque tentative est mesurée ; les échecs et refus du disjoncteur sont comptés"""
+        import requests
+        from lending.resilience import ServiceResilience
+        from lending.services import MicroserviceClient
+        client = MicroserviceClient('http://book-service:8001')
+        client.service_name = 'metrics-test'
+        client.resilience = ServiceResilience('metrics-test', {'MAX_RETRIES': 0, 'BREAKER_MIN_CALLS': 2})
+        mock_request.side_effect = requests.exceptions.Timeout()
+        labels = {'service': 'metrics-test', 'method': 'GET', 'endpoint': '/getBooks/{id}'}
+        
+        for book_id in (1, 2, 3):
+            client._make_request('GET', f'/getBooks/{book_id}')
+        
+        self.assertEqual(self._sample('lending_dependency_request_duration_seconds_count',
+                                      outcome='timeout', **labels), 2)
+        self.assertEqual(self._sample('lending_dependency_errors_total', error='timeout', **labels), 2)
+        self.assertEqual(self._sample('lending_dependency_errors_total', error='circuit_open', **labels), 1)
+        self.assertEqual(self._sample('lending_circuit_breaker_state', service='metrics-test'), 2)
+    
+    @patch('lending.metrics.LendingStatusCount')
+    def test_lending_gauges_default_to_zero(self, mock_status_count):
+        """Jauges ACTIVE et OVERDUE lues dans la table de statistiques, à zéro si aucun prêt"""
+        from lending.metrics import LendingStatusCollector
+        queryset = mock_status_count.objects.filter.return_value.values_list.return_value.annotate.return_value
+        queryset.order_by.return_value = [('OVERDUE', 7)]
+        
+        (gauge,) = LendingStatusCollector().collect()
+        
+        self.assertEqual({s.labels['status']: s.value for s in gauge.samples}, {'ACTIVE': 0, 'OVERDUE': 7})
+        mock_status_count.objects.filter.assert_called_once_with(status__in=('ACTIVE', 'OVERDUE'))
+    
+    @patch('lending.metrics.LendingStatusCollector.collect', return_value=iter(()))
+    def test_metrics_view_exposition_format(self, mock_collect):
+        """/metrics répond au format texte Prometheus"""
+        from django.test import RequestFactory
+        from prometheus_client import CONTENT_TYPE_LATEST
+        from lending.metrics import metrics_view
+        response = metrics_view(RequestFactory().get('/metrics'))
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE_LATEST)
+        self.assertIn(b'# TYPE lending_http_requests_total counter', response.content)
+
+
+class TestServerTiming(unittest.TestCase):
+    """Tests pour la décomposition du temps des requêtes (Server-Timing, requêtes lentes)"""
+    
+    def _run(self, view, **config):
+        from django.test import override_settings
+        from lending.middleware import ServerTimingMiddleware
+        profiling = {'SLOW_REQUEST_THRESHOLD': 60, 'SLOW_REQUEST_SAMPLE_RATE': 0, **config}
+        with override_settings(REQUEST_PROFILING=profiling):
+            return ServerTimingMiddleware(view)(self._request())
+    
+    def _request(self):
+        from django.test import RequestFactory
+        return RequestFactory().post('/api/lendBook/')
+    
+    def test_header_breaks_down_phases(self):
+        """SQL, appels aux microservices et sérialisation apparaissent avec leur nombre"""
+        from lending.metrics import observe_dependency_call
+        from lending.renderers import ORJSONRenderer
+        from lending.timing import phase, record_query
+        
+        def view(request):
+            record_query('SELECT 1', 0.002)
+            record_query('SELECT 2', 0.001)
+            observe_dependency_call('user', 'GET', '/users/test@example.com', 0.040, 'success')
+            observe_dependency_call('book', 'GET', '/getBooks/1', 0.030, 'success')
+            with phase('serialize'):
+                data = {'id': 1}
+            ORJSONRenderer().render(data)
+            return HttpResponseStub(201)
+        
+        response = self._run(view)
+        
+        header = response['Server-Timing']
+        self.assertIn('db;dur=3.00;desc="2 queries"', header)
+        self.assertIn('user;dur=40.00;desc="1 calls"', header)
+        self.assertIn('book;dur=30.00;desc="1 calls"', header)
+        # Construction des données et rendu JSON sont des phases distinctes
+        self.assertRegex(header, r'serialize;dur=[\d.]+;desc="1 passes"')
+        self.assertRegex(header, r'render;dur=[\d.]+;desc="1 passes"')
+        self.assertTrue(header.split(', ')[-1].startswith('total;dur='))
+    
+    def test_concurrent_checks_recorded_in_request_profile(self):
+        """Les appels faits dans les threads des vérifications concurrentes sont comptés"""
+        import contextvars
+        from concurrent.futures import ThreadPoolExecutor
+        from lending.timing import current_profile, record_phase
+        
+        def view(request):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                for _ in range(2):
+                    executor.submit(contextvars.copy_context().run, record_phase, 'book', 0.01).result()
+            return HttpResponseStub(200, profile=current_profile())
+        
+        response = self._run(view)
+        self.assertEqual(response.profile.count('book'), 2)
+    
+    def test_slow_sampled_request_logged_with_sql(self):
+        """Une requête lente échantillonnée est journalisée avec ses phases et son SQL"""
+        def view(request):
+            from lending.timing import record_query
+            record_query('SELECT * FROM lending_lending', 0.5)
+            return HttpResponseStub(200)
+        
+        with self.assertLogs('lending.timing', level='WARNING') as logs:
+            self._run(view, SLOW_REQUEST_THRESHOLD=0, SLOW_REQUEST_SAMPLE_RATE=1)
+        
+        entry = json.loads(logs.records[0].getMessage().split(' : ', 1)[1])
+        self.assertEqual(entry['phases']['db'], {'duration_ms': 500.0, 'count': 1})
+        self.assertEqual(entry['sql'][0]['sql'], 'SELECT * FROM lending_lending')
+    
+    def test_fast_or_unsampled_requests_not_logged(self):
+        """Sous le seuil, ou hors échantillon, rien n'est journalisé"""
+        from lending.timing import RequestProfile, log_if_slow
+        with patch('lending.timing.logger') as mock_logger:
+            log_if_slow(RequestProfile(self._request(), capture_sql=True), threshold=60)
+            log_if_slow(RequestProfile(self._request(), capture_sql=False), threshold=0)
+        mock_logger.warning.assert_not_called()
+    
+    def test_logged_sql_is_capped(self):
+        """Le SQL conservé est borné par MAX_LOGGED_QUERIES"""
+        from lending.timing import _current_profile, RequestProfile, record_query
+        profile = RequestProfile(self._request(), capture_sql=True, max_sql=2)
+        token = _current_profile.set(profile)
+        try:
+            for _ in range(5):
+                record_query('SELECT 1', 0.001)
+        finally:
+            _current_profile.reset(token)
+        self.assertEqual(profile.count('db'), 5)
+        self.assertEqual(len(profile.sql), 2)
+
+
+class HttpResponseStub(dict):
+    """Réponse minimale : en-têtes et statut"""
+    
+    def __init__(self, status_code, profile=None):
+        super().__init__()
+        self.status_code = status_code
+        self.profile = profile
+
+
+class TestLoadHarness(unittest.TestCase):
+    """Tests pour le banc de charge (bouchons, générateur de charge, comparaison à la référence)"""
+    
+    MOCKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'mocks')
+    
+    def _stub(self, expectations, **kwargs):
+        from lending.loadtest import StubServer
+        stub = StubServer('test', expectations, **kwargs).start()
+        self.addCleanup(stub.stop)
+        return stub
+    
+    def test_stub_serves_mockserver_expectations(self):
+        """Les bouchons répondent comme les expectations MockServer de mocks/"""
+        import requests
+        from lending.loadtest import load_expectations
+        stub = self._stub(load_expectations(os.path.join(self.MOCKS_DIR, 'book-management-expectations.json')))
+        
+        book = requests.get(f'{stub.url}/getBooks/42', timeout=5)
+        self.assertEqual(book.status_code, 200)
+        self.assertTrue(book.json()['available'])
+        self.assertEqual(requests.put(f'{stub.url}/updateBook/42', json={}, timeout=5).json()['success'], True)
+        self.assertEqual(requests.get(f'{stub.url}/unknown', timeout=5).status_code, 404)
+    
+    def test_stub_injects_errors(self):
+        """Avec error_rate=1, toutes les réponses sont des 503"""
+        from lending.loadtest import load_expectations
+        stub = self._stub(load_expectations(os.path.join(self.MOCKS_DIR, 'user-management-expectations.json')),
+                          error_rate=1.0)
+        status_code, _, _ = stub.respond('GET', '/users/test@example.com')
+        self.assertEqual(status_code, 503)
+        self.assertEqual(stub.stats()['injected_errors'], 1)
+    
+    def test_driver_reports_percentiles_per_operation(self):
+        """Le générateur de charge mesure chaque opération ; les retours réutilisent les prêts créés"""
+        import re
+        from lending.loadtest import LoadDriver
+        responses = [('POST', r'/api/lendBook/', 201), ('POST', r'/api/returnBook/', 200),
+                     ('GET', r'/api/getExpiredBooks/', 200)]
+        stub = self._stub([
+            {'method': method, 'path': re.compile(path), 'status': code, 'headers': {}, 'body': b'{}'}
+            for method, path, code in responses
+        ])
+        
+        result = LoadDriver(stub.url, {'lend': 1, 'return': 1, 'expired': 1}, concurrency=2).run(0.3)
+        
+        self.assertEqual(set(result['operations']), {'lend', 'return', 'expired'})
+        self.assertEqual(result['overall']['errors'], 0)
+        lend = result['operations']['lend']
+        self.assertLessEqual(lend['p50_ms'], lend['p95_ms'])
+        self.assertLessEqual(lend['p95_ms'], lend['p99_ms'])
+        self.assertEqual(lend['statuses'], {'201': lend['requests']})
+    
+    def test_percentile_nearest_rank(self):
+        """Percentile par rang le plus proche"""
+        from lending.loadtest import percentile
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 95), 0.0)
+    
+    def test_regressions_detected_against_baseline(self):
+        """Baisse de débit et hausse du p95 au-delà de la tolérance signalées"""
+        from lending.loadtest import compare_to_baseline
+        reference = {'requests': 1000, 'errors': 0, 'throughput': 100.0, 'p95_ms': 50.0, 'p99_ms': 80.0}
+        baseline = {'overall': reference, 'operations': {'lend': reference}}
+        slower = {**reference, 'throughput': 70.0, 'p95_ms': 70.0}
+        
+        self.assertEqual(compare_to_baseline(baseline, baseline), [])
+        regressions = compare_to_baseline({'overall': reference, 'operations': {'lend': slower}}, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(message.startswith('lend') for message in regressions))
+    
+    def test_server_uses_throwaway_sqlite_unless_opted_in(self):
+        """Base configurée PostgreSQL : migrate et la charge visent une base SQLite jetable, sauf opt-in"""
+        import tempfile
+        from lending.management.commands import loadtest
+        stubs = {name: Mock(url=f'http://127.0.0.1:{port}') for port, name in
+                 enumerate(loadtest.SERVICE_URL_SETTINGS, start=18001)}
+        options = {'port': 8765, 'workers': 1, 'server': 'runserver'}
+        databases = {'default': {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'lending_db'}}
+        
+        environments = {}
+        with tempfile.TemporaryDirectory() as workdir, \
+                patch.object(loadtest.settings, 'DATABASES', databases), \
+                patch.object(loadtest.subprocess, 'run') as run, \
+                patch.object(loadtest.subprocess, 'Popen'):
+            for opt_in in (False, True):
+                loadtest.Command()._start_server({**options, 'use_configured_db': opt_in}, stubs, workdir)
+                environments[opt_in] = run.call_args.kwargs['env']
+        
+        self.assertEqual(environments[False]['DATABASE_ENGINE'], 'django.db.backends.sqlite3')
+        self.assertTrue(environments[False]['DATABASE_NAME'].endswith('loadtest.sqlite3'))
+        self.assertEqual(environments[True].get('DATABASE_NAME'), os.environ.get('DATABASE_NAME'))
+
+
+class TestSyntheticDataset(unittest.TestCase):
+    """Tests pour le générateur de jeu de données et les mesures de requêtes"""
+    
+    def _generate(self, count, **kwargs):
+        from django.utils import timezone
+        from lending.datasets import generate_lendings
+        self.now = timezone.now()
+        inserted = []
+        with patch('lending.datasets.Lending.objects') as objects, \
+                patch('lending.datasets.transaction'), patch('lending.datasets.connection'):
+            objects.aggregate.return_value = {'max_id': None}
+            objects.bulk_create.side_effect = lambda batch, batch_size: inserted.extend(batch)
+            result = generate_lendings(count, seed=1, now=self.now, **kwargs)
+        return result, inserted
+    
+    def test_rows_consistent_with_status(self):
+        """ACTIVE à échéance future, OVERDUE échu, RETURNED daté ; un seul prêt en cours par livre"""
+        result, rows = self._generate(3000, batch_size=700, users=50)
+        
+        self.assertEqual(result['created'], 3000)
+        self.assertEqual(len(rows), 3000)
+        self.assertEqual(sum(result['by_status'].values()), 3000)
+        for lending in rows:
+            self.assertEqual(lending.date_due - lending.date_borrowed, timedelta(days=60))
+            if lending.status == 'ACTIVE':
+                self.assertGreater(lending.date_due, self.now)
+            elif lending.status == 'OVERDUE':
+                self.assertLess(lending.date_due, self.now)
+            else:
+                self.assertTrue(lending.date_borrowed <= lending.date_returned <= self.now)
+        open_books = [lending.book_id for lending in rows if lending.status != 'RETURNED']
+        self.assertEqual(len(open_books), len(set(open_books)))
+    
+    def test_status_mix_and_user_skew(self):
+        """La répartition des statuts est respectée ; avec Zipf, le premier utilisateur domine"""
+        from lending.datasets import parse_status_mix
+        mix = parse_status_mix('returned=2,ACTIVE=1,OVERDUE=1')
+        self.assertEqual(mix, {'RETURNED': 0.5, 'ACTIVE': 0.25, 'OVERDUE': 0.25})
+        
+        result, rows = self._generate(4000, status_mix=mix, users=100, user_skew=1.2, books=5000)
+        
+        self.assertAlmostEqual(result['by_status']['RETURNED'] / 4000, 0.5, delta=0.05)
+        per_user = {}
+        for lending in rows:
+            per_user[lending.user_email] = per_user.get(lending.user_email, 0) + 1
+        self.assertEqual(max(per_user, key=per_user.get), 'user0@example.com')
+    
+    def test_not_enough_books_rejected(self):
+        """Plus de prêts en cours que de livres : refusé avant toute insertion"""
+        from lending.datasets import generate_lendings, parse_status_mix
+        with self.assertRaises(ValueError):
+            generate_lendings(10000, status_mix=parse_status_mix('ACTIVE=1'), books=5000)
+        with self.assertRaises(ValueError):
+            parse_status_mix('LOST=1')
+    
+    def test_time_calls_reports_per_call_duration(self):
+        """Durée par appel : médiane et meilleur des passages"""
+        from lending.benchmarks import _time_calls
+        calls = []
+        timing = _time_calls(calls.append, [1, 2, 3], repeat=4)
+        self.assertEqual(len(calls), 12)
+        self.assertEqual(timing['calls'], 3)
+        self.assertLessEqual(timing['best_ms'], timing['median_ms'])
+
+    def test_return_update_rolled_back(self):
+        """L'UPDATE de clôture mesuré est celui de returnBook, annulé en fin de transaction"""
+        from lending import benchmarks
+        filters = {'user_email': 'a@b.fr', 'book_id': 1, 'status': 'ACTIVE'}
+        with patch.object(benchmarks, 'close_lendings') as close, \
+                patch.object(benchmarks.transaction, 'atomic'), \
+                patch.object(benchmarks.transaction, 'set_rollback') as set_rollback:
+            benchmarks._rolled_back_close('default', filters, 'now')
+        close.assert_called_once_with('default', filters, {'status': 'RETURNED', 'date_returned': 'now'})
+        set_rollback.assert_called_once_with(True, using='default')
+
+
+class TestUserLendings(unittest.TestCase):
+    """Tests pour la liste des prêts d'un utilisateur (/lendings)"""
+    
+    def _get(self, query):
+        from rest_framework.test import APIRequestFactory
+        from lending import views
+        with patch.object(views, 'Lending') as lending_model, patch('lending.utils.get_lending_version', return_value=0):
+            response = views.get_user_lendings(APIRequestFactory().get(f'/api/lendings/?{query}'))
+        return response, lending_model
+    
+    def test_sparse_fields_match_full_serialization(self):
+        """?fields= produit un sous-ensemble des dictionnaires complets, dans l'ordre demandé"""
+        from lending.benchmarks import make_lending_rows
+        from lending.serializers import LendingRowSerializer
+        _, rows = make_lending_rows(5)
+        full = LendingRowSerializer().serialize(rows)
+        fields = ('date_returned', 'book_id')
+        # Colonne de tri ajoutée en fin de ligne pour le curseur : ignorée
+        sparse = LendingRowSerializer(fields).serialize(
+            [(row[5], row[2], row[0]) for row in rows]
+        )
+        
+        self.assertEqual(list(sparse), [{name: item[name] for name in fields} for item in full])
+        self.assertEqual(list(sparse[0]), list(fields))
+    
+    def test_filters_on_user_and_status_without_count(self):
+        """Filtre sur l'email puis le statut (égalité si un seul statut), sans décompte par défaut"""
+        response, lending_model = self._get('user_email=test@example.com&status=active')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'next': None, 'results': []})
+        lending_model.objects.filter.assert_called_once_with(user_email='test@example.com')
+        lending_model.objects.filter.return_value.filter.assert_called_once_with(status='ACTIVE')
+        self.assertNotIn('count', [call[0].split('.')[-1] for call in lending_model.mock_calls])
+    
+    def test_invalid_parameters_rejected(self):
+        """Email manquant, statut ou champ inconnu : 400"""
+        for query in ('status=ACTIVE', 'user_email=test@example.com&status=LOST',
+                      'user_email=test@example.com&fields=password'):
+            self.assertEqual(self._get(query)[0].status_code, 400, query)
+    
+    def test_bounded_count(self):
+        """Le décompte s'arrête à MAX_COUNT + 1 lignes"""
+        from lending.pagination import KeysetPagination
+        paginator = KeysetPagination(('id',), {})
+        queryset = MagicMock()
+        limited = queryset.order_by.return_value.values.return_value.__getitem__
+        
+        limited.return_value.count.return_value = paginator.max_count + 1
+        self.assertEqual(paginator.bounded_count(queryset), (paginator.max_count, False))
+        limited.assert_called_with(slice(None, paginator.max_count + 1))
+        limited.return_value.count.return_value = 3
+        self.assertEqual(paginator.bounded_count(queryset), (3, True))
+
+
+class TestLendingStats(unittest.TestCase):
+    """Tests pour les statistiques tenues à jour de façon incrémentale"""
+    
+    def test_increment_updates_then_creates_missing_row(self):
+        """UPDATE d'abord ; ligne créée au premier changement, ou incrémentée si créée entre-temps"""
+        from lending.stats import _increment
+        model = MagicMock()
+        model.objects.filter.return_value.update.return_value = 1
+        _increment(model, {'status': 'ACTIVE', 'shard': 3}, count=2)
+        model.objects.get_or_create.assert_not_called()
+        
+        model.objects.filter.return_value.update.return_value = 0
+        model.objects.get_or_create.return_value = (Mock(), True)
+        _increment(model, {'status': 'ACTIVE', 'shard': 3}, count=2)
+        model.objects.get_or_create.assert_called_once_with(status='ACTIVE', shard=3, defaults={'count': 2})
+        self.assertEqual(model.objects.filter.return_value.update.call_count, 2)
+        
+        model.objects.get_or_create.return_value = (Mock(), False)
+        _increment(model, {'status': 'ACTIVE', 'shard': 3}, count=2)
+        self.assertEqual(model.objects.filter.return_value.update.call_count, 4)
+    
+    def test_counters_locked_in_stable_order(self):
+        """Livres, jour puis statuts par ordre alphabétique, sur un même shard"""
+        from django.utils import timezone
+        from lending import stats
+        calls = []
+        increment = lambda model, lookup, **deltas: calls.append((model.__name__, lookup.get('status'), deltas))
+        
+        with patch.object(stats, '_increment', side_effect=increment), \
+             patch.object(stats, '_increment_books', side_effect=lambda ids: calls.append(('books', ids))), \
+             patch.object(stats, '_shard', return_value=5):
+            stats.record_lent([4, 2])
+            stats.record_returned(3, 'ACTIVE')
+            stats.record_status_change('ACTIVE', 'OVERDUE', 0)
+            stats.record_status_change('ACTIVE', 'OVERDUE', 2)
+        
+        self.assertEqual(calls, [
+            ('books', [4, 2]),
+            ('DailyLendingVolume', None, {'lent': 2, 'returned': 0}),
+            ('LendingStatusCount', 'ACTIVE', {'count': 2, 'changes': 1}),
+            ('DailyLendingVolume', None, {'lent': 0, 'returned': 3}),
+            ('LendingStatusCount', 'ACTIVE', {'count': -3, 'changes': 1}),
+            ('LendingStatusCount', 'RETURNED', {'count': 3, 'changes': 1}),
+            ('LendingStatusCount', 'ACTIVE', {'count': -2, 'changes': 1}),
+            ('LendingStatusCount', 'OVERDUE', {'count': 2, 'changes': 1}),
+        ])
+    
+    def test_stats_endpoint(self):
+        """Paramètres bornés, transmis à la lecture des statistiques"""
+        from rest_framework.test import APIRequestFactory
+        from lending import views
+        factory = APIRequestFactory()
+        
+        with patch.object(views, 'get_lending_stats', return_value={'total': 0}) as get_lending_stats, \
+             patch('lending.utils.get_lending_version', return_value=0):
+            response = views.get_stats(factory.get('/api/stats/?top=5&days=7'))
+            self.assertEqual(views.get_stats(factory.get('/api/stats/?days=1000')).status_code, 400)
+        
+        self.assertEqual(response.status_code, 200)
+        get_lending_stats.assert_called_once_with(top=5, days=7)
+
+
+class TestConditionalGet(unittest.TestCase):
+    """Tests pour les GET conditionnels (ETag / If-None-Match) des lectures de prêts"""
+    
+    def _view(self):
+        from django.http import HttpResponse
+        calls = []
+        def view(request):
+            calls.append(request)
+            return HttpResponse('{}', content_type='application/json')
+        return view, calls
+    
+    def test_matching_etag_skips_view(self):
+        """ETag identique : 304 sans exécuter la vue ; nouvelle version : réponse complète"""
+        from django.test import RequestFactory
+        from lending.utils import conditional_on_lendings
+        view, calls = self._view()
+        wrapped = conditional_on_lendings(view)
+        factory = RequestFactory()
+        
+        with patch('lending.utils.get_lending_version', return_value=7):
+            first = wrapped(factory.get('/api/getExpiredBooks/'))
+            etag = first['ETag']
+            not_modified = wrapped(factory.get('/api/getExpiredBooks/', HTTP_IF_NONE_MATCH=f'"x", {etag}'))
+            other_page = wrapped(factory.get('/api/getExpiredBooks/?cursor=abc', HTTP_IF_NONE_MATCH=etag))
+        with patch('lending.utils.get_lending_version', return_value=8):
+            changed = wrapped(factory.get('/api/getExpiredBooks/', HTTP_IF_NONE_MATCH=etag))
+        
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(etag.startswith('"7-'))
+        self.assertIn('no-cache', first['Cache-Control'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], etag)
+        self.assertEqual(other_page.status_code, 200)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(len(calls), 3)
+    
+    def test_async_view(self):
+        """Même comportement pour les vues asynchrones"""
+        import asyncio
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from lending.utils import conditional_on_lendings
+        calls = []
+        
+        @conditional_on_lendings
+        async def view(request):
+            calls.append(request)
+            return HttpResponse('{}')
+        
+        request = RequestFactory().get('/api/async/getExpiredBooks/')
+        with patch('lending.utils.get_lending_version', return_value=3):
+            etag = asyncio.run(view(request))['ETag']
+            response = asyncio.run(view(RequestFactory().get('/api/async/getExpiredBooks/', HTTP_IF_NONE_MATCH=etag)))
+        
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(calls), 1)
+
+
+class TestIdempotencyKeys(unittest.TestCase):
+    """Tests pour les requêtes POST avec Idempotency-Key"""
+    
+    def _request(self, key='abc', body=b'{"book_id": 1}'):
+        from django.test import RequestFactory
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key is not None else {}
+        return RequestFactory().post('/api/lendBook/', body, content_type='application/json', **headers)
+    
+    def _view(self):
+        from django.http import HttpResponse
+        calls = []
+        def view(request):
+            calls.append(request)
+            return HttpResponse(b'{"id": 1}', status=201, content_type='application/json')
+        return view, calls
+    
+    def test_first_request_executes_and_stores_response(self):
+        """Clé nouvelle : la vue s'exécute et sa réponse est mémorisée ; sans clé, rien n'est réservé"""
+        from lending import idempotency
+        view, calls = self._view()
+        
+        with patch.object(idempotency, 'claim_key', return_value=(idempotency.OWNER, 'token')) as claim_key, \
+             patch.object(idempotency, 'store_response') as store_response:
+            response = idempotency.idempotent(view)(self._request())
+            idempotency.idempotent(view)(self._request(key=None))
+        
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(calls), 2)
+        claim_key.assert_called_once()
+        self.assertEqual(claim_key.call_args.args[:2], ('/api/lendBook/', 'abc'))
+        store_response.assert_called_once_with('/api/lendBook/', 'abc', 'token', response)
+    
+    def test_retry_replays_stored_response(self):
+        """Clé déjà traitée : réponse rejouée à l'identique, sans exécuter la vue"""
+        from lending import idempotency
+        view, calls = self._view()
+        record = Mock(status_code=201, response_body=b'{"id": 1}', content_type='application/json')
+        
+        with patch.object(idempotency, 'claim_key', return_value=(idempotency.REPLAY, record)):
+            response = idempotency.idempotent(view)(self._request())
+        
+        self.assertEqual(calls, [])
+        self.assertEqual((response.status_code, response.content), (201, b'{"id": 1}'))
+        self.assertEqual(response[idempotency.REPLAYED_HEADER], 'true')
+    
+    def test_concurrent_duplicate_waits_then_replays(self):
+        """Doublon concurrent : attente de la première requête, 409 au-delà de WAIT_TIMEOUT"""
+        from django.test import override_settings
+        from lending import idempotency
+        view, calls = self._view()
+        record = Mock(status_code=201, response_body=b'{}', content_type='application/json')
+        outcomes = [(idempotency.PENDING, None), (idempotency.PENDING, None), (idempotency.REPLAY, record)]
+        
+        with patch.object(idempotency, 'claim_key', side_effect=outcomes), \
+             patch.object(idempotency.time, 'sleep') as sleep:
+            response = idempotency.idempotent(view)(self._request())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sleep.call_count, 2)
+        
+        with override_settings(IDEMPOTENCY={'WAIT_TIMEOUT': 0}), \
+             patch.object(idempotency, 'claim_key', return_value=(idempotency.PENDING, None)):
+            response = idempotency.idempotent(view)(self._request())
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(calls, [])
+    
+    def test_server_errors_release_the_key(self):
+        """Réponse 5xx : la clé est libérée au lieu d'être mémorisée"""
+        from lending import idempotency
+        model = MagicMock()
+        
+        with patch.object(idempotency, 'IdempotencyKey', model):
+            idempotency.store_response('/api/lendBook/', 'abc', 'token', Mock(status_code=503))
+            model.objects.filter.return_value.delete.assert_called_once()
+            idempotency.store_response('/api/lendBook/', 'abc', 'token', Mock(status_code=400, content=b'{}'))
+        
+        model.objects.filter.assert_called_with(
+            endpoint='/api/lendBook/', key='abc', owner='token', status_code__isnull=True
+        )
+        self.assertEqual(model.objects.filter.return_value.update.call_args.kwargs['status_code'], 400)
+    
+    def test_invalid_key_rejected(self):
+        """Clé vide ou trop longue : 400"""
+        from lending import idempotency
+        view, calls = self._view()
+        for key in ('  ', 'x' * 300):
+            self.assertEqual(idempotency.idempotent(view)(self._request(key=key)).status_code, 400)
+        self.assertEqual(calls, [])
+
+
+class TestConditionalWrites(unittest.TestCase):
+    """Tests pour l'emprunt et le retour en une seule écriture conditionnelle"""
+    
+    def test_lend_conflict_detected_by_constraint(self):
+        """Un prêt actif existant fait échouer l'INSERT : ni notification ni cache modifié"""
+        from django.db import IntegrityError
+        from lending import operations
+        
+        with patch.object(operations, 'Lending') as lending_model, \
+             patch.object(operations, 'transaction'), \
+             patch.object(operations, 'BookAvailabilityOutbox') as outbox, \
+             patch.object(operations, 'book_service') as book_service, \
+             patch.object(operations, 'notification_dispatcher') as dispatcher:
+            lending_model.objects.create.side_effect = IntegrityError('lending_unique_active_loan')
+            lending = operations.create_lending('test@example.com', 123)
+        
+        self.assertIsNone(lending)
+        lending_model.objects.filter.assert_not_called()
+        outbox.objects.create.assert_not_called()
+        book_service.apply_cached_availability.assert_not_called()
+        dispatcher.enqueue.assert_not_called()
+    
+    def _memory_database(self):
+        """Base SQLite en mémoire, déclarée sous un alias temporaire, avec la table des prêts"""
+        from django.db import connections
+        from lending.models import BookAvailabilityOutbox, Lending
+        alias = 'update_returning'
+        connections.settings[alias] = connections.configure_settings({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+        })['default']
+        
+        def cleanup():
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        
+        self.addCleanup(cleanup)
+        with connections[alias].schema_editor() as editor:
+            editor.create_model(Lending)
+            editor.create_model(BookAvailabilityOutbox)
+        return alias, connections[alias]
+    
+    def test_second_user_refused_before_relay(self):
+        """Avant le relais de l'outbox, un autre utilisateur ne peut pas emprunter le même livre"""
+        from django.db import router, transaction
+        from lending import operations
+        from lending.checks import BOOK_CHECK, EXISTING_CHECK, lend_conflicts
+        from lending.models import BookAvailabilityOutbox
+        alias, _ = self._memory_database()
+        
+        with patch.object(router, 'db_for_write', return_value=alias), \
+             patch.object(router, 'db_for_read', return_value=alias), \
+             patch.object(transaction, 'DEFAULT_DB_ALIAS', alias), \
+             patch.object(operations, 'record_lent'), \
+             patch.object(operations, 'book_service') as book_service, \
+             patch.object(operations, 'notification_dispatcher'):
+            first = operations.create_lending('first@example.com', 123)
+            second = operations.create_lending('second@example.com', 123)
+            created, conflicts = operations.create_lendings('second@example.com', [123, 124])
+            failures = lend_conflicts('second@example.com', [123])
+            own = lend_conflicts('first@example.com', [123])
+            outbox = list(BookAvailabilityOutbox.objects.values_list('book_id', flat=True))
+        
+        self.assertIsNotNone(first)
+        self.assertIsNone(second)
+        self.assertEqual([lending.book_id for lending in created], [124])
+        self.assertEqual(conflicts, {123})
+        self.assertEqual(failures, {123: BOOK_CHECK})
+        self.assertEqual(own, {123: EXISTING_CHECK})
+        # Une seule mise à jour d'indisponibilité par livre effectivement prêté
+        self.assertEqual(sorted(outbox), [123, 124])
+        book_service.apply_cached_availability.assert_any_call(123, False)
+    
+    def test_update_returning_gate(self):
+        """RETURNING : PostgreSQL, SQLite à partir de 3.35, jamais ailleurs"""
+        from lending.operations import supports_update_returning
+        
+        self.assertTrue(supports_update_returning(Mock(vendor='postgresql')))
+        self.assertTrue(supports_update_returning(Mock(vendor='sqlite', Database=Mock(sqlite_version_info=(3, 35, 0)))))
+        self.assertFalse(supports_update_returning(Mock(vendor='sqlite', Database=Mock(sqlite_version_info=(3, 34, 1)))))
+        self.assertFalse(supports_update_returning(Mock(vendor='mysql')))
+    
+    def test_return_update_returning(self):
+        """UPDATE … RETURNING clôture le prêt actif et le relit ; un second retour ne trouve rien"""
+        from datetime import datetime
+        from django.utils import timezone
+        from lending import operations
+        alias, connection = self._memory_database()
+        if not operations.supports_update_returning(connection):
+            self.skipTest('SQLite < 3.35 : pas de RETURNING')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO lending_lending (user_email, book_id, date_borrowed, date_due, status) '
+                "VALUES ('test@example.com', 123, '2026-01-01 00:00:00', '2026-03-01 00:00:00', 'ACTIVE')"
+            )
+        filters = {'user_email': 'test@example.com', 'book_id': 123, 'status': 'ACTIVE'}
+        now = timezone.now()
+        values = {'status': 'RETURNED', 'date_returned': now}
+        
+        returned = operations._update_returning(alias, filters, values)
+        again = operations._update_returning(alias, filters, values)
+        
+        self.assertEqual(len(returned), 1)
+        self.assertEqual(returned[0].status, 'RETURNED')
+        self.assertEqual(returned[0].book_id, 123)
+        self.assertEqual(returned[0].date_returned, now)
+        self.assertIsInstance(returned[0].date_borrowed, datetime)
+        self.assertEqual(again, [])
+    
+    def _return_lendings(self, alias, supports_returning):
+        """return_lendings sur la base en mémoire : trois livres, dont un déjà rendu ; requêtes exécutées"""
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+        from lending import operations
+        with connections[alias].cursor() as cursor:
+            cursor.execute('DELETE FROM lending_lending')
+            for book_id, status in ((1, 'ACTIVE'), (2, 'ACTIVE'), (3, 'RETURNED')):
+                cursor.execute(
+                    'INSERT INTO lending_lending (user_email, book_id, date_borrowed, date_due, status) '
+                    "VALUES ('test@example.com', %s, '2026-01-01 00:00:00', '2026-03-01 00:00:00', %s)",
+                    [book_id, status]
+                )
+        with patch.object(operations.router, 'db_for_write', return_value=alias), \
+             patch.object(operations, 'supports_update_returning', return_value=supports_returning), \
+             patch.object(operations, 'BookAvailabilityOutbox') as outbox, \
+             patch.object(operations, 'record_returned') as record_returned, \
+             patch.object(operations, 'book_service'), \
+             patch.object(operations, 'notification_dispatcher') as dispatcher, \
+             CaptureQueriesContext(connections[alias]) as queries:
+            lendings = operations.return_lendings([1, 2, 3], 'test@example.com')
+        
+        self.assertEqual(sorted(lending.book_id for lending in lendings), [1, 2])
+        self.assertTrue(all(lending.status == 'RETURNED' and lending.date_returned for lending in lendings))
+        self.assertEqual(len(outbox.objects.bulk_create.call_args.args[0]), 2)
+        record_returned.assert_called_once()
+        self.assertEqual(record_returned.call_args.args, (2,))
+        dispatcher.enqueue.assert_called_once()
+        return [query['sql'].split()[0] for query in queries.captured_queries]
+    
+    def test_batch_return_single_update_returning(self):
+        """Retour groupé : un seul UPDATE … RETURNING, sans SELECT avant ni relecture après"""
+        from lending import operations
+        alias, connection = self._memory_database()
+        if not operations.supports_update_returning(connection):
+            self.skipTest('SQLite < 3.35 : pas de RETURNING')
+        
+        statements = self._return_lendings(alias, True)
+        
+        self.assertEqual([statement for statement in statements if statement in ('SELECT', 'UPDATE')], ['UPDATE'])
+    
+    def test_batch_return_fallback(self):
+        """Sans RETURNING : lecture puis UPDATE conditionnel, même résultat"""
+        alias, _ = self._memory_database()
+        
+        statements = self._return_lendings(alias, False)
+        
+        self.assertEqual([statement for statement in statements if statement in ('SELECT', 'UPDATE')],
+                         ['SELECT', 'UPDATE'])
+    
+    def test_return_fallback_is_conditional_update(self):
+        """Sans RETURNING : UPDATE conditionnel sur la base résolue par return_lending ; un second retour ne trouve rien"""
+        from django.db import router
+        from lending import operations
+        alias, connection = self._memory_database()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO lending_lending (user_email, book_id, date_borrowed, date_due, status) '
+                "VALUES ('test@example.com', 123, '2026-01-01 00:00:00', '2026-03-01 00:00:00', 'ACTIVE')"
+            )
+        # Seul return_lending interroge le routeur : une requête qui l'ignorerait viserait une base inconnue
+        routed = iter([alias, alias])
+        
+        with patch.object(router, 'db_for_write', side_effect=lambda model, **hints: next(routed, 'unrouted')), \
+             patch.object(operations, 'supports_update_returning', return_value=False), \
+             patch.object(operations, 'BookAvailabilityOutbox') as outbox, \
+             patch.object(operations, 'record_returned') as record_returned, \
+             patch.object(operations, 'book_service'), \
+             patch.object(operations, 'notification_dispatcher'):
+            first = operations.return_lending('test@example.com', 123)
+            second = operations.return_lending('test@example.com', 123)
+        
+        self.assertEqual(first.status, 'RETURNED')
+        self.assertIsNotNone(first.date_returned)
+        self.assertIsNone(second)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT status FROM lending_lending')
+            self.assertEqual(cursor.fetchall(), [('RETURNED',)])
+        outbox.objects.create.assert_called_once_with(book_id=123, available=True)
+        record_returned.assert_called_once()
+    
+    def test_views_map_write_conflicts(self):
+        """Conflit à l'INSERT : 400 « déjà emprunté » ; aucun prêt actif au retour : 404"""
+        from rest_framework.test import APIRequestFactory
+        from lending import views
+        factory = APIRequestFactory()
+        body = {'user_email': 'test@example.com', 'book_id': 123}
+        
+        with patch.object(views, 'run_lend_checks', return_value={'failed': None}), \
+             patch.object(views, 'create_lending', return_value=None), \
+             patch.object(views, 'lend_conflicts', side_effect=[{123: 'existing'}, {123: 'book'}]), \
+             patch.object(views, 'return_lending', return_value=None):
+            lend = views.lend_book(factory.post('/api/lendBook/', body, format='json'))
+            lent_to_other = views.lend_book(factory.post('/api/lendBook/', body, format='json'))
+            returned = views.return_book(factory.post('/api/returnBook/', body, format='json'))
+        
+        self.assertEqual(lend.status_code, 400)
+        self.assertIn('déjà emprunté', lend.data['error'])
+        self.assertEqual(lent_to_other.status_code, 400)
+        self.assertIn('non disponible', lent_to_other.data['error'])
+        self.assertEqual(returned.status_code, 404)
+
+
+class TestDatabasePool(unittest.TestCase):
+    """Tests pour la télémétrie du pool de connexions PostgreSQL"""
+    
+    def _pool(self, **stats):
+        pool = Mock(min_size=1, max_size=4)
+        pool.get_stats.return_value = {'pool_min': 1, 'pool_max': 4, **stats}
+        return pool
+    
+    def test_pool_stats_only_for_pooled_databases(self):
+        """Occupation et saturation calculées à partir des statistiques psycopg_pool"""
+        from lending import dbpool
+        databases = {
+            'default': {'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {'pool': {'max_size': 4}}},
+            'replica': {'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {}},
+        }
+        pool = self._pool(pool_size=3, pool_available=1, requests_waiting=2, requests_num=40,
+                          requests_wait_ms=1500, requests_errors=1, connections_lost=1, returns_bad=1)
+        with patch.object(dbpool, 'settings', Mock(DATABASES=databases)), \
+             patch.object(dbpool, 'connections', {'default': Mock(pool=pool)}):
+            stats = dbpool.get_db_pool_stats()
+        
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]['alias'], 'default')
+        self.assertEqual((stats[0]['in_use'], stats[0]['idle'], stats[0]['waiting']), (2, 1, 2))
+        self.assertEqual(stats[0]['saturation'], 0.5)
+        self.assertEqual((stats[0]['checkouts'], stats[0]['wait_seconds'], stats[0]['timeouts']), (40, 1.5, 1))
+        self.assertEqual(stats[0]['connections_lost'], 2)
+    
+    def test_cumulative_pool_counters_published_as_increments(self):
+        """Deux publications successives n'ajoutent que la différence des compteurs du pool"""
+        from prometheus_client import REGISTRY
+        from lending import metrics
+        
+        def snapshot(checkouts, in_use):
+            return [{'alias': 'pool_test', 'in_use': in_use, 'idle': 4 - in_use, 'max_size': 4, 'waiting': 0,
+                     'checkouts': checkouts, 'wait_seconds': 0.0, 'timeouts': 0, 'connections_lost': 0}]
+        
+        with patch.object(metrics, 'get_db_pool_stats', side_effect=[snapshot(10, 1), snapshot(25, 3)]):
+            metrics.publish_db_pool_stats(force=True)
+            metrics.publish_db_pool_stats(force=True)
+        
+        self.assertEqual(REGISTRY.get_sample_value('lending_db_pool_checkouts_total', {'alias': 'pool_test'}), 25)
+        self.assertEqual(REGISTRY.get_sample_value(
+            'lending_db_pool_connections', {'alias': 'pool_test', 'state': 'in_use'}
+        ), 3)
+    
+    def test_publication_throttled(self):
+        """Hors scrape, les statistiques sont lues au plus une fois par intervalle"""
+        from lending import metrics
+        
+        with patch.object(metrics, 'get_db_pool_stats', return_value=[]) as get_stats:
+            metrics.publish_db_pool_stats(force=True)
+            metrics.publish_db_pool_stats()
+        
+        get_stats.assert_called_once()
+
+
+class KeysetRowsStub:
+    """Queryset minimal pour streaming.iter_keyset (lignes complètes de prêts, triées par id)"""
+    
+    def __init__(self, rows, after_id=0, size=None):
+        self.rows, self.after_id, self.size = rows, after_id, size
+        self.queries = []
+    
+    def values_list(self, *fields):
+        from lending.serializers import LendingRowSerializer
+        positions = [LendingRowSerializer.fields.index(name) for name in fields]
+        stub = KeysetRowsStub([tuple(row[i] for i in positions) for row in self.rows])
+        stub.queries = self.queries
+        return stub
+    
+    def filter(self, pk__gt):
+        stub = KeysetRowsStub(self.rows, pk__gt)
+        stub.queries = self.queries
+        return stub
+    
+    def order_by(self, *fields):
+        return self
+    
+    def __getitem__(self, bounds):
+        stub = KeysetRowsStub(self.rows, self.after_id, bounds.stop)
+        stub.queries = self.queries
+        return stub
+    
+    def iterator(self, chunk_size):
+        self.queries.append((self.after_id, self.size))
+        return iter([row for row in self.rows if row[0] > self.after_id][:self.size])
+
+
+class TestLendingExport(unittest.TestCase):
+    """Tests pour l'export CSV / NDJSON de l'historique des prêts"""
+    
+    def _rows(self, count):
+        from datetime import datetime, timezone as dt_timezone
+        borrowed = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+        return [(i, f'user{i}@example.com', 100 + i, borrowed, borrowed, None, 'ACTIVE') for i in range(1, count + 1)]
+    
+    def test_keyset_batches_resume_and_limit(self):
+        """Lots WHERE id > dernier id, reprise après after_id et arrêt à limit"""
+        from lending.streaming import iter_keyset
+        queryset = KeysetRowsStub(self._rows(10))
+        
+        chunks = list(iter_keyset(queryset, batch_size=4, after_id=2, limit=7, chunk_size=3))
+        
+        self.assertEqual([row[0] for chunk in chunks for row in chunk], [3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(queryset.queries, [(2, 4), (6, 3)])
+        self.assertTrue(all(len(chunk) <= 3 for chunk in chunks))
+    
+    def test_csv_export_has_header_and_id(self):
+        """CSV : en-tête puis une ligne par prêt ; l'id est exporté même hors de fields"""
+        import csv
+        import io
+        from lending.export import iter_export
+        
+        with patch('lending.export.get_export_config', return_value={'BATCH_SIZE': 2}):
+            content = b''.join(iter_export(KeysetRowsStub(self._rows(3)), 'csv', fields=('book_id', 'date_returned')))
+        
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows, [['id', 'book_id', 'date_returned'], ['1', '101', ''], ['2', '102', ''], ['3', '103', '']])
+    
+    def test_ndjson_export_matches_row_serializer(self):
+        """NDJSON : mêmes objets que les autres listes de prêts, un par ligne"""
+        import json
+        from lending.export import iter_export
+        from lending.serializers import LendingRowSerializer
+        rows = self._rows(2)
+        
+        content = b''.join(iter_export(KeysetRowsStub(rows), 'ndjson', header=False))
+        
+        self.assertEqual([json.loads(line) for line in content.splitlines()],
+                         list(LendingRowSerializer().serialize(rows)))
+    
+    def test_resume_point_drops_partial_line(self):
+        """Reprise d'un fichier : dernière ligne incomplète retirée, dernier id complet retourné"""
+        import os
+        import tempfile
+        from lending.export import last_exported_id
+        
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'lendings.csv')
+            with open(path, 'wb') as file:
+                file.write(b'id,book_id\n1,101\n2,102\n3,1')
+            self.assertEqual(last_exported_id(path, 'csv'), 2)
+            with open(path, 'rb') as file:
+                self.assertEqual(file.read(), b'id,book_id\n1,101\n2,102\n')
+            
+            path = os.path.join(directory, 'lendings.ndjson')
+            with open(path, 'wb') as file:
+                file.write(b'{"id":7}\n{"id":8}\n')
+            self.assertEqual(last_exported_id(path, 'ndjson'), 8)
+            self.assertEqual(last_exported_id(os.path.join(directory, 'absent.csv'), 'csv'), 0)
+    
+    def test_export_query_validation(self):
+        """Dates AAAA-MM-JJ acceptées, intervalle vide et format inconnu refusés"""
+        from lending.serializers import LendingExportQuerySerializer
+        
+        query = LendingExportQuerySerializer(data={'since': '2026-01-01', 'status': 'returned'})
+        self.assertTrue(query.is_valid(), query.errors)
+        self.assertEqual(query.validated_data['stream'], 'ndjson')
+        self.assertEqual(query.validated_data['status'], ['RETURNED'])
+        self.assertFalse(LendingExportQuerySerializer(data={'since': '2026-02-01', 'until': '2026-01-01'}).is_valid())
+        self.assertFalse(LendingExportQuerySerializer(data={'stream': 'json'}).is_valid())
+
+
 class TestAPIEndpoints(unittest.TestCase):
     """Tests pour les endpoints de l'API"""
     
@@ -0,0 +1,159 @@
+"""
+Décomposition du temps de traitement de chaque requête HTTP
+
+Le profil de la requête cumule, par phase, la durée et le nombre des
+requêtes SQL (db), des appels à chaque microservice (book, user,
+notification), de la construction des données de la réponse (serialize)
+et de leur rendu JSON (render). Il est renvoyé dans l'en-tête
+Server-Timing ; les requêtes plus lentes que le seuil configuré sont
+journalisées, pour une fraction d'entre elles, avec le SQL exécuté.
+
+Les vérifications concurrentes de lendBook copient le contexte dans leurs
+threads : leurs appels sont comptés dans le profil de la requête.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Configuration par défaut, surchargée par settings.REQUEST_PROFILING
+DEFAULT_PROFILING_CONFIG = {
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_THRESHOLD': 1.0,
+    'SLOW_REQUEST_SAMPLE_RATE': 0.1,
+    'MAX_LOGGED_QUERIES': 50,
+}
+
+# Libellé du nombre d'opérations de chaque phase dans Server-Timing
+_PHASE_UNITS = {'db': 'queries', 'serialize': 'passes', 'render': 'passes'}
+
+
+class RequestProfile:
+    """Durées cumulées par phase d'une requête HTTP"""
+    __slots__ = ('request', 'status', 'started', 'phases', 'sql', 'max_sql', '_lock')
+
+    def __init__(self, request, capture_sql: bool = False, max_sql: int = 50):
+        self.request = request
+        self.status = 500
+        self.started = time.perf_counter()
+        self.phases: Dict[str, list] = {}  # phase -> [durée, nombre]
+        self.sql = [] if capture_sql else None
+        self.max_sql = max_sql
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, duration: float):
+        with self._lock:
+            totals = self.phases.get(phase)
+            if totals is None:
+                self.phases[phase] = [duration, 1]
+            else:
+                totals[0] += duration
+                totals[1] += 1
+
+    def count(self, phase: str) -> int:
+        totals = self.phases.get(phase)
+        return totals[1] if totals else 0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes)"""
+        entries = [
+            f'{phase};dur={duration * 1000:.2f};desc="{count} {_PHASE_UNITS.get(phase, "calls")}"'
+            for phase, (duration, count) in list(self.phases.items())
+        ]
+        entries.append(f'total;dur={self.elapsed() * 1000:.2f}')
+        return ', '.join(entries)
+
+    def summary(self) -> Dict[str, Any]:
+        """Décomposition complète, pour le journal des requêtes lentes"""
+        return {
+            'method': self.request.method,
+            'path': self.request.path,
+            'status': self.status,
+            'duration_ms': round(self.elapsed() * 1000, 2),
+            'phases': {
+                phase: {'duration_ms': round(duration * 1000, 2), 'count': count}
+                for phase, (duration, count) in list(self.phases.items())
+            },
+            'sql': self.sql,
+        }
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar('lending_request_profile', default=None)
+
+
+def get_profiling_config() -> Dict[str, Any]:
+    return {**DEFAULT_PROFILING_CONFIG, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+@contextmanager
+def request_profile_scope(request):
+    """
+    Ouvre le profil de la requête, ou réutilise celui déjà ouvert pour elle
+
+    Les middlewares de métriques et de Server-Timing partagent ainsi un seul
+    profil, quel que soit leur ordre dans MIDDLEWARE.
+    """
+    profile = _current_profile.get()
+    if profile is not None and profile.request is request:
+        yield profile
+        return
+    config = get_profiling_config()
+    profile = RequestProfile(
+        request,
+        capture_sql=random.random() < config['SLOW_REQUEST_SAMPLE_RATE'],
+        max_sql=config['MAX_LOGGED_QUERIES'],
+    )
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def record_phase(phase: str, duration: float):
+    """Ajoute une durée à la phase de la requête en cours (sans effet hors requête)"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add(phase, duration)
+
+
+def record_query(sql: str, duration: float):
+    """Requête SQL de la requête en cours, conservée si la requête est échantillonnée"""
+    profile = _current_profile.get()
+    if profile is None:
+        return
+    profile.add('db', duration)
+    if profile.sql is not None and len(profile.sql) < profile.max_sql:
+        profile.sql.append({'sql': sql, 'duration_ms': round(duration * 1000, 3)})
+
+
+@contextmanager
+def phase(name: str):
+    """Chronomètre un bloc comme phase de la requête en cours"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+
+def log_if_slow(profile: RequestProfile, threshold: float):
+    """Journalise la décomposition d'une requête lente échantillonnée"""
+    if profile.sql is None or profile.elapsed() < threshold:
+        return
+    logger.warning(f"Requête lente : {json.dumps(profile.summary(), default=str)}")
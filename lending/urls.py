@@ -1,5 +1,9 @@
 from django.urls import path
-from .views import lend_book, return_book, get_expired_books, health_check
+from .views import (
+    lend_book, lend_books, return_book, return_books, get_expired_books, get_user_lendings, export_lendings,
+    get_stats, health_check,
+)
+from .async_views import lend_book_async, return_book_async, get_expired_books_async, export_lendings_async
 
 urlpatterns = [
     # Health check pour Kubernetes
@@ -7,6 +11,17 @@ urlpatterns = [
     
     # Endpoints principaux de l'API
     path('lendBook/', lend_book, name='lend_book'),
+    path('lendBooks/', lend_books, name='lend_books'),
     path('returnBook/', return_book, name='return_book'),
+    path('returnBooks/', return_books, name='return_books'),
     path('getExpiredBooks/', get_expired_books, name='get_expired_books'),
+    path('lendings/', get_user_lendings, name='user_lendings'),
+    path('lendings/export/', export_lendings, name='export_lendings'),
+    path('stats/', get_stats, name='stats'),
+    
+    # Mêmes endpoints en version asynchrone (à servir via projet.asgi)
+    path('async/lendBook/', lend_book_async, name='lend_book_async'),
+    path('async/returnBook/', return_book_async, name='return_book_async'),
+    path('async/getExpiredBooks/', get_expired_books_async, name='get_expired_books_async'),
+    path('async/lendings/export/', export_lendings_async, name='export_lendings_async'),
 ]
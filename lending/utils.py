@@ -1,11 +1,20 @@
 """
 Utilitaires pour le service Lending Management
 """
+import asyncio
+import hashlib
 import logging
 from functools import wraps
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework import status
 from rest_framework.response import Response
 
+from .renderers import ORJSONRenderer
+from .stats import get_lending_version
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,10 +33,27 @@ def get_book_title(book_service, book_id):
     return book_details.get('title', f'Livre ID {book_id}') if book_details else f'Livre ID {book_id}'
 
 
+def json_response(data, status_code=status.HTTP_200_OK):
+    """
+    Réponse JSON rendue comme une Response DRF, pour les vues Django hors APIView
+    
+    Args:
+        data: Données à sérialiser
+        status_code: Code HTTP de la réponse
+    
+    Returns:
+        HttpResponse: Corps identique à celui produit par JSONRenderer
+    """
+    return HttpResponse(ORJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
 def handle_api_errors(operation_name):
     """
     Décorateur pour gérer les erreurs d'API de manière standardisée
     
+    Fonctionne aussi sur les vues asynchrones, dont l'erreur est rendue
+    avec json_response.
+    
     Args:
         operation_name: Nom de l'opération pour les logs
     
@@ -35,6 +61,19 @@ def handle_api_errors(operation_name):
         Décorateur fonction
     """
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(request, *args, **kwargs):
+                try:
+                    return await func(request, *args, **kwargs)
+                except Exception as e:
+                    logger.error(f"Erreur lors de {operation_name}: {str(e)}")
+                    return json_response(
+                        {'error': 'Erreur interne du serveur'}, 
+                        status.HTTP_500_INTERNAL_SERVER_ERROR
+                    )
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(request, *args, **kwargs):
             try:
@@ -49,6 +88,65 @@ def handle_api_errors(operation_name):
     return decorator
 
 
+def lending_etag(request):
+    """
+    ETag d'une lecture de prêts : version de la table Lending et requête
+
+    La date du jour en fait partie pour les fenêtres relatives à aujourd'hui
+    (volumes quotidiens de /stats) ; Accept distingue les représentations.
+
+    Args:
+        request: Requête HTTP
+    
+    Returns:
+        str: ETag fort, entre guillemets
+    """
+    version = get_lending_version()
+    material = '|'.join((
+        request.get_full_path(), request.META.get('HTTP_ACCEPT', ''), timezone.localdate().isoformat(),
+    ))
+    return f'"{version}-{hashlib.blake2b(material.encode(), digest_size=8).hexdigest()}"'
+
+
+def conditional_on_lendings(func):
+    """
+    Décorateur de GET conditionnel (If-None-Match) pour les lectures de prêts
+    
+    La version est lue avant la requête principale : une modification validée
+    entre les deux donne au pire un ETag plus ancien que le contenu, donc une
+    réponse complète au passage suivant, jamais un 304 injustifié. Sur un
+    ETag correspondant, la vue n'est pas exécutée (ni requête, ni
+    sérialisation).
+    
+    Fonctionne aussi sur les vues asynchrones.
+    """
+    def finish(response, etag):
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response.headers.setdefault('ETag', etag)
+            # Le client peut garder la réponse mais doit la revalider à chaque lecture
+            patch_cache_control(response, no_cache=True)
+        return response
+    
+    if asyncio.iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(request, *args, **kwargs):
+            etag = await sync_to_async(lending_etag)(request)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await func(request, *args, **kwargs)
+            return finish(response, etag)
+        return async_wrapper
+    
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        etag = lending_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = func(request, *args, **kwargs)
+        return finish(response, etag)
+    return wrapper
+
+
 class NotificationHelper:
     """
     Classe utilitaire pour gérer les notifications
@@ -65,16 +163,20 @@ class NotificationHelper:
             user_email: Email de l'utilisateur
             book_id: ID du livre
             date_due: Date d'échéance
+        
+        Returns:
+            bool: True si la notification a été envoyée
         """
         try:
             book_title = get_book_title(book_service, book_id)
-            notification_service.send_lending_confirmation(
+            return notification_service.send_lending_confirmation(
                 user_email, 
                 book_title, 
                 date_due.strftime('%Y-%m-%d')
             )
         except Exception as e:
             logger.warning(f"Impossible d'envoyer la notification d'emprunt: {str(e)}")
+            return False
     
     @staticmethod
     def send_return_notification(notification_service, book_service, user_email, book_id):
@@ -86,12 +188,37 @@ class NotificationHelper:
             book_service: Service de gestion des livres  
             user_email: Email de l'utilisateur
             book_id: ID du livre
+        
+        Returns:
+            bool: True si la notification a été envoyée
         """
         try:
             book_title = get_book_title(book_service, book_id)
-            notification_service.send_return_confirmation(user_email, book_title)
+            return notification_service.send_return_confirmation(user_email, book_title)
         except Exception as e:
             logger.warning(f"Impossible d'envoyer la notification de retour: {str(e)}")
+            return False
+    
+    @staticmethod
+    def send_grouped_return_notification(notification_service, book_service, user_email, book_ids):
+        """
+        Envoie une seule notification de retour pour plusieurs livres d'un utilisateur
+        
+        Args:
+            notification_service: Service de notification
+            book_service: Service de gestion des livres
+            user_email: Email de l'utilisateur
+            book_ids: IDs des livres retournés
+        
+        Returns:
+            bool: True si la notification a été envoyée
+        """
+        try:
+            book_titles = ', '.join(get_book_title(book_service, book_id) for book_id in book_ids)
+            return notification_service.send_return_confirmation(user_email, book_titles)
+        except Exception as e:
+            logger.warning(f"Impossible d'envoyer la notification de retour groupée: {str(e)}")
+            return False
 
 
 def update_book_availability_safe(book_service, book_id, availability):
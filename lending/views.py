@@ -2,16 +2,40 @@ from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.utils import timezone
-from django.db import transaction
 import logging
 
 from .models import Lending
-from .serializers import LendingSerializer, LendBookSerializer, ReturnBookSerializer
-from .services import book_service, user_service, notification_service
-from .utils import get_book_title, handle_api_errors, NotificationHelper, update_book_availability_safe
+from .serializers import (
+    LendingSerializer, LendingRowSerializer, LendBookSerializer, ReturnBookSerializer, LendBooksSerializer,
+    ReturnBooksSerializer, StatsQuerySerializer, UserLendingsQuerySerializer, LendingExportQuerySerializer,
+)
+from .services import user_service, get_http_pool_stats, get_cache_stats
+from .checks import (
+    run_lend_checks, check_books_availability, get_check_stats, LEND_CHECK_ERRORS,
+    USER_CHECK, BOOK_CHECK, EXISTING_CHECK, TIMEOUT, lend_conflicts,
+)
+from .dbpool import get_db_pool_stats
+from .export import export_queryset, export_response, iter_export
+from .idempotency import idempotent
+from .notifications import notification_dispatcher
+from .operations import create_lending, create_lendings, return_lending, return_lendings
+from .pagination import KeysetPagination, InvalidCursor
+from .resilience import get_resilience_stats
+from .stats import get_lending_stats
+from .streaming import stream_queryset, STREAM_FORMATS
+from .sweeper import get_sweeper_stats
+from .timing import phase
+from .utils import conditional_on_lendings, handle_api_errors
 
 logger = logging.getLogger(__name__)
 
+# Ordre stable (date_due puis id) requis par la pagination keyset
+EXPIRED_BOOKS_ORDERING = ('date_due', 'id')
+
+# Prêts d'un utilisateur : ordre de l'index (user_email, id)
+USER_LENDINGS_ORDERING = ('id',)
+
+@idempotent
 @api_view(['POST'])
 @handle_api_errors("la création du prêt")
 def lend_book(request):
@@ -24,54 +48,95 @@ def lend_book(request):
     user_email = serializer.validated_data['user_email']
     book_id = serializer.validated_data['book_id']
     
-    # Vérifier si l'utilisateur existe et est actif
-    if not user_service.verify_user(user_email):
-        return Response(
-            {'error': 'Utilisateur non trouvé ou inactif'}, 
-            status=status.HTTP_404_NOT_FOUND
-        )
+    # Vérifier l'utilisateur et la disponibilité du livre
+    checks = run_lend_checks(user_email, book_id)
     
-    # Vérifier si le livre existe et est disponible
-    if not book_service.check_book_availability(book_id):
-        return Response(
-            {'error': 'Livre non disponible pour l\'emprunt'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    if checks['failed']:
+        message, status_code = LEND_CHECK_ERRORS[checks['failed']]
+        return Response({'error': message}, status=status_code)
+    
+    # Créer le prêt, marquer le livre comme indisponible et notifier l'utilisateur ;
+    # un prêt en cours du livre est détecté par les contraintes d'unicité
+    lending = create_lending(user_email, book_id)
+    if lending is None:
+        message, status_code = LEND_CHECK_ERRORS[lend_conflicts(user_email, [book_id])[book_id]]
+        return Response({'error': message}, status=status_code)
+    
+    # Retourner les détails du prêt
+    with phase('serialize'):
+        data = LendingSerializer(lending).data
+    return Response(data, status=status.HTTP_201_CREATED)
+
+@idempotent
+@api_view(['POST'])
+@handle_api_errors("la création des prêts groupés")
+def lend_books(request):
+    """Endpoint pour emprunter plusieurs livres pour un même utilisateur - /lendBooks"""
+    serializer = LendBooksSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    user_email = serializer.validated_data['user_email']
+    book_ids = list(dict.fromkeys(serializer.validated_data['book_ids']))
+    
+    # Vérifier l'utilisateur une seule fois pour tout le lot
+    if not user_service.verify_user(user_email):
+        message, status_code = LEND_CHECK_ERRORS[USER_CHECK]
+        return Response({'error': message}, status=status_code)
     
-    # Vérifier si l'utilisateur n'a pas déjà emprunté ce livre
-    existing_lending = Lending.objects.filter(
-        user_email=user_email, 
-        book_id=book_id, 
+    # Prêts déjà actifs pour ces livres, en une seule requête
+    already_lent = set(Lending.objects.filter(
+        user_email=user_email,
+        book_id__in=book_ids,
         status='ACTIVE'
-    ).exists()
+    ).values_list('book_id', flat=True))
     
-    if existing_lending:
-        return Response(
-            {'error': 'Ce livre est déjà emprunté par cet utilisateur'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    candidates = [book_id for book_id in book_ids if book_id not in already_lent]
+    availability = check_books_availability(candidates)
     
-    # Transaction pour créer le prêt et marquer le livre comme indisponible
-    with transaction.atomic():
-        # Créer le prêt
-        lending = Lending.objects.create(
-            user_email=user_email,
-            book_id=book_id,
-            status='ACTIVE'
-        )
-        
-        # Marquer le livre comme indisponible
-        update_book_availability_safe(book_service, book_id, False)
+    # Créer tous les prêts possibles en une transaction
+    to_create = [book_id for book_id in candidates if availability[book_id]]
+    created, conflicts = create_lendings(user_email, to_create) if to_create else ([], set())
+    created_by_book = {lending.book_id: lending for lending in created}
+    conflicts = lend_conflicts(user_email, conflicts) if conflicts else {}
     
-    # Envoyer notification
-    NotificationHelper.send_lending_notification(
-        notification_service, book_service, user_email, book_id, lending.date_due
-    )
+    results = []
+    for book_id in book_ids:
+        if book_id in created_by_book:
+            results.append({
+                'book_id': book_id,
+                'status': 'created',
+                'lending': LendingSerializer(created_by_book[book_id]).data
+            })
+            continue
+        if book_id in already_lent:
+            failure = EXISTING_CHECK
+        elif book_id in conflicts:
+            failure = conflicts[book_id]
+        elif availability.get(book_id) is None:
+            failure = TIMEOUT
+        else:
+            failure = BOOK_CHECK
+        message, status_code = LEND_CHECK_ERRORS[failure]
+        results.append({'book_id': book_id, 'status': 'failed', 'error': message, 'code': status_code})
     
-    # Retourner les détails du prêt
-    response_serializer = LendingSerializer(lending)
-    return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+    # 201 si tout est créé, 207 en cas d'échec partiel, 400 si rien n'a pu être créé
+    if len(created) == len(book_ids):
+        response_status = status.HTTP_201_CREATED
+    elif created:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    
+    return Response({
+        'user_email': user_email,
+        'created': len(created),
+        'failed': len(book_ids) - len(created),
+        'results': results
+    }, status=response_status)
 
+@idempotent
 @api_view(['POST'])
 @handle_api_errors("le retour du livre")
 def return_book(request):
@@ -84,12 +149,8 @@ def return_book(request):
     user_email = serializer.validated_data['user_email']
     book_id = serializer.validated_data['book_id']
     
-    # Trouver le prêt actif
-    lending = Lending.objects.filter(
-        user_email=user_email,
-        book_id=book_id,
-        status='ACTIVE'
-    ).first()
+    # Clôturer le prêt actif, marquer le livre comme disponible et notifier l'utilisateur
+    lending = return_lending(user_email, book_id)
     
     if not lending:
         return Response(
@@ -97,46 +158,168 @@ def return_book(request):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    # Transaction pour marquer le prêt comme retourné et le livre comme disponible
-    with transaction.atomic():
-        # Marquer le prêt comme retourné
-        lending.status = 'RETURNED'
-        lending.date_returned = timezone.now()
-        lending.save()
-        
-        # Marquer le livre comme disponible
-        update_book_availability_safe(book_service, book_id, True)
+    # Retourner les détails du retour
+    with phase('serialize'):
+        data = LendingSerializer(lending).data
+    return Response(data, status=status.HTTP_200_OK)
+
+@idempotent
+@api_view(['POST'])
+@handle_api_errors("le retour groupé des livres")
+def return_books(request):
+    """Endpoint pour retourner plusieurs livres en une fois (boîte de retour) - /returnBooks"""
+    serializer = ReturnBooksSerializer(data=request.data)
     
-    # Envoyer notification de retour
-    NotificationHelper.send_return_notification(
-        notification_service, book_service, user_email, book_id
-    )
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
-    # Retourner les détails du retour
-    response_serializer = LendingSerializer(lending)
-    return Response(response_serializer.data, status=status.HTTP_200_OK)
+    book_ids = list(dict.fromkeys(serializer.validated_data['book_ids']))
+    
+    # Clôturer tous les prêts actifs en une seule requête UPDATE
+    lendings = return_lendings(book_ids, serializer.validated_data.get('user_email'))
+    returned_books = {lending.book_id for lending in lendings}
+    not_found = [book_id for book_id in book_ids if book_id not in returned_books]
+    
+    # 200 si tout est retourné, 207 en cas d'échec partiel, 404 si aucun prêt actif trouvé
+    if len(returned_books) == len(book_ids):
+        response_status = status.HTTP_200_OK
+    elif returned_books:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_404_NOT_FOUND
+    
+    return Response({
+        'returned': len(lendings),
+        'not_found': not_found,
+        'lendings': LendingSerializer(lendings, many=True).data
+    }, status=response_status)
 
 @api_view(['GET'])
 @handle_api_errors("la récupération des livres expirés")
+@conditional_on_lendings
 def get_expired_books(request):
-    """Endpoint pour récupérer les livres expirés - /getExpiredBooks"""
-    now = timezone.now()
+    """
+    Endpoint pour récupérer les livres expirés - /getExpiredBooks
+
+    Renvoie un tableau de prêts, paginé par curseur : la page suivante est
+    dans l'en-tête Link (rel="next"). Avec ?page_size=, la réponse est
+    l'enveloppe {next, results} des autres listes. ?stream=ndjson|json
+    renvoie la liste complète en streaming.
+    """
+    # Lecture seule : le passage en OVERDUE est fait par la commande sweep_overdue_lendings
     expired_lendings = Lending.objects.filter(
-        date_due__lt=now,
-        status='ACTIVE'  # Seulement les prêts actifs
-    ).order_by('date_due')
+        date_due__lt=timezone.now(),
+        status='OVERDUE'
+    ).values_list(*LendingRowSerializer.fields)
+    serializer = LendingRowSerializer()
     
-    # Marquer automatiquement comme en retard
-    expired_lendings.update(status='OVERDUE')
+    stream_format = request.query_params.get('stream')
+    if stream_format:
+        if stream_format not in STREAM_FORMATS:
+            return Response({'error': 'Format de streaming invalide'}, status=status.HTTP_400_BAD_REQUEST)
+        return stream_queryset(
+            expired_lendings.order_by(*EXPIRED_BOOKS_ORDERING),
+            serializer.to_representation,
+            stream_format
+        )
     
-    # Récupérer les objets mis à jour
-    expired_lendings = Lending.objects.filter(
-        date_due__lt=now,
-        status='OVERDUE'
-    ).order_by('date_due')
+    try:
+        paginator = KeysetPagination(EXPIRED_BOOKS_ORDERING, request.query_params)
+        lendings = list(paginator.paginate_queryset(expired_lendings))
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    with phase('serialize'):
+        rows = serializer.serialize(lendings)
+    page, next_cursor = paginator.get_page(rows)
+    if paginator.page_size_requested:
+        return Response(paginator.get_paginated_data(request, page, next_cursor), status=status.HTTP_200_OK)
+    # Contrat historique : un tableau JSON, la suite dans l'en-tête Link
+    link = paginator.get_link_header(request, next_cursor)
+    return Response(page, status=status.HTTP_200_OK, headers={'Link': link} if link else None)
+
+@api_view(['GET'])
+@handle_api_errors("la récupération des prêts de l'utilisateur")
+@conditional_on_lendings
+def get_user_lendings(request):
+    """
+    Endpoint pour lister les prêts d'un utilisateur - /lendings?user_email=...&status=...
+
+    Servi par l'index (user_email, id) et paginé par curseur (?cursor=,
+    ?page_size=). ?fields=id,book_id,date_due ne lit et ne renvoie que ces
+    champs ; sans ?count=true, aucun décompte n'est exécuté.
+    """
+    query = UserLendingsQuerySerializer(data=request.query_params)
     
-    serializer = LendingSerializer(expired_lendings, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    params = query.validated_data
+    lendings = Lending.objects.filter(user_email=params['user_email'])
+    statuses = params.get('status')
+    if statuses and len(statuses) == 1:
+        # Égalité plutôt que IN : l'index partiel des prêts ACTIVE reste utilisable
+        lendings = lendings.filter(status=statuses[0])
+    elif statuses:
+        lendings = lendings.filter(status__in=statuses)
+    
+    # Les colonnes de tri sont lues même hors de ?fields=, pour le curseur
+    serializer = LendingRowSerializer(params.get('fields'))
+    columns = serializer.fields + tuple(name for name in USER_LENDINGS_ORDERING if name not in serializer.fields)
+    
+    try:
+        paginator = KeysetPagination(USER_LENDINGS_ORDERING, request.query_params)
+        rows = list(paginator.paginate_queryset(lendings.values_list(*columns, named=True)))
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    page, next_cursor = paginator.get_page(rows)
+    with phase('serialize'):
+        results = serializer.serialize(page)
+    data = paginator.get_paginated_data(request, results, next_cursor)
+    if params['count']:
+        data['count'], data['count_exact'] = paginator.bounded_count(lendings)
+    return Response(data, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@handle_api_errors("l'export des prêts")
+def export_lendings(request):
+    """
+    Endpoint d'export de l'historique des prêts - /lendings/export?stream=csv|ndjson
+
+    Filtré par date d'emprunt (?since= inclus, ?until= exclu) et par statut
+    (?status=), dans l'ordre des id. Un export interrompu reprend avec
+    ?after_id= (dernier id reçu) ; ?limit= borne le nombre de prêts envoyés.
+    """
+    query = LendingExportQuerySerializer(data=request.query_params)
+    
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    params = query.validated_data
+    lendings = export_queryset(params.get('since'), params.get('until'), params.get('status'))
+    return export_response(
+        iter_export(lendings, params['stream'], params.get('fields'), params['after_id'], params.get('limit')),
+        params['stream']
+    )
+
+@api_view(['GET'])
+@handle_api_errors("la récupération des statistiques")
+@conditional_on_lendings
+def get_stats(request):
+    """
+    Endpoint des statistiques des prêts - /stats
+
+    Prêts par statut, livres les plus empruntés (?top=) et volumes des
+    derniers jours (?days=), lus dans les tables de statistiques tenues à jour
+    à chaque prêt, retour et passage en OVERDUE.
+    """
+    query = StatsQuerySerializer(data=request.query_params)
+    
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(get_lending_stats(**query.validated_data), status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 def health_check(request):
@@ -151,7 +334,14 @@ def health_check(request):
         return Response({
             'status': 'healthy',
             'service': 'lending-management',
-            'timestamp': timezone.now().isoformat()
+            'timestamp': timezone.now().isoformat(),
+            'http_pools': get_http_pool_stats(),
+            'db_pools': get_db_pool_stats(),
+            'caches': get_cache_stats(),
+            'notifications': notification_dispatcher.stats(),
+            'lend_checks': get_check_stats(),
+            'overdue_sweeper': get_sweeper_stats(),
+            'circuit_breakers': get_resilience_stats()
         }, status=status.HTTP_200_OK)
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
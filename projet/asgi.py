@@ -0,0 +1,25 @@
+"""
+ASGI config for projet project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'projet.settings')
+
+django_application = get_asgi_application()
+
+from lending.async_services import register_persistent_loop  # noqa: E402  (applications chargées)
+
+
+async def application(scope, receive, send):
+    # La boucle du serveur ASGI vit autant que le worker : les clients HTTP
+    # asynchrones des microservices y gardent leurs connexions keep-alive
+    register_persistent_loop()
+    await django_application(scope, receive, send)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -51,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'lending.middleware.PrometheusMetricsMiddleware',
+    'lending.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'lending.middleware.RequestCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'projet.urls'
@@ -79,6 +83,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'projet.wsgi.application'
+ASGI_APPLICATION = 'projet.asgi.application'
 
 
 # Database configuration with environment variables support
@@ -86,6 +91,16 @@ WSGI_APPLICATION = 'projet.wsgi.application'
 
 DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'django.db.backends.sqlite3')
 
+# Connexions PostgreSQL (voir lending/dbpool.py) :
+# - 'pool' : pool psycopg borné par processus (DATABASE_POOL_MIN_SIZE à DATABASE_POOL_MAX_SIZE)
+# - 'persistent' : une connexion par thread, réutilisée DATABASE_CONN_MAX_AGE secondes
+# - 'none' : une connexion par requête
+DATABASE_CONNECTIONS = os.environ.get('DATABASE_CONNECTIONS', 'persistent').lower()
+
+# Derrière pgbouncer en mode transaction : pas de curseurs côté serveur, qui ne survivent
+# pas à la transaction (les requêtes préparées sont déjà désactivées par Django)
+DATABASE_PGBOUNCER = os.environ.get('DATABASE_PGBOUNCER', 'False').lower() in ['true', '1', 'on']
+
 if DATABASE_ENGINE == 'django.db.backends.postgresql':
     DATABASES = {
         'default': {
@@ -95,11 +110,27 @@ if DATABASE_ENGINE == 'django.db.backends.postgresql':
             'PASSWORD': os.environ.get('DATABASE_PASSWORD', 'lending_password'),
             'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
             'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            # Connexion vérifiée avant réutilisation (début de requête, ou sortie du pool)
+            'CONN_HEALTH_CHECKS': True,
+            'CONN_MAX_AGE': 0,
+            'DISABLE_SERVER_SIDE_CURSORS': DATABASE_PGBOUNCER,
             'OPTIONS': {
                 'connect_timeout': 20,
             },
         }
     }
+    if DATABASE_CONNECTIONS == 'pool':
+        # Incompatible avec CONN_MAX_AGE : le pool garde lui-même les connexions ouvertes
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'name': 'lending',
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1')),
+            'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', '4')),
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', '10')),  # attente d'une connexion libre
+            'max_idle': float(os.environ.get('DATABASE_POOL_MAX_IDLE', '600')),
+            'max_lifetime': float(os.environ.get('DATABASE_POOL_MAX_LIFETIME', '1800')),
+        }
+    elif DATABASE_CONNECTIONS == 'persistent':
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DATABASE_CONN_MAX_AGE', '60'))
 else:
     # SQLite par défaut pour le développement
     DATABASES = {
@@ -154,7 +185,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        # Même sortie que rest_framework.renderers.JSONRenderer, encodée par orjson
+        'lending.renderers.ORJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -166,6 +198,142 @@ BOOK_MANAGEMENT_URL = os.environ.get('BOOK_MANAGEMENT_URL', 'http://localhost:80
 USER_MANAGEMENT_URL = os.environ.get('USER_MANAGEMENT_URL', 'http://localhost:8002')
 NOTIFICATION_SERVICE_URL = os.environ.get('NOTIFICATION_SERVICE_URL', 'http://localhost:8003')
 
+# Pools de connexions HTTP keep-alive vers les microservices (un pool par service)
+def http_pool_config(prefix):
+    """Lit la configuration du pool HTTP d'un microservice depuis l'environnement"""
+    return {
+        'POOL_CONNECTIONS': int(os.environ.get(f'{prefix}_HTTP_POOL_CONNECTIONS', '2')),
+        'POOL_MAXSIZE': int(os.environ.get(f'{prefix}_HTTP_POOL_MAXSIZE', '10')),
+        'POOL_BLOCK': os.environ.get(f'{prefix}_HTTP_POOL_BLOCK', 'False').lower() in ['true', '1', 'on'],
+        'KEEP_ALIVE': os.environ.get(f'{prefix}_HTTP_KEEP_ALIVE', 'True').lower() in ['true', '1', 'on'],
+    }
+
+MICROSERVICE_HTTP_POOLS = {
+    'book': http_pool_config('BOOK_MANAGEMENT'),
+    'user': http_pool_config('USER_MANAGEMENT'),
+    'notification': http_pool_config('NOTIFICATION_SERVICE'),
+}
+
+def resilience_config(prefix):
+    """Lit les délais, tentatives et seuils du disjoncteur d'un microservice depuis l'environnement"""
+    return {
+        'CONNECT_TIMEOUT': float(os.environ.get(f'{prefix}_CONNECT_TIMEOUT', '2')),
+        'TIMEOUT': float(os.environ.get(f'{prefix}_TIMEOUT', '5')),
+        'MAX_RETRIES': int(os.environ.get(f'{prefix}_MAX_RETRIES', '2')),
+        'RETRY_BACKOFF': float(os.environ.get(f'{prefix}_RETRY_BACKOFF', '0.1')),
+        'RETRY_MAX_BACKOFF': float(os.environ.get(f'{prefix}_RETRY_MAX_BACKOFF', '1.0')),
+        # Tentatives supplémentaires : RATIO × requêtes des 10 dernières secondes + MIN_PER_SECOND
+        'RETRY_BUDGET_RATIO': float(os.environ.get(f'{prefix}_RETRY_BUDGET_RATIO', '0.2')),
+        'RETRY_BUDGET_MIN_PER_SECOND': float(os.environ.get(f'{prefix}_RETRY_BUDGET_MIN_PER_SECOND', '1')),
+        # Le disjoncteur s'ouvre si, sur WINDOW secondes et au moins MIN_CALLS appels,
+        # le taux d'échecs ou d'appels plus lents que SLOW_CALL_THRESHOLD dépasse son seuil
+        'BREAKER_WINDOW': float(os.environ.get(f'{prefix}_BREAKER_WINDOW', '30')),
+        'BREAKER_MIN_CALLS': int(os.environ.get(f'{prefix}_BREAKER_MIN_CALLS', '10')),
+        'BREAKER_FAILURE_RATE': float(os.environ.get(f'{prefix}_BREAKER_FAILURE_RATE', '0.5')),
+        'BREAKER_SLOW_CALL_THRESHOLD': float(os.environ.get(f'{prefix}_BREAKER_SLOW_CALL_THRESHOLD', '2')),
+        'BREAKER_SLOW_CALL_RATE': float(os.environ.get(f'{prefix}_BREAKER_SLOW_CALL_RATE', '0.8')),
+        'BREAKER_OPEN_SECONDS': float(os.environ.get(f'{prefix}_BREAKER_OPEN_SECONDS', '15')),
+        'BREAKER_HALF_OPEN_CALLS': int(os.environ.get(f'{prefix}_BREAKER_HALF_OPEN_CALLS', '3')),
+    }
+
+MICROSERVICE_RESILIENCE = {
+    'book': resilience_config('BOOK_MANAGEMENT'),
+    'user': resilience_config('USER_MANAGEMENT'),
+    'notification': resilience_config('NOTIFICATION_SERVICE'),
+}
+
+# Cache des détails de livres (par processus, TTL en secondes, 0 pour désactiver)
+# Titres des notifications uniquement : la disponibilité est toujours demandée au service
+BOOK_DETAILS_CACHE = {
+    'MAX_SIZE': int(os.environ.get('BOOK_DETAILS_CACHE_MAX_SIZE', '1024')),
+    'TTL': float(os.environ.get('BOOK_DETAILS_CACHE_TTL', '30')),
+}
+
+# Cache de vérification des utilisateurs (TTL en secondes)
+# STALE_TTL : durée pendant laquelle un résultat positif expiré est encore servi
+# pendant son rafraîchissement ; FAIL_OPEN : accepter l'utilisateur si le service est indisponible
+USER_VERIFICATION_CACHE = {
+    'MAX_SIZE': int(os.environ.get('USER_VERIFICATION_CACHE_MAX_SIZE', '4096')),
+    'POSITIVE_TTL': float(os.environ.get('USER_VERIFICATION_POSITIVE_TTL', '300')),
+    'NEGATIVE_TTL': float(os.environ.get('USER_VERIFICATION_NEGATIVE_TTL', '30')),
+    'STALE_TTL': float(os.environ.get('USER_VERIFICATION_STALE_TTL', '600')),
+    'FAIL_OPEN': os.environ.get('USER_VERIFICATION_FAIL_OPEN', 'False').lower() in ['true', '1', 'on'],
+    'REFRESH_WORKERS': int(os.environ.get('USER_VERIFICATION_REFRESH_WORKERS', '2')),
+}
+
+# Envoi des notifications en arrière-plan (ASYNC=False pour un envoi synchrone dans la vue)
+NOTIFICATION_DISPATCH = {
+    'ASYNC': os.environ.get('NOTIFICATION_ASYNC', 'True').lower() in ['true', '1', 'on'],
+    'QUEUE_MAX_SIZE': int(os.environ.get('NOTIFICATION_QUEUE_MAX_SIZE', '1000')),
+    'BATCH_SIZE': int(os.environ.get('NOTIFICATION_BATCH_SIZE', '20')),
+    'BATCH_WAIT': float(os.environ.get('NOTIFICATION_BATCH_WAIT', '0.05')),
+    'MAX_RETRIES': int(os.environ.get('NOTIFICATION_MAX_RETRIES', '3')),
+    'RETRY_BACKOFF': float(os.environ.get('NOTIFICATION_RETRY_BACKOFF', '1.0')),
+}
+
+# Relais de l'outbox des mises à jour de disponibilité (commande relay_book_availability)
+BOOK_AVAILABILITY_OUTBOX = {
+    'BATCH_SIZE': int(os.environ.get('OUTBOX_BATCH_SIZE', '100')),
+    'POLL_INTERVAL': float(os.environ.get('OUTBOX_POLL_INTERVAL', '1.0')),
+    'LEASE_SECONDS': float(os.environ.get('OUTBOX_LEASE_SECONDS', '60')),
+    'RETRY_BACKOFF': float(os.environ.get('OUTBOX_RETRY_BACKOFF', '1.0')),
+    'MAX_BACKOFF': float(os.environ.get('OUTBOX_MAX_BACKOFF', '300')),
+    'RETENTION_DAYS': int(os.environ.get('OUTBOX_RETENTION_DAYS', '7')),
+}
+
+# Vérifications de lendBook : 'sequential' ou 'concurrent' (délai commun en secondes)
+LEND_CHECKS = {
+    'MODE': os.environ.get('LEND_CHECKS_MODE', 'concurrent'),
+    'DEADLINE': float(os.environ.get('LEND_CHECKS_DEADLINE', '5.0')),
+    'MAX_WORKERS': int(os.environ.get('LEND_CHECKS_MAX_WORKERS', '8')),
+}
+
+# Nombre maximal de livres par requête sur les endpoints groupés
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '500'))
+
+# Passage des prêts échus en OVERDUE (commande sweep_overdue_lendings)
+OVERDUE_SWEEPER = {
+    'BATCH_SIZE': int(os.environ.get('OVERDUE_SWEEP_BATCH_SIZE', '1000')),
+    'INTERVAL': float(os.environ.get('OVERDUE_SWEEP_INTERVAL', '60')),
+}
+
+# Pagination keyset (curseur) et streaming des listes de prêts
+KEYSET_PAGINATION = {
+    'MAX_PAGE_SIZE': int(os.environ.get('PAGINATION_MAX_PAGE_SIZE', '1000')),
+    'STREAM_CHUNK_SIZE': int(os.environ.get('PAGINATION_STREAM_CHUNK_SIZE', '2000')),
+    # Décompte demandé par ?count=true : COUNT borné, jamais sur toute la liste
+    'MAX_COUNT': int(os.environ.get('PAGINATION_MAX_COUNT', '10000')),
+}
+
+# Requêtes POST idempotentes (en-tête Idempotency-Key)
+IDEMPOTENCY = {
+    'TTL': int(os.environ.get('IDEMPOTENCY_TTL', str(24 * 3600))),  # conservation des réponses (secondes)
+    'LOCK_TIMEOUT': float(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', '30')),  # reprise d'une clé abandonnée
+    'WAIT_TIMEOUT': float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', '10')),  # attente d'un doublon concurrent
+}
+
+# Statistiques des prêts tenues à jour à chaque changement (/api/stats/)
+LENDING_STATS = {
+    # Lignes par compteur : plus il y en a, moins les prêts concurrents attendent le même verrou
+    'SHARDS': int(os.environ.get('LENDING_STATS_SHARDS', '8')),
+    'TOP_BOOKS': int(os.environ.get('LENDING_STATS_TOP_BOOKS', '10')),
+    'DAILY_DAYS': int(os.environ.get('LENDING_STATS_DAILY_DAYS', '30')),
+}
+
+# Export de l'historique des prêts (/api/lendings/export/, commande export_lendings)
+LENDING_EXPORT = {
+    # Prêts lus par requête (WHERE id > … ORDER BY id LIMIT …), par paquets de STREAM_CHUNK_SIZE
+    'BATCH_SIZE': int(os.environ.get('LENDING_EXPORT_BATCH_SIZE', '50000')),
+}
+
+# Décomposition du temps des requêtes (en-tête Server-Timing) et journal des requêtes lentes
+REQUEST_PROFILING = {
+    'SERVER_TIMING': os.environ.get('SERVER_TIMING', 'True').lower() in ['true', '1', 'on'],
+    'SLOW_REQUEST_THRESHOLD': float(os.environ.get('SLOW_REQUEST_THRESHOLD', '1.0')),
+    'SLOW_REQUEST_SAMPLE_RATE': float(os.environ.get('SLOW_REQUEST_SAMPLE_RATE', '0.1')),
+    'MAX_LOGGED_QUERIES': int(os.environ.get('SLOW_REQUEST_MAX_QUERIES', '50')),
+}
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -211,6 +379,12 @@ LOGGING = {
     },
 }
 
+# Tests (manage.py test ou pytest) : journaux sur la console uniquement,
+# le fichier logs/lending-service.log n'est écrit que par le service
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    LOGGING['loggers']['lending']['handlers'] = ['console']
+
 # Sécurité pour la production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -3,6 +3,10 @@ URL configuration for projet project.
 """
 from django.urls import path, include
 
+from lending.metrics import metrics_view
+
 urlpatterns = [
     path('api/', include('lending.urls')),
+    # Scrapé par Prometheus (annotation prometheus.io/path du déploiement)
+    path('metrics', metrics_view, name='metrics'),
 ]